@@ -0,0 +1,208 @@
+"""Build and solve benchmarks over horizon length, time resolution, tariff and storage configuration.
+
+    python benchmarks/benchmark.py --suite quick --output baseline.json
+    python benchmarks/benchmark.py --suite quick --repeat 3 --compare baseline.json
+
+With --compare the run exits with status 1 when a phase is slower, or uses more memory, than the baseline by more
+than the tolerance.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+from scipy.signal import lfilter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from enerthon.data import month_order
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.profiling import profile
+from enerthon.tariff import EXAMPLES, compile_tariff
+
+
+PHASES = ['model_input', 'model', 'solve_model', 'model_results']
+
+HORIZONS = {'1w': 7, '1m': 31, '1y': 365, '5y': 5*365+1}
+RESOLUTIONS = [60, 15, 5]
+
+# Horizons and resolutions of each suite, every case runs all tariffs and storage/grid charging variants
+SUITES = {
+    'quick': (['1w', '1m'], [60, 15]),
+    'default': (['1w', '1m', '1y'], [60, 15]),
+    'full': (list(HORIZONS), RESOLUTIONS),
+}
+
+
+def synthetic_profiles(days, minutes, start='2019-01-01', seed=0):
+    # Household profiles with daily and seasonal shapes and autocorrelated noise, in kW
+    rng = np.random.default_rng(seed)
+    dt = minutes/60
+    n = int(round(days*24/dt))
+    index = np.datetime64(start, 'm') + np.arange(n)*np.timedelta64(minutes, 'm')
+
+    hour = (index - index.astype('datetime64[D]')).astype(np.int64)/60
+    day_of_year = (index.astype('datetime64[D]') - index.astype('datetime64[Y]')).astype(np.int64)
+    season = np.cos(2*np.pi*(day_of_year - 172)/365)
+
+    # Cloudiness and occupancy follow AR(1) processes with a time constant of a few hours
+    def noise(scale, hours):
+        a = np.exp(-dt/hours)
+        return lfilter([1], [1, -a], rng.normal(0, scale*np.sqrt(1 - a**2), n))
+
+    daylight = np.clip(np.sin(np.pi*(hour - 6 - 2*(1 - season)/2)/(12 + 4*season)), 0, None)
+    pv = 5*daylight*(0.55 + 0.45*season)*np.clip(1 + noise(0.4, 3), 0, 1.2)
+    load = np.clip(0.3 + 0.6*np.exp(-((hour - 7.5)/1.5)**2) + 0.9*np.exp(-((hour - 19)/2.5)**2) + noise(0.15, 1),
+                   0.05, None)
+    heat = np.clip((2.5 - 2*season)*(0.8 + 0.4*np.exp(-((hour - 7)/3)**2)) + noise(0.3, 4), 0, None)
+    price = np.clip(0.06 + 0.03*np.exp(-((hour - 18)/3)**2) + 0.01*(1 - season) + noise(0.01, 6), 0.01, None)
+
+    return {'index': index, 'dt': dt, 'PV': pv, 'Load': load, 'Heat': heat, 'price': price}
+
+
+def case_data(profiles, tariff, storage, grid_charging):
+    data = {'generation': profiles['PV'],
+            'demand': profiles['Load'],
+            'heat_demand': profiles['Heat'],
+
+            'battery_capacity': 10.0 if storage else 0.0,
+            'battery_charge_max': 0.5,
+            'battery_discharge_max': 0.5,
+            'battery_efficiency_charge': 0.9,
+            'battery_efficiency_discharge': 0.9,
+            'battery_grid_charging': grid_charging,
+
+            'tes_capacity': 100.0 if storage else 0.0,
+            'tes_losses': 0.01*profiles['dt'],
+
+            'energy_price_buy': profiles['price'],
+            'energy_price_sell': profiles['price']/2,
+
+            'fuel_price': 0.7,
+            'boiler_capacity': 10,
+            'heat_pump_capacity': 10,
+            'heat_pump_cop': 3,
+
+            'month_order': month_order(profiles['index']),
+            'dt': profiles['dt'],
+    }
+    data.update(compile_tariff(EXAMPLES[tariff], profiles['index']))
+
+    return data
+
+
+def cases(suite):
+    horizons, resolutions = SUITES[suite]
+    for horizon, minutes, tariff, storage, grid_charging in itertools.product(horizons, resolutions, sorted(EXAMPLES),
+                                                                              [False, True], [True, False]):
+        # Grid charging only matters with storage
+        if not storage and not grid_charging:
+            continue
+        name = '%s-%dmin-tariff%d-%s-%s' % (horizon, minutes, tariff, 'storage' if storage else 'nostorage',
+                                            'gridcharging' if grid_charging else 'nogridcharging')
+        yield name, (horizon, minutes, tariff, storage, grid_charging)
+
+
+def run_case(horizon, minutes, tariff, storage, grid_charging, solver, solve=True, repeat=1, compact=False):
+    profiles = synthetic_profiles(HORIZONS[horizon], minutes)
+    data = case_data(profiles, tariff, storage, grid_charging)
+
+    # The best of the repeats, timings of a single run are noisy on shared machines
+    result = {'periods': len(profiles['PV'])}
+    for _ in range(repeat):
+        with profile() as report:
+            model_instance = model(model_input(data), compact=compact)
+            if solve:
+                model_results(solve_model(model_instance, solver))
+
+        for phase in PHASES:
+            try:
+                record = report[phase]
+            except KeyError:
+                continue
+            measures = {'wall': record['wall'], 'cpu': record['cpu'], 'peak_memory': record['peak_memory']}
+            if phase in result:
+                measures = {name: min(v, result[phase][name]) if v is not None else None
+                            for name, v in measures.items()}
+            result[phase] = measures
+        if solve:
+            result['solve_info'] = report['solve_model']['info']
+    return result
+
+
+def compare(results, baseline, tolerance, min_time=0.05, min_memory=32e6):
+    # Regressions of phases present in both runs. Small absolute differences are ignored as noise, the resident
+    # set size of short phases depends on how much freed memory the process can reuse.
+    regressions = []
+    for name, result in results['cases'].items():
+        reference = baseline['cases'].get(name)
+        if reference is None:
+            continue
+        for phase in PHASES:
+            if phase not in result or phase not in reference:
+                continue
+            for measure, minimum in [('wall', min_time), ('peak_memory', min_memory)]:
+                new, old = result[phase][measure], reference[phase][measure]
+                if new is None or old is None:
+                    continue
+                if new > old*(1 + tolerance) and new - old > minimum:
+                    regressions.append('%s %s %s: %.4g -> %.4g (%+.0f%%)' % (name, phase, measure, old, new,
+                                                                             100*(new/old - 1) if old else np.inf))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick')
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this text')
+    parser.add_argument('--solver', default='highs')
+    parser.add_argument('--no-solve', action='store_true', help='only measure model_input and model')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per case, the best is kept, default 1')
+    parser.add_argument('--compact', action='store_true', help='build the compact formulation')
+    parser.add_argument('--output', help='write the results to this JSON file, e.g. a new baseline')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative increase, default 0.25')
+    parser.add_argument('--min-time', type=float, default=0.05, help='ignored slowdown in seconds, default 0.05')
+    parser.add_argument('--min-memory', type=float, default=32, help='ignored memory increase in MB, default 32')
+    args = parser.parse_args(argv)
+
+    from pyomo.version import version as pyomo_version
+    results = {'meta': {'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'suite': args.suite, 'solver': args.solver,
+                        'repeat': args.repeat, 'compact': args.compact, 'python': platform.python_version(), 'platform': platform.platform(),
+                        'numpy': np.__version__, 'pyomo': pyomo_version},
+               'cases': dict()}
+
+    for name, case in cases(args.suite):
+        if args.filter not in name:
+            continue
+        result = run_case(*case, solver={'name': args.solver}, solve=not args.no_solve, repeat=args.repeat,
+                          compact=args.compact)
+        results['cases'][name] = result
+        print('%-48s %8d periods  ' % (name, result['periods'])
+              + '  '.join('%s %.3fs' % (phase, result[phase]['wall']) for phase in PHASES if phase in result),
+              flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_time, args.min_memory*1e6)
+        if regressions:
+            print('\nREGRESSIONS against %s:' % args.compare)
+            for regression in regressions:
+                print('  ' + regression)
+            return 1
+        print('\nNo regressions against %s' % args.compare)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+from scipy.cluster.vq import kmeans2
+import numpy as np
+
+from enerthon.enerthon_model import TES_LOSSES, model_input
+
+
+# Series clustered into representative days. The power fees set the monthly peak costs and are kept exact by
+# grouping days on them.
+PROFILES = ['generation', 'demand', 'heat_demand']
+PRICES = ['energy_price_buy', 'energy_price_sell', 'grid_energy_import_fee', 'grid_energy_export_fee']
+POWER_FEES = ['grid_power_import_fee', 'grid_power_export_fee']
+
+
+def _clusters(days, features, n_clusters, seed):
+    # Label each day with the first calendar day of its cluster
+    if n_clusters >= len(days):
+        return days
+
+    _, labels = kmeans2(features, n_clusters, minit='++', seed=seed)
+    first_day = {label: days[labels == label][0] for label in np.unique(labels)}
+    return np.array([first_day[label] for label in labels])
+
+
+def aggregate(data, k, periods_per_day=None, seed=0):
+    n = len(data['generation'])
+    if np.ndim(data.get('dt', 1)) > 0:
+        raise ValueError('Representative days need periods of equal length, dt must be a single value')
+    periods_per_day = periods_per_day or int(round(24/data.get('dt', 1)))
+    if n % periods_per_day != 0:
+        raise ValueError('The horizon of %d periods is not a whole number of days' % n)
+    n_days = n // periods_per_day
+
+    series = {name: np.asarray(v, dtype=float) for name, v in data.items() if np.ndim(v) > 0 and len(v) == n}
+    days = {name: v.reshape(n_days, periods_per_day) for name, v in series.items()}
+
+    month_order = np.asarray(data['month_order'])
+    day_month = month_order[::periods_per_day]
+    if np.any(month_order.reshape(n_days, periods_per_day) != day_month[:, None]):
+        raise ValueError('Days must not cross month boundaries, the horizon has to start at midnight')
+
+    # Features are scaled per series so that each profile and price weighs the same in the clustering
+    clustered = [name for name in PROFILES + PRICES if name in days]
+    features = np.hstack([days[name]/max(np.max(np.abs(days[name])), 1e-9) for name in clustered])
+    power_fees = np.hstack([days[name] for name in POWER_FEES if name in days] + [np.zeros((n_days, 0))])
+    net_demand = days['demand'] - days['generation'] if 'demand' in days else -days['generation']
+
+    cluster = np.empty(n_days, dtype=int)
+    for month in np.unique(day_month):
+        month_days = np.flatnonzero(day_month == month)
+
+        # The day with the highest net demand represents itself to keep the monthly power peak
+        peak_day = month_days[np.argmax(net_demand[month_days].max(axis=1))]
+        cluster[peak_day] = peak_day
+        month_days = month_days[month_days != peak_day]
+        if len(month_days) == 0:
+            continue
+
+        # Days with different power fees are never merged, so every group needs a cluster of its own. The k-1
+        # clusters besides the peak day are shared out by group size, the largest remainders first.
+        _, group = np.unique(power_fees[month_days], axis=0, return_inverse=True)
+        group = group.ravel()
+        sizes = np.bincount(group)
+        if k - 1 < len(sizes):
+            raise ValueError('Month %d needs at least k=%d representative days, its peak day and one for each of its '
+                             '%d power fee groups' % (month, len(sizes) + 1, len(sizes)))
+        share = (k - 1 - len(sizes))*sizes/len(month_days)
+        clusters = 1 + np.floor(share).astype(int)
+        for g in np.argsort(-(share - np.floor(share)), kind='stable')[:(k-1) - clusters.sum()]:
+            clusters[g] += 1
+
+        for g, n_clusters in enumerate(clusters):
+            group_days = month_days[group == g]
+            cluster[group_days] = _clusters(group_days, features[group_days], n_clusters, seed)
+
+    representatives, day_representative, weights = np.unique(cluster, return_inverse=True, return_counts=True)
+    day_representative = day_representative.ravel()
+    n_representatives = len(representatives)
+
+    # Reduced data with the mean day of each cluster, in calendar order. Power fees are identical within a cluster,
+    # the mean keeps the energy of the clustered profiles and the sum of the prices over the days.
+    reduced_data = dict(data)
+    for name, v in days.items():
+        mean_days = np.zeros((n_representatives, periods_per_day))
+        np.add.at(mean_days, day_representative, v)
+        reduced_data[name] = (mean_days/weights[:, None]).ravel()
+
+    if 'weight' in days:
+        reduced_data['weight'] = reduced_data['weight']*np.repeat(weights, periods_per_day)
+    else:
+        reduced_data['weight'] = np.repeat(weights, periods_per_day).astype(float)
+
+    # Storage levels of representative days are relative to the level at the start of the day, which model()
+    # carries over the sequence of calendar days from the initial to the final level
+    periods = np.arange(1, n_representatives*periods_per_day+1).reshape(n_representatives, periods_per_day)
+    previous_period = periods - 1
+    previous_period[:, 0] = 0
+    reduced_data['previous_period'] = previous_period.ravel()
+    reduced_data['day_sequence'] = day_representative + 1
+
+    # Share of the thermal storage level at the start of a day that is left after each period of the day
+    losses = np.broadcast_to(np.asarray(reduced_data.get('tes_losses', TES_LOSSES), dtype=float),
+                             (n_representatives*periods_per_day,))
+    tes_retention = np.cumprod((1 - losses).reshape(n_representatives, periods_per_day), axis=1).ravel()
+
+    # Normalised root mean square error of the series rebuilt from the representative days
+    error = dict()
+    for name in clustered:
+        rebuilt = reduced_data[name].reshape(n_representatives, periods_per_day)[day_representative]
+        scale = np.mean(np.abs(days[name]))
+        error[name] = float(np.sqrt(np.mean((rebuilt - days[name])**2))/scale) if scale > 0 else 0.0
+
+    aggregation = {
+        'periods_per_day': periods_per_day,
+        'representatives': representatives,
+        'weights': weights,
+        'day_representative': day_representative,
+        'error': error,
+        'tes_retention': tes_retention,
+    }
+
+    return reduced_data, aggregation
+
+
+def expand_results(results, aggregation, data=None):
+    # Map per-period results of the representative days back onto the full calendar. Storage levels are the level
+    # at the start of the calendar day plus the relative level of its representative day. With the full data, the
+    # error of the mapped back solution is added, see solution_error().
+    periods_per_day = aggregation['periods_per_day']
+    n_periods = len(aggregation['representatives'])*periods_per_day
+    day_representative = aggregation['day_representative']
+
+    s = dict()
+    for name, v in results.items():
+        if np.ndim(v) > 0 and len(v) == n_periods:
+            s[name] = np.asarray(v).reshape(-1, periods_per_day)[day_representative].ravel().tolist()
+        else:
+            s[name] = v
+
+    # Results of the closed form or of other models have no day levels, their storage levels are absolute
+    retention = {'battery': np.ones(n_periods), 'tes': aggregation['tes_retention']}
+    for storage in ['battery', 'tes']:
+        if '%s_soc_day' % storage in results:
+            start = np.asarray(results['%s_soc_day' % storage][:-1])
+            relative = np.asarray(results['%s_soc' % storage]).reshape(-1, periods_per_day)[day_representative]
+            decay = retention[storage].reshape(-1, periods_per_day)[day_representative]
+            s['%s_soc' % storage] = (start[:, None]*decay + relative).ravel().tolist()
+
+    if data is not None:
+        s['error'] = solution_error(data, s)
+    return s
+
+
+def solution_error(data, expanded_results):
+    # Error of a solution mapped back onto the calendar: its storage and heat dispatch replayed on the full data.
+    # The grid exchange follows from the power balance, missing heat comes from the heat pump, then the boiler, up
+    # to their capacities. Returns the cost of the replay, its error relative to the cost of the representative
+    # days, the heat demand left uncovered and the largest violation of the storage limits, in kWh.
+    model_data = model_input(data)
+    d = model_data[None]
+    dt = np.broadcast_to(np.asarray(d['dt'], dtype=float), (len(d['T']),))
+    r = {name: np.asarray(v, dtype=float) for name, v in expanded_results.items()
+         if np.ndim(v) > 0 and len(v) == len(dt)}
+
+    heat = d['heat_demand'] + r['tes_charge'] - r['tes_discharge']
+    q_bo = np.clip(r['boiler_heat_generation'], 0, np.maximum(heat, 0))
+    q_hp = np.clip(heat - q_bo, 0, d['heat_pump_capacity'])
+    q_bo = np.clip(heat - q_hp, 0, d['boiler_capacity'])
+    unmet_heat = np.maximum(heat - q_hp - q_bo, 0)
+
+    net = d['demand'] - d['generation'] + r['battery_charge'] - r['battery_discharge'] + q_hp/d['heat_pump_cop']
+    p_buy = np.maximum(net, 0)
+    p_sell = np.maximum(-net, 0)
+
+    months, month_index = np.unique(d['month_order'], return_inverse=True)
+    peak_import = np.zeros(len(months))
+    peak_export = np.zeros(len(months))
+    np.maximum.at(peak_import, month_index, d['grid_power_import_fee']*net)
+    np.maximum.at(peak_export, month_index, -d['grid_power_export_fee']*net)
+    peak_import = np.maximum(peak_import, [d['grid_power_import_max_ini'].get(m, 0.0) for m in months.tolist()])
+    peak_export = np.maximum(peak_export, [d['grid_power_export_max_ini'].get(m, 0.0) for m in months.tolist()])
+
+    cost = np.sum(d['weight']*dt*((d['energy_price_buy'] + d['grid_energy_import_fee'])*p_buy
+                                  - (d['energy_price_sell'] - d['grid_energy_export_fee'])*p_sell
+                                  + d['fuel_price']*q_bo/d['boiler_efficiency'])) \
+        + peak_import.sum() + peak_export.sum() + d['grid_fixed_fee']*len(months)
+
+    violation = 0.0
+    for storage, soc in [('battery', 'battery_soc'), ('tes', 'tes_soc')]:
+        capacity = d['%s_capacity' % storage]
+        violation = max(violation, np.max(np.maximum(r[soc] - capacity, d['%s_min_level' % storage]*capacity - r[soc]),
+                                          initial=0.0))
+
+    return {'cost_total': float(cost),
+            'cost_error': float((expanded_results['cost_total'] - cost)/cost) if cost != 0 else 0.0,
+            'unmet_heat': float(np.sum(unmet_heat*dt)),
+            'storage_violation': float(violation)}
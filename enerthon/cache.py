@@ -0,0 +1,167 @@
+from contextlib import contextmanager
+import numpy as np
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from enerthon.closed_form import closed_form_results
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.matrix_model import matrix_model, matrix_model_results, solve_matrix_model
+
+
+# Part of every key, increase when the formulation or the results layout changes
+CACHE_VERSION = 1
+
+
+def default_cache_dir():
+    return os.path.join(os.environ.get('ENERTHON_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'enerthon')),
+                        'models')
+
+
+def data_key(model_data):
+    # Stable hash of the model_input() output, arrays are hashed by dtype, shape and content
+    d = model_data[None]
+    h = hashlib.sha256(b'enerthon-%d' % CACHE_VERSION)
+    for name in sorted(d):
+        h.update(name.encode() + b'\0')
+        if isinstance(d[name], np.ndarray):
+            a = np.ascontiguousarray(d[name])
+            h.update(('%s%s' % (a.dtype.str, a.shape)).encode())
+            h.update(a.tobytes())
+        else:
+            h.update(json.dumps(d[name], sort_keys=True, default=str).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def solver_key(solver):
+    return json.dumps(solver, sort_keys=True, default=str)
+
+
+class ModelCache:
+    # Results, and optionally the LP in matrix form, stored as files on local disk. Every file is written to a
+    # temporary name and renamed, so readers never see partial entries. Hits refresh the modification time, which
+    # orders the least recently used eviction once the directory grows over max_size bytes.
+
+    def __init__(self, directory=None, max_size=1 << 30, persist_lp=False):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        self.persist_lp = persist_lp
+        for kind in ['results', 'lp']:
+            os.makedirs(os.path.join(self.directory, kind), exist_ok=True)
+
+    def _path(self, kind, key):
+        return os.path.join(self.directory, kind, key + '.pkl')
+
+    @contextmanager
+    def _lock(self):
+        # Serialises writers and eviction between processes, a no-op where fcntl is not available
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self, kind, key):
+        path = self._path(kind, key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            # Missing, or evicted by another process in the meantime
+            return None
+        return value
+
+    def _write(self, kind, key, value):
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.directory, kind), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with self._lock():
+                os.replace(tmp, self._path(kind, key))
+                self._evict()
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _entries(self):
+        entries = []
+        for kind in ['results', 'lp']:
+            for entry in os.scandir(os.path.join(self.directory, kind)):
+                if entry.name.endswith('.pkl'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def key(self, model_data, solver):
+        return hashlib.sha256((data_key(model_data) + solver_key(solver)).encode()).hexdigest()
+
+    def get(self, key):
+        return self._read('results', key)
+
+    def put(self, key, results):
+        self._write('results', key, results)
+
+    def clear(self):
+        with self._lock():
+            for _, _, path in self._entries():
+                os.remove(path)
+
+    def solve(self, data, solver):
+        # model_results() of the data solved with the solver, from the cache when the same data and solver
+        # settings were solved before
+        model_data = model_input(data)
+        key = self.key(model_data, solver)
+        results = self.get(key)
+        if results is not None:
+            return results
+
+        # Separable configurations are solved in closed form, the LP does not need to be built. Neither the closed
+        # form nor the matrix LP has the duals that model_results() turns into shadow prices.
+        duals = solver.get('duals', False)
+        results = None if duals else closed_form_results(model_data)
+        if results is None and not duals and self.persist_lp and solver.get('name', '').startswith('highs'):
+            # The LP does not depend on the solver settings, only the solve is repeated
+            lp_key = data_key(model_data)
+            matrix = self._read('lp', lp_key)
+            if matrix is None:
+                matrix = matrix_model(model_data)
+                self._write('lp', lp_key, matrix)
+            results = matrix_model_results(solve_matrix_model(matrix, solver))
+        elif results is None:
+            solution = solve_model(model(model_data), solver)
+            results = model_results(solution)
+
+        self.put(key, results)
+        return results
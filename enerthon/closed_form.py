@@ -0,0 +1,148 @@
+import numpy as np
+
+from enerthon.enerthon_model import _series
+from enerthon.profiling import timed
+from enerthon.results import PERIOD_COLUMNS, Results
+
+
+# Numerical tolerance of the feasibility and separability checks, in kW
+TOLERANCE = 1e-9
+
+
+def _heat_dispatch(d, heat_demand, surplus, buy, sell):
+    # Cheapest split of the heat demand between heat pump and boiler in every period. Heat pump heat costs sell/cop
+    # while it runs on surplus generation and buy/cop beyond that, the boiler costs the fuel.
+    cop = d['heat_pump_cop']
+    hp_capacity = d['heat_pump_capacity']
+    boiler_capacity = d['boiler_capacity']
+
+    hp_surplus = np.minimum(hp_capacity, cop*surplus)
+    cost_surplus = sell/cop
+    cost_buy = buy/cop
+    cost_boiler = d['fuel_price']*d['dt']/d['boiler_efficiency']
+
+    # Boiler before the heat pump
+    boiler_first = np.minimum(heat_demand, boiler_capacity)
+    hp_after_boiler = np.minimum(heat_demand - boiler_first, hp_capacity)
+
+    # Heat pump on surplus, then the boiler, then the heat pump on bought electricity
+    hp_middle = np.minimum(heat_demand, hp_surplus)
+    boiler_middle = np.minimum(heat_demand - hp_middle, boiler_capacity)
+    hp_middle = hp_middle + np.minimum(heat_demand - hp_middle - boiler_middle, hp_capacity - hp_surplus)
+
+    # Heat pump before the boiler
+    hp_first = np.minimum(heat_demand, hp_capacity)
+    boiler_last = np.minimum(heat_demand - hp_first, boiler_capacity)
+
+    first = cost_boiler < cost_surplus
+    middle = ~first & (cost_boiler < cost_buy)
+    q_hp = np.where(first, hp_after_boiler, np.where(middle, hp_middle, hp_first))
+    q_bo = np.where(first, boiler_first, np.where(middle, boiler_middle, boiler_last))
+
+    return q_hp, q_bo
+
+
+def separable(model_data):
+    # True when the dispatch is determined period by period: without storage, without simultaneous buying and
+    # selling paying off, and with either no power fees or no choice between heat pump and boiler. The monthly
+    # peaks of a fixed net load then follow directly.
+    d = model_data[None]
+    if d['battery_capacity'] != 0 or d['tes_capacity'] != 0:
+        return False
+    if d['heat_pump_cop'] <= 0 or d['boiler_efficiency'] <= 0:
+        return False
+    if np.any(_series(model_data, 'weight') < 0):
+        return False
+
+    # Selling at a higher price than buying would make the LP trade with itself
+    dt = d['dt']
+    buy = (_series(model_data, 'energy_price_buy') + _series(model_data, 'grid_energy_import_fee'))*dt
+    sell = (_series(model_data, 'energy_price_sell') - _series(model_data, 'grid_energy_export_fee'))*dt
+    if np.any(sell > buy):
+        return False
+
+    if d['battery_grid_charging'] == False:
+        if np.any(_series(model_data, 'generation') < 0) or np.any(_series(model_data, 'demand') < 0):
+            return False
+
+    power_fees = np.any(_series(model_data, 'grid_power_import_fee') != 0) \
+        or np.any(_series(model_data, 'grid_power_export_fee') != 0)
+    if power_fees:
+        # The heat pump share changes the net load and with it the monthly peaks, unless it is forced
+        heat_demand = _series(model_data, 'heat_demand')
+        lower = np.maximum(0.0, heat_demand - d['boiler_capacity'])
+        upper = np.minimum(heat_demand, d['heat_pump_capacity'])
+        if np.any(upper - lower > TOLERANCE):
+            return False
+
+    return True
+
+
+@timed('closed_form_results')
+def closed_form_results(model_data):
+    # model_results() of a separable configuration computed without building the LP, None when the model is not
+    # separable or infeasible, so that the LP reports the problem
+    if not separable(model_data):
+        return None
+
+    d = model_data[None]
+    dt = d['dt']
+    demand = _series(model_data, 'demand')
+    generation = _series(model_data, 'generation')
+    heat_demand = _series(model_data, 'heat_demand')
+    weight = _series(model_data, 'weight')
+    energy_price_buy = _series(model_data, 'energy_price_buy')
+    energy_price_sell = _series(model_data, 'energy_price_sell')
+    grid_energy_import_fee = _series(model_data, 'grid_energy_import_fee')
+    grid_energy_export_fee = _series(model_data, 'grid_energy_export_fee')
+    grid_power_import_fee = _series(model_data, 'grid_power_import_fee')
+    grid_power_export_fee = _series(model_data, 'grid_power_export_fee')
+
+    buy = (energy_price_buy + grid_energy_import_fee)*dt
+    sell = (energy_price_sell - grid_energy_export_fee)*dt
+    net_load = demand - generation
+
+    q_hp, q_bo = _heat_dispatch(d, heat_demand, np.maximum(-net_load, 0.0), buy, sell)
+    if np.any(heat_demand < 0) or np.any(np.abs(q_hp + q_bo - heat_demand) > TOLERANCE):
+        return None
+
+    p_hp = q_hp/d['heat_pump_cop']
+    f_bo = q_bo/d['boiler_efficiency']
+    net = net_load + p_hp
+    p_buy = np.maximum(net, 0.0)
+    p_sell = np.maximum(-net, 0.0)
+
+    columns = {
+        'COST_ENERGY': energy_price_buy*p_buy*dt - energy_price_sell*p_sell*dt,
+        'COST_GRID_ENERGY_IMPORT': grid_energy_import_fee*p_buy*dt,
+        'COST_GRID_ENERGY_EXPORT': grid_energy_export_fee*p_sell*dt,
+        'COST_FUEL': d['fuel_price']*f_bo*dt,
+        'P_BUY': p_buy,
+        'P_SELL': p_sell,
+        'Q_HP': q_hp,
+        'P_HP': p_hp,
+        'Q_BO': q_bo,
+        'F_BO': f_bo,
+    }
+    n = len(net)
+    values = np.zeros((n, len(PERIOD_COLUMNS)), order='F')
+    for i, (_, var) in enumerate(PERIOD_COLUMNS):
+        if var in columns:
+            values[:, i] = columns[var]
+
+    # Highest power cost of every month, not below the cost already incurred
+    month_order = _series(model_data, 'month_order', np.int64)
+    months, month_index = np.unique(month_order, return_inverse=True)
+    monthly = np.zeros((len(months), 2), order='F')
+    np.maximum.at(monthly[:, 0], month_index, grid_power_import_fee*net)
+    np.maximum.at(monthly[:, 1], month_index, -grid_power_export_fee*net)
+    monthly[:, 0] = np.maximum(monthly[:, 0], [d['grid_power_import_max_ini'].get(m, 0.0) for m in months.tolist()])
+    monthly[:, 1] = np.maximum(monthly[:, 1], [d['grid_power_export_max_ini'].get(m, 0.0) for m in months.tolist()])
+
+    cost_grid_power_fixed = d['grid_fixed_fee']*len(months)
+    cost_total = float(np.dot(weight, columns['COST_ENERGY'] + columns['COST_GRID_ENERGY_IMPORT']
+                              + columns['COST_GRID_ENERGY_EXPORT'] + columns['COST_FUEL'])
+                       + monthly.sum() + cost_grid_power_fixed)
+
+    return Results(np.asarray(d['T'], dtype=np.int64), values, months, monthly, cost_total,
+                   cost_grid_power_fixed).to_dict()
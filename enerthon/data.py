@@ -0,0 +1,170 @@
+import numpy as np
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+
+# Rows parsed at a time, so that large archives never have to fit in memory
+CHUNK_SIZE = 1000000
+
+METER_COLUMNS = [('date', 'datetime64[D]'), ('value', 'float64'), ('type_flag', 'int64'), ('nan_flag', 'int64'),
+                 ('month_order', 'int64')]
+
+
+def default_cache_dir():
+    return os.environ.get('ENERTHON_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'enerthon'))
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def month_order(index, first=None):
+    # Number every unique month-year, starting from 1 at the month of the first period or at first
+    months = np.asarray(index, dtype='datetime64[M]').astype(np.int64)
+    if first is None:
+        first = months[0] if len(months) else 0
+    else:
+        first = np.datetime64(first, 'M').astype(np.int64)
+    return months - first + 1
+
+
+class _ColumnWriter:
+    # Appends columns chunk by chunk to raw binary files that are memory-mapped when loading
+
+    def __init__(self, directory, columns):
+        self.directory = directory
+        self.columns = dict(columns)
+        self.files = {name: open(os.path.join(directory, name + '.bin'), 'wb') for name in self.columns}
+        self.length = 0
+
+    def write(self, **chunk):
+        for name, values in chunk.items():
+            np.ascontiguousarray(values, dtype=self.columns[name]).tofile(self.files[name])
+        self.length += len(next(iter(chunk.values())))
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def _read_columns(directory, meta):
+    columns = dict()
+    for name, dtype in meta['columns']:
+        if meta['length'] == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(os.path.join(directory, name + '.bin'), dtype=dtype, mode='r',
+                                      shape=(meta['length'],))
+    return columns
+
+
+def _cached(path, kind, build, cache_dir):
+    cache_dir = cache_dir or default_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # The prefix names the source file, files of the same name in other directories have caches of their own
+    source = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    prefix = '%s-%s-%s-' % (kind, os.path.basename(path), source)
+    directory = os.path.join(cache_dir, prefix + file_hash(path)[:32])
+
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        # Build in a private directory and move it in place, concurrent builds of the same source are discarded
+        tmp = tempfile.mkdtemp(dir=cache_dir, prefix='.build-')
+        try:
+            meta = build(tmp)
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            os.rename(tmp, directory)
+        except OSError:
+            if not os.path.exists(os.path.join(directory, 'meta.json')):
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        # Remove caches of earlier versions of the same source file
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix) and os.path.join(cache_dir, name) != directory:
+                shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+
+    return directory, meta
+
+
+def load_profiles(path='./data/data.zip', cache_dir=None):
+    # Building profiles with one timestamp column followed by value columns, e.g. PV, Load and Heat
+    def build(directory):
+        import pandas as pd
+
+        writer = None
+        for chunk in pd.read_csv(path, header=0, index_col=0, chunksize=CHUNK_SIZE):
+            # Timestamps are stored as UTC
+            index = pd.to_datetime(chunk.index, utc=True).tz_localize(None).to_numpy()
+            if writer is None:
+                # A month_order column in the source is recomputed from the timestamps
+                names = [name for name in chunk.columns if name != 'month_order']
+                columns = [('index', 'datetime64[ns]')] + [(name, 'float64') for name in names] \
+                    + [('month_order', 'int64')]
+                writer = _ColumnWriter(directory, columns)
+                first = index[0]
+            writer.write(index=index, month_order=month_order(index, first),
+                         **{name: chunk[name].to_numpy(dtype=float) for name in names})
+        writer.close()
+
+        return {'source': os.path.abspath(path), 'length': writer.length,
+                'columns': [[name, dtype] for name, dtype in columns]}
+
+    directory, meta = _cached(path, 'profiles', build, cache_dir)
+    return _read_columns(directory, meta)
+
+
+def load_meters(path, cache_dir=None):
+    # Archives with one daily Date,Value,type_flag,nan_flag csv per meter, parsed member by member
+    def build(directory):
+        import pandas as pd
+
+        writer = _ColumnWriter(directory, METER_COLUMNS)
+        meters = []
+        offsets = [0]
+        with zipfile.ZipFile(path) as archive:
+            for member in sorted(archive.namelist()):
+                if not member.endswith('.csv'):
+                    continue
+                first = None
+                with archive.open(member) as f:
+                    for chunk in pd.read_csv(f, usecols=['Date', 'Value', 'type_flag', 'nan_flag'],
+                                             chunksize=CHUNK_SIZE):
+                        dates = pd.to_datetime(chunk['Date']).to_numpy().astype('datetime64[D]')
+                        if first is None and len(dates):
+                            first = dates[0]
+                        writer.write(date=dates, value=chunk['Value'].to_numpy(dtype=float),
+                                     type_flag=chunk['type_flag'].to_numpy(), nan_flag=chunk['nan_flag'].to_numpy(),
+                                     month_order=month_order(dates, first))
+                meters.append(os.path.splitext(os.path.basename(member))[0])
+                offsets.append(writer.length)
+        writer.close()
+
+        return {'source': os.path.abspath(path), 'length': writer.length, 'meters': meters, 'offsets': offsets,
+                'columns': [[name, dtype] for name, dtype in METER_COLUMNS]}
+
+    directory, meta = _cached(path, 'meters', build, cache_dir)
+    columns = _read_columns(directory, meta)
+    columns['meters'] = meta['meters']
+    columns['offsets'] = np.array(meta['offsets'], dtype=np.int64)
+    return columns
+
+
+def meter(meters, name):
+    # Columns of one meter, as views into the memory-mapped cache
+    i = meters['meters'].index(name)
+    rows = slice(meters['offsets'][i], meters['offsets'][i+1])
+    return {column: meters[column][rows] for column, _ in METER_COLUMNS}
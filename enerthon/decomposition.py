@@ -0,0 +1,218 @@
+from concurrent.futures import ProcessPoolExecutor
+from scipy.optimize import linprog
+from scipy import sparse
+import numpy as np
+import warnings
+
+from enerthon.enerthon_model import TES_LOSSES, model_input
+from enerthon.matrix_model import matrix_model, matrix_model_results, solve_matrix_model
+from enerthon.rolling_horizon import PERIOD_RESULTS
+from enerthon.sweep import attach_arrays, cpu_count, share_arrays
+
+
+# Cost of deviating from a boundary storage level that a month cannot reach, in €/kWh
+BOUNDARY_PENALTY = 1e4
+
+# Worker state, set once per process by _init_worker
+_worker = dict()
+
+
+def _month_matrix(data, periods, last):
+    month_data = dict()
+    for name, v in data.items():
+        month_data[name] = np.asarray(v)[periods] if np.ndim(v) > 0 else v
+
+    # Boundary levels are set on the right hand side of the first period storage balances
+    month_data['bel_ini_level'] = 0
+    month_data['tes_ini_level'] = 0
+    if not last:
+        month_data['bel_fin_level'] = 0
+        month_data['tes_fin_level'] = 0
+
+    matrix = matrix_model(model_input(month_data))
+    if last:
+        return matrix
+
+    # Elastic end of month levels: BEL[last] - e_bel_up + e_bel_down == s_bel, same for TES
+    n_columns = len(matrix['c'])
+    bel_last = matrix['columns']['BEL'].stop-1
+    tes_last = matrix['columns']['TES'].stop-1
+    rows = sparse.csr_matrix(([1.0, -1.0, 1.0, 1.0, -1.0, 1.0], ([0, 0, 0, 1, 1, 1],
+                              [bel_last, n_columns, n_columns+1, tes_last, n_columns+2, n_columns+3])),
+                             shape=(2, n_columns+4))
+
+    matrix['A_eq'] = sparse.vstack([sparse.hstack([matrix['A_eq'], sparse.csr_matrix((matrix['A_eq'].shape[0], 4))]),
+                                    rows]).tocsr()
+    matrix['rows_eq']['boundary_level'] = slice(matrix['A_eq'].shape[0]-2, matrix['A_eq'].shape[0])
+    matrix['columns']['boundary_slack'] = slice(n_columns, n_columns+4)
+    matrix['b_eq'] = np.concatenate([matrix['b_eq'], [0.0, 0.0]])
+    if matrix['A_ub'] is not None:
+        matrix['A_ub'] = sparse.hstack([matrix['A_ub'], sparse.csr_matrix((matrix['A_ub'].shape[0], 4))]).tocsr()
+    matrix['c'] = np.concatenate([matrix['c'], np.full(4, BOUNDARY_PENALTY)])
+    matrix['lb'] = np.concatenate([matrix['lb'], np.zeros(4)])
+    matrix['ub'] = np.concatenate([matrix['ub'], np.full(4, np.inf)])
+
+    return matrix
+
+
+def _init_worker(shm_name, layout, scalars, month_periods, solver):
+    _worker['shm'], arrays = attach_arrays(shm_name, layout)
+    _worker['data'] = dict(scalars, **arrays)
+    _worker['month_periods'] = month_periods
+    _worker['solver'] = solver
+    _worker['matrices'] = dict()
+
+
+def _solve_month(m, start_level, end_level, results=False):
+    month_periods = _worker['month_periods']
+    last = m == len(month_periods)-1
+    data = _worker['data']
+
+    # Sub-problems are built once per worker, only the boundary levels change between iterations
+    if m not in _worker['matrices']:
+        _worker['matrices'][m] = _month_matrix(data, month_periods[m], last)
+    matrix = _worker['matrices'][m]
+    rows = matrix['rows_eq']
+    tes_losses = data.get('tes_losses', TES_LOSSES)
+    tes_retention = 1-(np.asarray(tes_losses)[month_periods[m][0]] if np.ndim(tes_losses) > 0 else tes_losses)
+
+    matrix['b_eq'][rows['battery_soc'].start] = start_level[0]
+    matrix['b_eq'][rows['heat_storage_soc'].start] = tes_retention*start_level[1]
+    if not last:
+        matrix['b_eq'][rows['boundary_level']] = end_level
+
+    solution = solve_matrix_model(matrix, _worker['solver'])['solution']
+    marginals = solution.eqlin.marginals
+
+    # Subgradients of the month cost with respect to the boundary levels
+    start_gradient = [marginals[rows['battery_soc'].start], tes_retention*marginals[rows['heat_storage_soc'].start]]
+    end_gradient = [0.0, 0.0] if last else list(marginals[rows['boundary_level']])
+
+    month_results = None
+    if results:
+        month_results = matrix_model_results(matrix)
+        month_results['boundary_slack'] = 0.0 if last else \
+            float(np.sum(solution.x[matrix['columns']['boundary_slack']]))
+    return solution.fun, start_gradient, end_gradient, month_results
+
+
+def _boundary_bounds(data):
+    lower = []
+    upper = []
+    for prefix in ['battery', 'tes']:
+        capacity = data.get('%s_capacity' % prefix, 0)
+        lower.append(max(0.0, data.get('%s_min_level' % prefix, 0)*capacity))
+        upper.append(capacity)
+    return np.array(lower), np.array(upper)
+
+
+def monthly_decomposition(data, solver=None, processes=None, tolerance=1e-4, max_iterations=100, monolithic=False):
+    solver = solver or {'name': 'highs'}
+
+    month_order = np.asarray(data['month_order'])
+    months = np.unique(month_order)
+    month_periods = [np.flatnonzero(month_order == m) for m in months]
+    n_months = len(months)
+    n_boundaries = n_months-1
+
+    lower, upper = _boundary_bounds(data)
+    initial_level = np.array([data.get('bel_ini_level', 0)*data.get('battery_capacity', 0),
+                              data.get('tes_ini_level', 0)*data.get('tes_capacity', 0)])
+
+    # Boundary levels between consecutive months, battery and tes, start in the middle of the storage range
+    levels = np.tile((lower+upper)/2, (n_boundaries, 1))
+
+    def boundary(levels, m):
+        start_level = initial_level if m == 0 else levels[m-1]
+        end_level = None if m == n_months-1 else levels[m]
+        return start_level, end_level
+
+    # Multi-cut master problem over x = [levels, theta]: theta_m >= f_m + g_m.(levels - levels_j)
+    n_levels = 2*n_boundaries
+    cuts_A = []
+    cuts_b = []
+
+    upper_bound = np.inf
+    lower_bound = -np.inf
+    best_levels = levels
+    iterations = 0
+
+    shared = {name: v for name, v in data.items() if np.ndim(v) > 0}
+    scalars = {name: v for name, v in data.items() if np.ndim(v) == 0}
+    shm, layout = share_arrays(shared)
+
+    # Each month is pinned to a single process pool, so every worker builds and keeps the LPs of its own months
+    # only and the workers together hold the full problem once
+    n_workers = min(processes or cpu_count(), n_months)
+    pools = [ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                 initargs=(shm.name, layout, scalars, month_periods, solver))
+             for _ in range(n_workers)]
+    owner = [pools[i] for i, months_group in enumerate(np.array_split(np.arange(n_months), n_workers))
+             for _ in months_group]
+    try:
+        while iterations < max_iterations:
+            iterations += 1
+            futures = [owner[m].submit(_solve_month, m, *boundary(levels, m)) for m in range(n_months)]
+            subproblems = [future.result() for future in futures]
+
+            cost = sum(cost for cost, _, _, _ in subproblems)
+            if cost < upper_bound:
+                upper_bound = cost
+                best_levels = levels
+
+            for m, (cost, start_gradient, end_gradient, _) in enumerate(subproblems):
+                row = np.zeros(n_levels+n_months)
+                if m > 0:
+                    row[2*(m-1):2*m] = start_gradient
+                if m < n_months-1:
+                    row[2*m:2*(m+1)] = end_gradient
+                row[n_levels+m] = -1.0
+                cuts_A.append(row)
+                cuts_b.append(np.dot(row[:n_levels], levels.ravel()) - cost)
+
+            c = np.concatenate([np.zeros(n_levels), np.ones(n_months)])
+            bounds = [(lo, hi) for lo, hi in zip(np.tile(lower, n_boundaries), np.tile(upper, n_boundaries))] \
+                + [(None, None)]*n_months
+            master = linprog(c, A_ub=np.array(cuts_A), b_ub=np.array(cuts_b), bounds=bounds, method='highs')
+            lower_bound = max(lower_bound, master.fun)
+            levels = master.x[:n_levels].reshape(n_boundaries, 2)
+
+            if upper_bound - lower_bound <= tolerance*max(1.0, abs(upper_bound)):
+                break
+
+        # Final results at the best boundary levels
+        futures = [owner[m].submit(_solve_month, m, *boundary(best_levels, m), results=True) for m in range(n_months)]
+        month_results = [future.result()[3] for future in futures]
+    finally:
+        for pool in pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+        shm.close()
+        shm.unlink()
+
+    # The bounds include the penalty of boundary levels that a month cannot reach, the cost does not. Such
+    # levels are not the optimum of the full horizon, e.g. when the final level is unreachable.
+    boundary_slack = sum(r['boundary_slack'] for r in month_results)
+    if boundary_slack > 1e-6:
+        warnings.warn('The boundary storage levels are missed by %g kWh, the decomposition is not the optimum of '
+                      'the full horizon' % boundary_slack)
+
+    s = dict()
+
+    s['cost_total'] = sum(r['cost_total'] for r in month_results) - BOUNDARY_PENALTY*boundary_slack
+    s['boundary_slack'] = boundary_slack
+    s['cost_grid_power_import'] = [r['cost_grid_power_import'][0] for r in month_results]
+    s['cost_grid_power_export'] = [r['cost_grid_power_export'][0] for r in month_results]
+    s['cost_grid_power_fixed'] = sum(r['cost_grid_power_fixed'] for r in month_results)
+    for name in PERIOD_RESULTS:
+        s[name] = [v for r in month_results for v in r[name]]
+
+    s['boundary_levels'] = best_levels.tolist()
+    s['lower_bound'] = lower_bound
+    s['gap'] = (upper_bound - lower_bound)/max(1.0, abs(upper_bound))
+    s['iterations'] = iterations
+
+    if monolithic:
+        s['monolithic_cost_total'] = solve_matrix_model(matrix_model(model_input(data)), solver)['solution'].fun
+        s['monolithic_gap'] = (s['cost_total'] - s['monolithic_cost_total'])/max(1.0, abs(s['monolithic_cost_total']))
+
+    return s
@@ -1,75 +1,622 @@
 from pyomo.environ import ConcreteModel, AbstractModel
-from pyomo.environ import Set,Param,Var,Objective,Constraint
+from pyomo.environ import Set,Param,Var,Objective,Constraint,Suffix
 from pyomo.environ import PositiveIntegers, NonNegativeReals, Reals
 from pyomo.environ import SolverFactory, minimize
 from pyomo.environ import value
 from pyomo.core.base.param import SimpleParam
+from pyomo.solvers.plugins.solvers.persistent_solver import PersistentSolver
+from time import perf_counter as timer
 import numpy as np
+import warnings
 
+from enerthon.profiling import enabled, model_size, phase, record, timed
+from enerthon.results import MONTH_COLUMNS, PERIOD_COLUMNS, Results
 
-def solve_model(model_instance, solver):
-    if 'path' in solver:
-        optimizer = SolverFactory(solver['name'], executable=solver['path'])
+
+# Solvers run in the Python process through their API, without LP files nor solver subprocess. highs solves a
+# sparse matrix compiled from the instance, appsi_highs keeps the instance loaded between solves.
+IN_MEMORY_SOLVERS = ['highs', 'appsi_highs']
+FALLBACK_SOLVER = {'name': 'glpk'}
+
+# Solver status of a solve with a solution, every other status leaves the variables without values
+OPTIMAL = 'optimal'
+
+# Capacities that model(sizing=...) can turn into decision variables, with the variable holding each size
+SIZING = ['battery', 'tes', 'heat_pump']
+CAPACITY_VARIABLES = {'battery': 'BATTERY_CAPACITY', 'tes': 'TES_CAPACITY', 'heat_pump': 'HEAT_PUMP_CAPACITY'}
+
+# Hours in the year the investment costs are annualised over
+HOURS_PER_YEAR = 8760
+
+# Share of the stored heat lost per period when the data has no tes_losses
+TES_LOSSES = 0.02
+
+
+def _highs_available():
+    try:
+        import highspy
+        from pyomo.repn.plugins.standard_form import LinearStandardFormCompiler
+    except ImportError:
+        return False
+    return True
+
+
+def _appsi_highs():
+    try:
+        from pyomo.contrib.appsi.solvers import Highs
+    except ImportError:
+        return None
+    optimizer = Highs()
+    return optimizer if optimizer.available() else None
+
+
+def _optimizer(model_instance, solver):
+    # Reuse the optimizer of a previous solve so persistent interfaces keep the instance loaded
+    optimizer = getattr(model_instance, '_optimizer', None)
+    if optimizer is not None and model_instance._optimizer_solver == solver:
+        return optimizer
+
+    optimizer = None
+    if solver['name'] == 'highs' and _highs_available():
+        optimizer = 'highs'
+    elif solver['name'] == 'appsi_highs':
+        optimizer = _appsi_highs()
+        if optimizer is not None:
+            optimizer.highs_options = dict(solver.get('options', {}))
+
+    if optimizer is None:
+        if solver['name'] in IN_MEMORY_SOLVERS:
+            warnings.warn('HiGHS is not available, falling back to %s' % FALLBACK_SOLVER['name'])
+            solver = dict(FALLBACK_SOLVER, options=solver.get('options', {}))
+        if 'path' in solver:
+            optimizer = SolverFactory(solver['name'], executable=solver['path'])
+        else:
+            optimizer = SolverFactory(solver['name'])
+        for name, option in solver.get('options', {}).items():
+            optimizer.options[name] = option
+
+    model_instance._optimizer = optimizer
+    model_instance._optimizer_solver = dict(solver)
+    return optimizer
+
+
+def _key(component_data):
+    # Identifies a variable or constraint across instances built from similar data
+    return (component_data.parent_component().local_name, component_data.index())
+
+
+def _load_warm_start(model_instance, warm_start):
+    # Primal values of a model_results() dict or of a solved instance as starting values of the variables
+    if warm_start is model_instance:
+        return
+    if isinstance(warm_start, dict):
+        for name, var in PERIOD_COLUMNS + MONTH_COLUMNS:
+            component = model_instance.component(var)
+            if component is None or len(warm_start.get(name, [])) != len(component):
+                continue
+            for v, x in zip(component.values(), warm_start[name]):
+                if not v.fixed and x is not None and np.isfinite(x):
+                    v.set_value(x, skip_validation=True)
+        return
+    for component in warm_start.component_objects(Var):
+        target = model_instance.component(component.local_name)
+        if target is None:
+            continue
+        for index, v in component.items():
+            if v.value is not None and index in target and not target[index].fixed:
+                target[index].set_value(v.value, skip_validation=True)
+
+
+def _warm_basis(repn, warm_start, highspy):
+    # Basis of the previous HiGHS solve mapped onto the columns and rows of this LP, by name when the instance
+    # differs. New columns start at their lower bound and new rows with a basic slack.
+    previous = getattr(warm_start, '_highs_basis', None)
+    if previous is None:
+        return None
+
+    rows = [(row.constraint, row.bound_type) for row in repn.rows]
+    if len(previous['columns']) == len(repn.columns) and len(previous['rows']) == len(rows) \
+            and all(a is b for a, b in zip(previous['columns'], repn.columns)) \
+            and all(a[0] is b[0] and a[1] == b[1] for a, b in zip(previous['rows'], rows)):
+        col_status, row_status = previous['col_status'], previous['row_status']
+    else:
+        col_index = {_key(v): i for i, v in enumerate(previous['columns'])}
+        row_index = {(_key(c), bound_type): i for i, (c, bound_type) in enumerate(previous['rows'])}
+        col_status = [previous['col_status'][col_index[_key(v)]] if _key(v) in col_index
+                      else int(highspy.HighsBasisStatus.kLower) for v in repn.columns]
+        row_status = [previous['row_status'][row_index[(_key(c), bound_type)]] if (_key(c), bound_type) in row_index
+                      else int(highspy.HighsBasisStatus.kBasic) for c, bound_type in rows]
+
+    basis = highspy.HighsBasis()
+    basis.col_status = [highspy.HighsBasisStatus(int(s)) for s in col_status]
+    basis.row_status = [highspy.HighsBasisStatus(int(s)) for s in row_status]
+    basis.valid = True
+    # HiGHS completes or repairs a basis with the wrong number of basic variables
+    basis.alien = True
+    return basis
+
+
+def _solve_highs(model_instance, options, tee, warm_start=None, scaling=False, duals=False):
+    import highspy
+    from pyomo.repn.plugins.standard_form import LinearStandardFormCompiler
+
+    # Rows in mixed form keep their sense: 0 for equalities, 1 for upper and -1 for lower bounds
+    with phase('compile'):
+        repn = LinearStandardFormCompiler().write(model_instance, mixed_form=True)
+    A = repn.A.tocsc()
+    rhs = np.asarray(repn.rhs, dtype=float)
+    sense = np.fromiter((row[1] for row in repn.rows), dtype=np.int64, count=len(repn.rows))
+    bounds = np.array([v.bounds for v in repn.columns], dtype=float).reshape(-1, 2)
+    cost = repn.c.toarray()[0]
+
+    # The LP is solved in scaled variables x/column_scale, with rows multiplied by row_scale
+    row_scale = np.ones(A.shape[0])
+    column_scale = np.ones(A.shape[1])
+    if scaling:
+        from enerthon.scaling import matrix_scaling
+        with phase('scaling'):
+            row_scale, column_scale = matrix_scaling(repn)
+            A = A.tocoo()
+            A.data = A.data*row_scale[A.row]*column_scale[A.col]
+            A = A.tocsc()
+            rhs = rhs*row_scale
+            bounds = bounds/column_scale[:, None]
+            cost = cost*column_scale
+
+    lp = highspy.HighsLp()
+    lp.num_col_ = A.shape[1]
+    lp.num_row_ = A.shape[0]
+    lp.col_cost_ = cost
+    lp.col_lower_ = np.nan_to_num(bounds[:, 0], nan=-highspy.kHighsInf)
+    lp.col_upper_ = np.nan_to_num(bounds[:, 1], nan=highspy.kHighsInf)
+    lp.row_lower_ = np.where(sense == 1, -highspy.kHighsInf, rhs)
+    lp.row_upper_ = np.where(sense == -1, highspy.kHighsInf, rhs)
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = A.indptr
+    lp.a_matrix_.index_ = A.indices
+    lp.a_matrix_.value_ = A.data
+
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', bool(tee))
+    for name, option in options.items():
+        h.setOptionValue(name, option)
+    h.passModel(lp)
+    record(rows=A.shape[0], columns=A.shape[1], nonzeros=A.nnz)
+
+    # Start from the basis of a previous solve, or from the starting values of the variables
+    warm = None
+    if warm_start is not None:
+        basis = _warm_basis(repn, warm_start, highspy)
+        if basis is not None and h.setBasis(basis) == highspy.HighsStatus.kOk:
+            warm = 'basis'
+        else:
+            # Variables without a starting value start at zero, within their bounds
+            start = np.array([np.nan if v.value is None else v.value for v in repn.columns], dtype=float)/column_scale
+            start = np.where(np.isnan(start), np.clip(0.0, lp.col_lower_, lp.col_upper_), start)
+            solution = highspy.HighsSolution()
+            solution.col_value = start
+            solution.value_valid = True
+            if h.setSolution(solution) == highspy.HighsStatus.kOk:
+                warm = 'solution'
+
+    with phase('solver'):
+        h.run()
+
+    status = h.getModelStatus()
+    if h.getInfo().primal_solution_status == 2:
+        primal = np.asarray(h.getSolution().col_value)*column_scale
+        for v, x in zip(repn.columns, primal):
+            v.set_value(x, skip_validation=True)
+        for v, expr in repn.eliminated_vars:
+            v.set_value(value(expr), skip_validation=True)
+        # Kept for Results.from_model(), which reads the solution from the vector instead of the variables
+        model_instance._primal = {'x': primal, 'columns': repn.columns,
+                                  'objective': h.getInfo().objective_function_value + float(repn.c_offset[0])}
+
+    # Duals of the scaled rows are row_scale times smaller, reduced costs of the scaled columns column_scale times
+    # larger. A constraint of two rows gets the dual of the bound that is active.
+    if duals and h.getInfo().dual_solution_status == 2:
+        solution = h.getSolution()
+        for row, y in zip(repn.rows, np.asarray(solution.row_dual)*row_scale):
+            model_instance.dual[row.constraint] = model_instance.dual.get(row.constraint, 0.0) + y
+        for v, d in zip(repn.columns, np.asarray(solution.col_dual)/column_scale):
+            model_instance.rc[v] = d
+
+    # Kept for warm starts of later solves
+    basis = h.getBasis()
+    if basis.valid:
+        model_instance._highs_basis = {'columns': repn.columns,
+                                       'rows': [(row.constraint, row.bound_type) for row in repn.rows],
+                                       'col_status': np.array([int(s) for s in basis.col_status], dtype=np.int8),
+                                       'row_status': np.array([int(s) for s in basis.row_status], dtype=np.int8)}
+
+    info = h.getInfo()
+    iterations = max(info.simplex_iteration_count, 0) + max(info.ipm_iteration_count, 0)
+    return h.modelStatusToString(status).lower(), iterations, h.getRunTime(), warm
+
+
+def _solve_appsi(optimizer, model_instance, tee, duals=False):
+    # Parameter, bound and constraint changes since the previous solve are picked up by the interface
+    optimizer.config.stream_solver = tee
+    optimizer.config.load_solution = False
+    results = optimizer.solve(model_instance)
+
+    if results.best_feasible_objective is not None:
+        results.solution_loader.load_vars()
+        if duals:
+            model_instance.dual.update(results.solution_loader.get_duals())
+            model_instance.rc.update(results.solution_loader.get_reduced_costs())
+
+    info = optimizer._solver_model.getInfo()
+    iterations = max(info.simplex_iteration_count, 0) + max(info.ipm_iteration_count, 0)
+    return results.termination_condition.name, iterations, optimizer._solver_model.getRunTime()
+
+
+# Methods that Pyomo solvers run in solve(): writing the problem file, running the solver and reading its
+# solution, profiled as phases of their own
+SOLVE_STAGES = {'_presolve': 'write', '_apply_solver': 'solver', '_postsolve': 'read'}
+
+
+def _staged(method, name):
+    def wrapper(*args, **kwargs):
+        with phase(name):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def _solve_with_files(optimizer, model_instance, tee, warm_start=None, scaling=False):
+    # Solvers that take starting values, e.g. cplex and gurobi, are warm started from the variable values
+    warm = warm_start is not None and optimizer.warm_start_capable()
+    kwargs = {'warmstart': True} if warm else {}
+
+    # A scaled copy is solved and its solution loaded back
+    instance = model_instance
+    if scaling:
+        from enerthon.scaling import scale_model
+        with phase('scaling'):
+            instance = scale_model(model_instance)
+
+    # While profiling, the stages shadow the methods of the optimizer for this solve. Persistent interfaces have no
+    # file to write, they load the instance in set_instance().
+    persistent = isinstance(optimizer, PersistentSolver)
+    stages = dict(SOLVE_STAGES) if enabled() else dict()
+    if persistent:
+        stages.pop('_presolve', None)
+    for method, name in stages.items():
+        setattr(optimizer, method, _staged(getattr(optimizer, method), name))
+    try:
+        if persistent:
+            # Reload the instance in memory, parameter changes are not tracked by these interfaces
+            with phase('compile'):
+                optimizer.set_instance(instance)
+            results = optimizer.solve(tee=tee, **kwargs)
+        else:
+            results = optimizer.solve(instance, tee=tee, keepfiles=False, **kwargs)
+    finally:
+        for method in stages:
+            delattr(optimizer, method)
+
+    if scaling and str(results.solver.termination_condition) == OPTIMAL:
+        from enerthon.scaling import unscale
+        unscale(instance, model_instance)
+
+    # Not reported by every solver
+    iterations = results.solver.statistics.black_box.number_of_iterations
+    return str(results.solver.termination_condition), iterations, getattr(results.solver, 'time', None), \
+        'solution' if warm else None
+
+
+def clear_values(model_instance):
+    # Starting values of a warm start, or values of an earlier solve, are no solution of a failed solve
+    model_instance._primal = None
+    for v in model_instance.component_data_objects(Var):
+        if not v.fixed:
+            v.set_value(None, skip_validation=True)
+
+
+def _dual_suffixes(model_instance, duals):
+    # Duals and reduced costs of the last solve. The solvers that read the instance import them into the declared
+    # suffixes, scaled copies included.
+    for name in ['dual', 'rc']:
+        suffix = model_instance.component(name)
+        if suffix is not None:
+            suffix.clear()
+        elif duals:
+            model_instance.add_component(name, Suffix(direction=Suffix.IMPORT))
+
+
+@timed('solve_model')
+def solve_model(model_instance, solver, tee=False, warm_start=None):
+    # warm_start is a solved instance, e.g. of a neighbouring scenario, a model_results() dict, or True for the
+    # previous solve of this instance. appsi_highs always starts from its previous solve of the instance.
+    # solver['scaling'] solves the LP with its constraint and variable blocks scaled, see enerthon.scaling.
+    # solver['duals'] imports the duals and reduced costs into the dual and rc suffixes, for the shadow prices of
+    # model_results(), see enerthon.sensitivity.
+    # The primal vector of the previous solve no longer holds the values of the variables
+    model_instance._primal = None
+    if solver['name'] == 'portfolio':
+        from enerthon.portfolio import solve_portfolio
+        return solve_portfolio(model_instance, solver, tee, warm_start)
+
+    start = timer()
+    optimizer = _optimizer(model_instance, solver)
+    name = model_instance._optimizer_solver['name']
+
+    if warm_start is True:
+        warm_start = model_instance if hasattr(model_instance, 'solve_info') else None
+    if warm_start is not None:
+        _load_warm_start(model_instance, warm_start)
+
+    scaling = bool(solver.get('scaling', False))
+    duals = bool(solver.get('duals', False))
+    _dual_suffixes(model_instance, duals)
+    solve_start = timer()
+    if optimizer == 'highs':
+        status, iterations, solver_time, warm = _solve_highs(model_instance, solver.get('options', {}), tee,
+                                                             warm_start, scaling, duals)
+    elif name == 'appsi_highs':
+        if scaling:
+            warnings.warn('appsi_highs keeps the instance loaded and solves it unscaled')
+            scaling = False
+        status, iterations, solver_time = _solve_appsi(optimizer, model_instance, tee, duals)
+        warm = None
     else:
-        optimizer = SolverFactory(solver['name'])
+        status, iterations, solver_time, warm = _solve_with_files(optimizer, model_instance, tee, warm_start,
+                                                                  scaling)
+    end = timer()
+    if status != OPTIMAL:
+        clear_values(model_instance)
+
+    # Iterations of the cold solve that the chain of warm starts began with, an estimate of what the warm start
+    # saved when the instances are neighbours. A failed solve saved nothing.
+    iterations = None if iterations is None else int(iterations)
+    iterations_cold = iterations
+    if warm is not None:
+        previous = getattr(warm_start, 'solve_info', None) or {}
+        iterations_cold = previous.get('iterations_cold')
+    if status != OPTIMAL:
+        iterations_cold = None
+
+    # Solver status, iteration count and timings of the last solve
+    model_instance.solve_info = {
+        'solver': name,
+        'status': status,
+        'iterations': iterations,
+        'time_setup': solve_start - start,
+        'time_solve': end - solve_start,
+        'time_solver': None if solver_time is None else float(solver_time),
+        'warm_start': warm,
+        'scaling': scaling,
+        'duals': duals,
+        'iterations_cold': iterations_cold,
+        'iterations_saved': None if iterations_cold is None or iterations is None else iterations_cold - iterations,
+    }
+
+    if enabled():
+        record(storage=has_storage(model_instance), **model_instance.solve_info)
+        if optimizer != 'highs':
+            with phase('model_size'):
+                size = model_size(model_instance)
+            record(**size)
+
+    return model_instance
+
+
+@timed('update_model')
+def update_model(model_instance, data):
+
+    T = list(model_instance.T)
+
+    for name, new_value in data.items():
+        if name in ['month_order', 'T']:
+            raise ValueError('%s changes the model structure, build a new model instead' % name)
+
+        param = model_instance.component(name)
+        if param is None:
+            raise KeyError('Unknown model parameter: %s' % name)
+        if not param.mutable:
+            raise ValueError('Model was not built with mutable parameters')
+
+        if param.is_indexed():
+            index = list(param.index_set())
+            if isinstance(new_value, dict):
+                param.store_values(new_value)
+            elif len(new_value) != len(index):
+                raise ValueError('%s has %d values, the model has %d' % (name, len(new_value), len(index)))
+            else:
+                param.store_values(dict(zip(index, new_value)))
+        else:
+            param.set_value(new_value)
+
+
+    # Variable limits depend on the capacities, sized capacities limit them through constraints
+    model = model_instance
+    sized = getattr(model, '_sized', [])
+    if getattr(model, '_linked', False):
+        raise ValueError('Representative days linked by their day levels cannot be updated, build a new model')
+    for t in T:
+        if 'battery' not in sized:
+            model.BEL[t].setlb(max(0.0, value(model.battery_min_level*model.battery_capacity)))
+            model.BEL[t].setub(value(model.battery_capacity))
+            model.B_IN[t].setub(value(model.battery_charge_max*model.battery_capacity))
+            model.B_OUT[t].setub(value(model.battery_discharge_max*model.battery_capacity))
+
+        if 'tes' not in sized:
+            model.TES[t].setlb(max(0.0, value(model.tes_min_level*model.tes_capacity)))
+            model.TES[t].setub(value(model.tes_capacity))
+            model.TES_IN[t].setub(value(model.tes_charge_max*model.tes_capacity))
+            model.TES_OUT[t].setub(value(model.tes_discharge_max*model.tes_capacity))
+
+        if 'heat_pump' not in sized:
+            model.Q_HP[t].setub(value(model.heat_pump_capacity))
+        model.Q_BO[t].setub(value(model.boiler_capacity))
+
+    # The compact formulation keeps the power cost maxima at least zero through their bounds
+    floor = 0.0 if getattr(model, '_compact', False) else -np.inf
+    for m in model.M:
+        model.COST_GRID_POWER_IMPORT_MAX[m].setlb(max(floor, value(model.grid_power_import_max_ini[m])))
+        model.COST_GRID_POWER_EXPORT_MAX[m].setlb(max(floor, value(model.grid_power_export_max_ini[m])))
+
+
+    # Battery charging from grid
+    if value(model.battery_grid_charging) == False:
+        model.no_grid_charging.activate()
+    else:
+        model.no_grid_charging.deactivate()
+
+
+    # Fix battery and tes soc in the last period
+    if 'battery' in sized:
+        if value(model.bel_fin_level) > 0:
+            model.battery_final_level.activate()
+        else:
+            model.battery_final_level.deactivate()
+    elif value(model.bel_fin_level) > 0:
+        model.BEL[model.T.last()].fix(value(model.bel_fin_level*model.battery_capacity))
+    else:
+        model.BEL[model.T.last()].unfix()
+
+    if 'tes' in sized:
+        if value(model.tes_fin_level) > 0:
+            model.tes_final_level.activate()
+        else:
+            model.tes_final_level.deactivate()
+    elif value(model.tes_fin_level) > 0:
+        model.TES[model.T.last()].fix(value(model.tes_fin_level*model.tes_capacity))
+    else:
+        model.TES[model.T.last()].unfix()
 
-    optimizer.solve(model_instance, tee=True, keepfiles=False)
 
     return model_instance
 
 
-def model(model_data):
+def _sized(sizing):
+    # sizing is True for all capacities in SIZING, or a list of them
+    sized = list(SIZING) if sizing is True else list(sizing or [])
+    unknown = set(sized) - set(SIZING)
+    if unknown:
+        raise ValueError('Unknown capacities to size: %s' % ', '.join(sorted(unknown)))
+    return sized
+
+
+def has_storage(model_instance):
+    # Battery or thermal storage in the instance, sized capacities count as storage
+    if getattr(model_instance, '_sized', []):
+        return True
+    return value(model_instance.battery_capacity) > 0 or value(model_instance.tes_capacity) > 0
+
+
+def horizon_years(model_data):
+    # Length of the horizon in years, represented periods are counted with their weight
+    return float(np.sum(_series(model_data, 'weight')*model_data[None]['dt'])/HOURS_PER_YEAR)
+
+
+@timed('model')
+def model(model_data, mutable=False, sizing=False, compact=False):
 
 
     model = ConcreteModel()
+    sized = _sized(sizing)
+    model._sized = sized
+    model._compact = compact
+
+    # Time series are arrays over the periods, Params and rules index them with t-1
+    def series(name):
+        values = _series(model_data, name)
+        return lambda model, t: values[t-1]
+
+    # Params with one value for all periods or one per period, e.g. dt of a variable time grid
+    def period_param(name):
+        if np.ndim(model_data[None][name]) > 0:
+            return Param(model.T, initialize=series(name), mutable=mutable)
+        return Param(initialize=model_data[None][name], mutable=mutable)
+
+    def duration(t):
+        return model.dt[t] if model.dt.is_indexed() else model.dt
+
+    def losses(t):
+        return model.tes_losses[t] if model.tes_losses.is_indexed() else model.tes_losses
+
+    month_order = _series(model_data, 'month_order', np.int64)
+    previous_period = _series(model_data, 'previous_period', np.int64)
+    # Kept for the shadow prices of the storage balances and monthly peaks, see enerthon.sensitivity
+    model._month_order = month_order
+    model._previous_period = previous_period
+
+    # Representative days of enerthon.aggregation, linked through the storage levels at the start of every calendar
+    # day. The levels of the periods are then relative to the level at the start of their day.
+    day_sequence = model_data[None]['day_sequence']
+    linked = day_sequence is not None
+    model._linked = linked
+    if linked:
+        day_sequence = day_sequence.tolist()
+        n_representatives = max(day_sequence)
+        periods_per_day = len(model_data[None]['T'])//n_representatives
+
+        def representative(t):
+            return (t-1)//periods_per_day + 1
+
+        def last_period(d):
+            return int(day_sequence[d-1])*periods_per_day
+
 
     ## SETS
     model.T = Set(dimen=1, ordered=True, initialize=model_data[None]['T']) # Periods
-    model.M = Set(dimen=1, ordered=True, initialize=np.array(list(set(model_data[None]['month_order'].values())))) # Months
+    model.M = Set(dimen=1, ordered=True, initialize=np.unique(month_order).tolist()) # Months
+    if linked:
+        model.R = Set(dimen=1, ordered=True, initialize=range(1, n_representatives+1)) # Representative days
+        model.D = Set(dimen=1, ordered=True, initialize=range(1, len(day_sequence)+2)) # Day starts and the end
 
 
 
     ## PARAMETERS
-    model.demand                        = Param(model.T, within=Reals, initialize=model_data[None]['demand'])
-    model.generation                    = Param(model.T, initialize=model_data[None]['generation'])
-    model.heat_demand                   = Param(model.T, within=Reals, initialize=model_data[None]['heat_demand'])
-
-    model.battery_min_level             = Param(initialize=model_data[None]['battery_min_level'])
-    model.battery_capacity              = Param(initialize=model_data[None]['battery_capacity'])
-    model.battery_charge_max            = Param(initialize=model_data[None]['battery_charge_max'])
-    model.battery_discharge_max         = Param(initialize=model_data[None]['battery_discharge_max'])
-    model.battery_efficiency_charge     = Param(initialize=model_data[None]['battery_efficiency_charge'])
-    model.battery_efficiency_discharge  = Param(initialize=model_data[None]['battery_efficiency_discharge'])
-    model.bel_ini_level                 = Param(initialize=model_data[None]['bel_ini_level'])
-    model.bel_fin_level                 = Param(initialize=model_data[None]['bel_fin_level'])
-    model.battery_grid_charging         = Param(initialize=model_data[None]['battery_grid_charging'])
+    model.demand                        = Param(model.T, within=Reals, initialize=series('demand'), mutable=mutable)
+    model.generation                    = Param(model.T, initialize=series('generation'), mutable=mutable)
+    model.heat_demand                   = Param(model.T, within=Reals, initialize=series('heat_demand'), mutable=mutable)
+    model.weight                        = Param(model.T, within=Reals, initialize=series('weight'), mutable=mutable)
+
+    model.battery_min_level             = Param(initialize=model_data[None]['battery_min_level'], mutable=mutable)
+    model.battery_capacity              = Param(initialize=model_data[None]['battery_capacity'], mutable=mutable)
+    model.battery_charge_max            = Param(initialize=model_data[None]['battery_charge_max'], mutable=mutable)
+    model.battery_discharge_max         = Param(initialize=model_data[None]['battery_discharge_max'], mutable=mutable)
+    model.battery_efficiency_charge     = Param(initialize=model_data[None]['battery_efficiency_charge'], mutable=mutable)
+    model.battery_efficiency_discharge  = Param(initialize=model_data[None]['battery_efficiency_discharge'], mutable=mutable)
+    model.bel_ini_level                 = Param(initialize=model_data[None]['bel_ini_level'], mutable=mutable)
+    model.bel_fin_level                 = Param(initialize=model_data[None]['bel_fin_level'], mutable=mutable)
+    model.battery_grid_charging         = Param(initialize=model_data[None]['battery_grid_charging'], mutable=mutable)
     
-    model.energy_price_buy              = Param(model.T, initialize=model_data[None]['energy_price_buy'])
-    model.energy_price_sell             = Param(model.T, initialize=model_data[None]['energy_price_sell'])
+    model.energy_price_buy              = Param(model.T, initialize=series('energy_price_buy'), mutable=mutable)
+    model.energy_price_sell             = Param(model.T, initialize=series('energy_price_sell'), mutable=mutable)
     
-    model.grid_fixed_fee                = Param(initialize=model_data[None]['grid_fixed_fee'])
-    model.grid_energy_import_fee        = Param(model.T, within=Reals, initialize=model_data[None]['grid_energy_import_fee'])
-    model.grid_energy_export_fee        = Param(model.T, within=Reals, initialize=model_data[None]['grid_energy_export_fee'])
+    model.grid_fixed_fee                = Param(initialize=model_data[None]['grid_fixed_fee'], mutable=mutable)
+    model.grid_energy_import_fee        = Param(model.T, within=Reals, initialize=series('grid_energy_import_fee'), mutable=mutable)
+    model.grid_energy_export_fee        = Param(model.T, within=Reals, initialize=series('grid_energy_export_fee'), mutable=mutable)
     
-    model.grid_power_import_fee         = Param(model.T, within=Reals, initialize=model_data[None]['grid_power_import_fee'])
-    model.grid_power_export_fee         = Param(model.T, within=Reals, initialize=model_data[None]['grid_power_export_fee'])
+    model.grid_power_import_fee         = Param(model.T, within=Reals, initialize=series('grid_power_import_fee'), mutable=mutable)
+    model.grid_power_export_fee         = Param(model.T, within=Reals, initialize=series('grid_power_export_fee'), mutable=mutable)
+    model.grid_power_import_max_ini     = Param(model.M, within=Reals, initialize=model_data[None]['grid_power_import_max_ini'], default=0, mutable=mutable)
+    model.grid_power_export_max_ini     = Param(model.M, within=Reals, initialize=model_data[None]['grid_power_export_max_ini'], default=0, mutable=mutable)
     
-    model.fuel_price                    = Param(initialize=model_data[None]['fuel_price'])
+    model.fuel_price                    = Param(initialize=model_data[None]['fuel_price'], mutable=mutable)
     
-    model.boiler_capacity               = Param(initialize=model_data[None]['boiler_capacity'])
-    model.boiler_efficiency             = Param(initialize=model_data[None]['boiler_efficiency'])
-    model.heat_pump_capacity            = Param(initialize=model_data[None]['heat_pump_capacity'])
-    model.heat_pump_cop                 = Param(initialize=model_data[None]['heat_pump_cop'])
+    model.boiler_capacity               = Param(initialize=model_data[None]['boiler_capacity'], mutable=mutable)
+    model.boiler_efficiency             = Param(initialize=model_data[None]['boiler_efficiency'], mutable=mutable)
+    model.heat_pump_capacity            = Param(initialize=model_data[None]['heat_pump_capacity'], mutable=mutable)
+    model.heat_pump_cop                 = Param(initialize=model_data[None]['heat_pump_cop'], mutable=mutable)
     
-    model.tes_min_level                 = Param(initialize=model_data[None]['tes_min_level'])
-    model.tes_capacity                  = Param(initialize=model_data[None]['tes_capacity'])
-    model.tes_charge_max                = Param(initialize=model_data[None]['tes_charge_max'])
-    model.tes_discharge_max             = Param(initialize=model_data[None]['tes_discharge_max'])
-    model.tes_losses                    = Param(initialize=model_data[None]['tes_losses'])
-    model.tes_ini_level                 = Param(initialize=model_data[None]['tes_ini_level'])
-    model.tes_fin_level                 = Param(initialize=model_data[None]['tes_fin_level'])
+    model.tes_min_level                 = Param(initialize=model_data[None]['tes_min_level'], mutable=mutable)
+    model.tes_capacity                  = Param(initialize=model_data[None]['tes_capacity'], mutable=mutable)
+    model.tes_charge_max                = Param(initialize=model_data[None]['tes_charge_max'], mutable=mutable)
+    model.tes_discharge_max             = Param(initialize=model_data[None]['tes_discharge_max'], mutable=mutable)
+    model.tes_losses                    = period_param('tes_losses')
+    model.tes_ini_level                 = Param(initialize=model_data[None]['tes_ini_level'], mutable=mutable)
+    model.tes_fin_level                 = Param(initialize=model_data[None]['tes_fin_level'], mutable=mutable)
+
+    model.dt                            = period_param('dt')
 
-    model.dt                            = Param(initialize=model_data[None]['dt'])
+    model.battery_investment_cost       = Param(initialize=model_data[None]['battery_investment_cost'], mutable=mutable)
+    model.tes_investment_cost           = Param(initialize=model_data[None]['tes_investment_cost'], mutable=mutable)
+    model.heat_pump_investment_cost     = Param(initialize=model_data[None]['heat_pump_investment_cost'], mutable=mutable)
 
 
 
@@ -93,42 +640,88 @@ def model(model_data):
     def boiler_limits(model, t):
         return (0.0, model.boiler_capacity)
 
+    # Power cost already incurred in the month, e.g. by the committed periods of a rolling horizon. The compact
+    # formulation has no per-period power costs, which are at least zero, so the bound holds that limit.
+    def power_import_max_limits(model, m):
+        if compact:
+            return (max(0.0, value(model.grid_power_import_max_ini[m])), None)
+        return (model.grid_power_import_max_ini[m], None)
+    def power_export_max_limits(model, m):
+        if compact:
+            return (max(0.0, value(model.grid_power_export_max_ini[m])), None)
+        return (model.grid_power_export_max_ini[m], None)
+
 
     ## VARIABLES
-    model.COST_ENERGY                   = Var(model.T, within=Reals)
-    model.COST_GRID_ENERGY_IMPORT       = Var(model.T, within=Reals)
-    model.COST_GRID_ENERGY_EXPORT       = Var(model.T, within=Reals)
-    model.COST_GRID_POWER_IMPORT        = Var(model.T, within=NonNegativeReals)
-    model.COST_GRID_POWER_EXPORT        = Var(model.T, within=NonNegativeReals)
-    model.COST_GRID_POWER_IMPORT_MAX    = Var(model.M, within=Reals)
-    model.COST_GRID_POWER_EXPORT_MAX    = Var(model.M, within=Reals)
+    # The compact formulation has no per-period cost variables, nor heat pump power and boiler fuel, they are
+    # expressions in the objective and the balances and are reconstructed by model_results()
+    if not compact:
+        model.COST_ENERGY               = Var(model.T, within=Reals)
+        model.COST_GRID_ENERGY_IMPORT   = Var(model.T, within=Reals)
+        model.COST_GRID_ENERGY_EXPORT   = Var(model.T, within=Reals)
+        model.COST_GRID_POWER_IMPORT    = Var(model.T, within=NonNegativeReals)
+        model.COST_GRID_POWER_EXPORT    = Var(model.T, within=NonNegativeReals)
+        model.COST_FUEL                 = Var(model.T, within=Reals)
+    model.COST_GRID_POWER_IMPORT_MAX    = Var(model.M, within=Reals, bounds=power_import_max_limits)
+    model.COST_GRID_POWER_EXPORT_MAX    = Var(model.M, within=Reals, bounds=power_export_max_limits)
     model.COST_GRID_FIXED               = Var(within=Reals)
-    model.COST_FUEL                     = Var(model.T, within=Reals)
     
     model.P_BUY                         = Var(model.T, within=NonNegativeReals)
     model.P_SELL                        = Var(model.T, within=NonNegativeReals)
     
-    model.BEL                           = Var(model.T, within=NonNegativeReals, bounds=soc_limits)
-    model.B_IN                          = Var(model.T, within=NonNegativeReals, bounds=charge_limits)
-    model.B_OUT                         = Var(model.T, within=NonNegativeReals, bounds=discharge_limits)
+    model.BEL                           = Var(model.T, within=Reals if linked else NonNegativeReals, bounds=None if 'battery' in sized or linked else soc_limits)
+    model.B_IN                          = Var(model.T, within=NonNegativeReals, bounds=None if 'battery' in sized else charge_limits)
+    model.B_OUT                         = Var(model.T, within=NonNegativeReals, bounds=None if 'battery' in sized else discharge_limits)
+
+    model.TES                           = Var(model.T, within=Reals if linked else NonNegativeReals, bounds=None if 'tes' in sized or linked else tes_limits)
+    model.TES_IN                        = Var(model.T, within=NonNegativeReals, bounds=None if 'tes' in sized else tes_charge_limits)
+    model.TES_OUT                       = Var(model.T, within=NonNegativeReals, bounds=None if 'tes' in sized else tes_discharge_limits)
+
+    model.Q_HP                          = Var(model.T, within=NonNegativeReals, bounds=None if 'heat_pump' in sized else heat_pump_limits)
+
+    # Storage levels at the start of the calendar days and at the end of the horizon, and the range of the relative
+    # levels of every representative day, which starts at zero
+    if linked:
+        model.BEL_DAY                   = Var(model.D, within=NonNegativeReals, bounds=None if 'battery' in sized else soc_limits)
+        model.BEL_MAX                   = Var(model.R, bounds=(0.0, None))
+        model.BEL_MIN                   = Var(model.R, bounds=(None, 0.0))
+        model.TES_DAY                   = Var(model.D, within=NonNegativeReals, bounds=None if 'tes' in sized else tes_limits)
+        model.TES_MAX                   = Var(model.R, bounds=(0.0, None))
+        model.TES_MIN                   = Var(model.R, bounds=(None, 0.0))
+    model.Q_BO                          = Var(model.T, within=NonNegativeReals, bounds=boiler_limits)
+    if not compact:
+        model.P_HP                      = Var(model.T, within=NonNegativeReals)
+        model.F_BO                      = Var(model.T, within=NonNegativeReals)
 
-    model.TES                           = Var(model.T, within=NonNegativeReals, bounds=tes_limits)
-    model.TES_IN                        = Var(model.T, within=NonNegativeReals, bounds=tes_charge_limits)
-    model.TES_OUT                       = Var(model.T, within=NonNegativeReals, bounds=tes_discharge_limits)
+    # Sized capacities, bounded by the optional upper limits
+    def capacity_max_limits(name):
+        return (0.0, model_data[None]['%s_capacity_max' % name])
 
-    model.Q_HP                          = Var(model.T, within=NonNegativeReals, bounds=heat_pump_limits)
-    model.P_HP                          = Var(model.T, within=NonNegativeReals)
+    for name in sized:
+        model.add_component(CAPACITY_VARIABLES[name], Var(within=NonNegativeReals, bounds=capacity_max_limits(name)))
+    if sized:
+        model.COST_INVESTMENT           = Var(within=Reals)
 
-    model.Q_BO                          = Var(model.T, within=NonNegativeReals, bounds=boiler_limits)
-    model.F_BO                          = Var(model.T, within=NonNegativeReals)
+    battery_capacity = model.BATTERY_CAPACITY if 'battery' in sized else model.battery_capacity
+    tes_capacity = model.TES_CAPACITY if 'tes' in sized else model.tes_capacity
+
+    def heat_pump_power(model, t):
+        return model.Q_HP[t]/model.heat_pump_cop if compact else model.P_HP[t]
 
 
     ## OBJECTIVE
     # Minimize cost
     def total_cost(model):
-        return sum(model.COST_ENERGY[t] + model.COST_GRID_ENERGY_IMPORT[t] + model.COST_GRID_ENERGY_EXPORT[t] for t in model.T) \
+        if compact:
+            return sum(model.weight[t]*duration(t)*((model.energy_price_buy[t] + model.grid_energy_import_fee[t])*model.P_BUY[t]
+                                                 - (model.energy_price_sell[t] - model.grid_energy_export_fee[t])*model.P_SELL[t]
+                                                 + model.fuel_price*model.Q_BO[t]/model.boiler_efficiency) for t in model.T) \
+            + sum(model.COST_GRID_POWER_IMPORT_MAX[m] + model.COST_GRID_POWER_EXPORT_MAX[m] for m in model.M) + model.COST_GRID_FIXED \
+            + (model.COST_INVESTMENT if sized else 0)
+        return sum(model.weight[t]*(model.COST_ENERGY[t] + model.COST_GRID_ENERGY_IMPORT[t] + model.COST_GRID_ENERGY_EXPORT[t]) for t in model.T) \
         + sum(model.COST_GRID_POWER_IMPORT_MAX[m] + model.COST_GRID_POWER_EXPORT_MAX[m] for m in model.M) + model.COST_GRID_FIXED \
-        + sum(model.COST_FUEL[t] for t in model.T)
+        + sum(model.weight[t]*model.COST_FUEL[t] for t in model.T) \
+        + (model.COST_INVESTMENT if sized else 0)
     model.total_cost = Objective(rule=total_cost, sense=minimize)
 
 
@@ -137,8 +730,9 @@ def model(model_data):
     ## CONSTRAINTS
     # Energy cost
     def energy_cost(model, t):
-        return model.COST_ENERGY[t] == model.energy_price_buy[t]*model.P_BUY[t]*model.dt - model.energy_price_sell[t]*model.P_SELL[t]*model.dt
-    model.energy_cost = Constraint(model.T, rule=energy_cost)
+        return model.COST_ENERGY[t] == model.energy_price_buy[t]*model.P_BUY[t]*duration(t) - model.energy_price_sell[t]*model.P_SELL[t]*duration(t)
+    if not compact:
+        model.energy_cost = Constraint(model.T, rule=energy_cost)
 
 
 
@@ -151,46 +745,60 @@ def model(model_data):
 
     # Grid energy import cost
     def grid_energy_import_cost(model, t):
-        return model.COST_GRID_ENERGY_IMPORT[t] == model.grid_energy_import_fee[t]*model.P_BUY[t]*model.dt
-    model.grid_energy_import_cost = Constraint(model.T, rule=grid_energy_import_cost)
+        return model.COST_GRID_ENERGY_IMPORT[t] == model.grid_energy_import_fee[t]*model.P_BUY[t]*duration(t)
+    if not compact:
+        model.grid_energy_import_cost = Constraint(model.T, rule=grid_energy_import_cost)
     
     # Grid energy export cost
     def grid_energy_export_cost(model, t):
-        return model.COST_GRID_ENERGY_EXPORT[t] == model.grid_energy_export_fee[t]*model.P_SELL[t]*model.dt
-    model.grid_energy_export_cost = Constraint(model.T, rule=grid_energy_export_cost)
+        return model.COST_GRID_ENERGY_EXPORT[t] == model.grid_energy_export_fee[t]*model.P_SELL[t]*duration(t)
+    if not compact:
+        model.grid_energy_export_cost = Constraint(model.T, rule=grid_energy_export_cost)
 
 
 
     # Grid power import cost
     def grid_power_import_cost(model, t):
         return model.COST_GRID_POWER_IMPORT[t] >= model.grid_power_import_fee[t]*(model.P_BUY[t]-model.P_SELL[t])
-    model.grid_power_import_cost = Constraint(model.T, rule=grid_power_import_cost)
+    if not compact:
+        model.grid_power_import_cost = Constraint(model.T, rule=grid_power_import_cost)
     
     # Grid power export cost
     def grid_power_export_cost(model, t):
         return model.COST_GRID_POWER_EXPORT[t] >= model.grid_power_export_fee[t]*(model.P_SELL[t]-model.P_BUY[t])
-    model.grid_power_export_cost = Constraint(model.T, rule=grid_power_export_cost)
+    if not compact:
+        model.grid_power_export_cost = Constraint(model.T, rule=grid_power_export_cost)
 
-    # Max grid import cost
+    # Max grid import cost, bounded by the power cost of every period directly in the compact formulation. Periods
+    # without fee give no row, unless the fee can be changed by update_model.
     def max_grid_power_import_cost(model, t):
-        return model.COST_GRID_POWER_IMPORT_MAX[model_data[None]['month_order'][t]] >= model.COST_GRID_POWER_IMPORT[t]
+        if compact:
+            if not mutable and value(model.grid_power_import_fee[t]) == 0:
+                return Constraint.Skip
+            return model.COST_GRID_POWER_IMPORT_MAX[int(month_order[t-1])] >= model.grid_power_import_fee[t]*(model.P_BUY[t]-model.P_SELL[t])
+        return model.COST_GRID_POWER_IMPORT_MAX[int(month_order[t-1])] >= model.COST_GRID_POWER_IMPORT[t]
     model.max_grid_power_import_cost = Constraint(model.T, rule=max_grid_power_import_cost)
 
     # Max grid export cost
     def max_grid_power_export_cost(model, t):
-        return model.COST_GRID_POWER_EXPORT_MAX[model_data[None]['month_order'][t]] >= model.COST_GRID_POWER_EXPORT[t]
+        if compact:
+            if not mutable and value(model.grid_power_export_fee[t]) == 0:
+                return Constraint.Skip
+            return model.COST_GRID_POWER_EXPORT_MAX[int(month_order[t-1])] >= model.grid_power_export_fee[t]*(model.P_SELL[t]-model.P_BUY[t])
+        return model.COST_GRID_POWER_EXPORT_MAX[int(month_order[t-1])] >= model.COST_GRID_POWER_EXPORT[t]
     model.max_grid_power_export_cost = Constraint(model.T, rule=max_grid_power_export_cost)
 
 
     # Fuel cost
     def fuel_cost(model, t):
-        return model.COST_FUEL[t] == model.fuel_price*model.F_BO[t]*model.dt
-    model.fuel_cost = Constraint(model.T, rule=fuel_cost)
+        return model.COST_FUEL[t] == model.fuel_price*model.F_BO[t]*duration(t)
+    if not compact:
+        model.fuel_cost = Constraint(model.T, rule=fuel_cost)
 
 
     # Power balance
     def power_balance(model, t):
-        return model.P_SELL[t] - model.P_BUY[t] ==  model.generation[t] + model.B_OUT[t] - model.B_IN[t] - model.demand[t] - model.P_HP[t]
+        return model.P_SELL[t] - model.P_BUY[t] ==  model.generation[t] + model.B_OUT[t] - model.B_IN[t] - model.demand[t] - heat_pump_power(model, t)
     model.power_balance = Constraint(model.T, rule=power_balance)
 
 
@@ -202,76 +810,263 @@ def model(model_data):
 
     # Battery energy balance
     def battery_soc(model, t):
-        if t==model.T.first():
-            return model.BEL[t] - model.bel_ini_level*model.battery_capacity == model.battery_efficiency_charge*model.B_IN[t]*model.dt  - (1/model.battery_efficiency_discharge)*model.B_OUT[t]*model.dt
+        if previous_period[t-1] == 0:
+            return model.BEL[t] - (0 if linked else model.bel_ini_level*battery_capacity) == model.battery_efficiency_charge*model.B_IN[t]*duration(t)  - (1/model.battery_efficiency_discharge)*model.B_OUT[t]*duration(t)
         else:
-            return model.BEL[t] - model.BEL[model.T.prev(t)] == model.battery_efficiency_charge*model.B_IN[t]*model.dt  - (1/model.battery_efficiency_discharge)*model.B_OUT[t]*model.dt
+            return model.BEL[t] - model.BEL[previous_period[t-1]] == model.battery_efficiency_charge*model.B_IN[t]*duration(t)  - (1/model.battery_efficiency_discharge)*model.B_OUT[t]*duration(t)
     model.battery_soc = Constraint(model.T, rule=battery_soc)
 
 
     # Heat storage energy balance
     def heat_storage_soc(model, t):
-        if t==model.T.first():
-            return model.TES[t] - (1-model.tes_losses)*model.tes_ini_level*model.tes_capacity == model.TES_IN[t]*model.dt - model.TES_OUT[t]*model.dt
+        if previous_period[t-1] == 0:
+            return model.TES[t] - (0 if linked else (1-losses(t))*model.tes_ini_level*tes_capacity) == model.TES_IN[t]*duration(t) - model.TES_OUT[t]*duration(t)
         else:
-            return model.TES[t] - (1-model.tes_losses)*model.TES[model.T.prev(t)] == model.TES_IN[t]*model.dt - model.TES_OUT[t]*model.dt
+            return model.TES[t] - (1-losses(t))*model.TES[previous_period[t-1]] == model.TES_IN[t]*duration(t) - model.TES_OUT[t]*duration(t)
     model.heat_storage_soc = Constraint(model.T, rule=heat_storage_soc)
 
 
+    # Storage levels of the calendar days, the level at the start of a day plus the relative level of its
+    # representative day. The thermal storage level decays over the day with its retention. The range of the
+    # relative levels keeps every level within the limits, assuming the decay at its largest for the minimum.
+    if linked:
+        retention = np.ones(n_representatives)
+        for t in model.T:
+            retention[representative(t)-1] *= 1 - value(losses(t))
+
+        model.battery_initial_level = Constraint(expr=model.BEL_DAY[1] == model.bel_ini_level*battery_capacity)
+        model.tes_initial_level = Constraint(expr=model.TES_DAY[1] == model.tes_ini_level*tes_capacity)
+
+        def battery_day(model, d):
+            if d == model.D.last():
+                return Constraint.Skip
+            return model.BEL_DAY[d+1] == model.BEL_DAY[d] + model.BEL[last_period(d)]
+        model.battery_day = Constraint(model.D, rule=battery_day)
+
+        def tes_day(model, d):
+            if d == model.D.last():
+                return Constraint.Skip
+            return model.TES_DAY[d+1] == retention[day_sequence[d-1]-1]*model.TES_DAY[d] + model.TES[last_period(d)]
+        model.tes_day = Constraint(model.D, rule=tes_day)
+
+        def battery_relative_max(model, t):
+            return model.BEL[t] <= model.BEL_MAX[representative(t)]
+        model.battery_relative_max = Constraint(model.T, rule=battery_relative_max)
+
+        def battery_relative_min(model, t):
+            return model.BEL[t] >= model.BEL_MIN[representative(t)]
+        model.battery_relative_min = Constraint(model.T, rule=battery_relative_min)
+
+        def tes_relative_max(model, t):
+            return model.TES[t] <= model.TES_MAX[representative(t)]
+        model.tes_relative_max = Constraint(model.T, rule=tes_relative_max)
+
+        def tes_relative_min(model, t):
+            return model.TES[t] >= model.TES_MIN[representative(t)]
+        model.tes_relative_min = Constraint(model.T, rule=tes_relative_min)
+
+        def battery_day_max(model, d):
+            if d == model.D.last():
+                return Constraint.Skip
+            return model.BEL_DAY[d] + model.BEL_MAX[day_sequence[d-1]] <= battery_capacity
+        model.battery_day_max = Constraint(model.D, rule=battery_day_max)
+
+        def battery_day_min(model, d):
+            if d == model.D.last():
+                return Constraint.Skip
+            return model.BEL_DAY[d] + model.BEL_MIN[day_sequence[d-1]] >= model.battery_min_level*battery_capacity
+        model.battery_day_min = Constraint(model.D, rule=battery_day_min)
+
+        def tes_day_max(model, d):
+            if d == model.D.last():
+                return Constraint.Skip
+            return model.TES_DAY[d] + model.TES_MAX[day_sequence[d-1]] <= tes_capacity
+        model.tes_day_max = Constraint(model.D, rule=tes_day_max)
+
+        def tes_day_min(model, d):
+            if d == model.D.last():
+                return Constraint.Skip
+            r = day_sequence[d-1]
+            return retention[r-1]*model.TES_DAY[d] + model.TES_MIN[r] >= model.tes_min_level*tes_capacity
+        model.tes_day_min = Constraint(model.D, rule=tes_day_min)
+
+
     # Battery charging from grid
     def no_grid_charging(model, t):
-        if value(model.battery_grid_charging) == False:
-            return model.P_BUY[t] <= model.demand[t] + model.P_HP[t] 
+        if mutable or value(model.battery_grid_charging) == False:
+            return model.P_BUY[t] <= model.demand[t] + heat_pump_power(model, t)
         else:
             return Constraint.Skip
     model.no_grid_charging = Constraint(model.T, rule=no_grid_charging)
 
+    # Keep the constraint in mutable models so grid charging can be switched by update_model
+    if mutable and value(model.battery_grid_charging) == True:
+        model.no_grid_charging.deactivate()
+
 
     # Fuel boiler
     def fuel_boiler_gen(model, t):
         return model.F_BO[t] == (1/model.boiler_efficiency)*model.Q_BO[t]
-    model.fuel_boiler_gen = Constraint(model.T, rule=fuel_boiler_gen)
+    if not compact:
+        model.fuel_boiler_gen = Constraint(model.T, rule=fuel_boiler_gen)
 
 
     # Heat pump
     def heat_pump_gen(model, t):
         return model.Q_HP[t] == model.heat_pump_cop*model.P_HP[t]
-    model.heat_pump_gen = Constraint(model.T, rule=heat_pump_gen)
+    if not compact:
+        model.heat_pump_gen = Constraint(model.T, rule=heat_pump_gen)
     
     
     
 
-    # Fix battery soc in the last period
-    if value(model.bel_fin_level) > 0:
-        model.BEL[model.T.last()].fix(model.bel_fin_level*model.battery_capacity)
+    # Investment cost of the sized capacities over the horizon
+    if sized:
+        years = horizon_years(model_data)
+        def investment_cost(model):
+            return model.COST_INVESTMENT == years*sum(model.component('%s_investment_cost' % name)
+                                                      *model.component(CAPACITY_VARIABLES[name]) for name in sized)
+        model.investment_cost = Constraint(rule=investment_cost)
+
+
+    # Limits in the sized capacities, as constraints instead of variable bounds
+    # Linked representative days limit the levels at the day starts, the relative levels are limited above.
+    battery_levels = model.BEL_DAY if linked else model.BEL
+    tes_levels = model.TES_DAY if linked else model.TES
+    if 'battery' in sized:
+        def battery_level_min(model, t):
+            return battery_levels[t] >= model.battery_min_level*model.BATTERY_CAPACITY
+        model.battery_level_min = Constraint(battery_levels.index_set(), rule=battery_level_min)
+
+        def battery_level_max(model, t):
+            return battery_levels[t] <= model.BATTERY_CAPACITY
+        model.battery_level_max = Constraint(battery_levels.index_set(), rule=battery_level_max)
+
+        def battery_charge_limit(model, t):
+            return model.B_IN[t] <= model.battery_charge_max*model.BATTERY_CAPACITY
+        model.battery_charge_limit = Constraint(model.T, rule=battery_charge_limit)
+
+        def battery_discharge_limit(model, t):
+            return model.B_OUT[t] <= model.battery_discharge_max*model.BATTERY_CAPACITY
+        model.battery_discharge_limit = Constraint(model.T, rule=battery_discharge_limit)
+
+    if 'tes' in sized:
+        def tes_level_min(model, t):
+            return tes_levels[t] >= model.tes_min_level*model.TES_CAPACITY
+        model.tes_level_min = Constraint(tes_levels.index_set(), rule=tes_level_min)
+
+        def tes_level_max(model, t):
+            return tes_levels[t] <= model.TES_CAPACITY
+        model.tes_level_max = Constraint(tes_levels.index_set(), rule=tes_level_max)
+
+        def tes_charge_limit(model, t):
+            return model.TES_IN[t] <= model.tes_charge_max*model.TES_CAPACITY
+        model.tes_charge_limit = Constraint(model.T, rule=tes_charge_limit)
+
+        def tes_discharge_limit(model, t):
+            return model.TES_OUT[t] <= model.tes_discharge_max*model.TES_CAPACITY
+        model.tes_discharge_limit = Constraint(model.T, rule=tes_discharge_limit)
+
+    if 'heat_pump' in sized:
+        def heat_pump_limit(model, t):
+            return model.Q_HP[t] <= model.HEAT_PUMP_CAPACITY
+        model.heat_pump_limit = Constraint(model.T, rule=heat_pump_limit)
+
+
+
+
+    # Fix battery soc in the last period, through a constraint when the capacity is sized
+    battery_final = battery_levels[battery_levels.index_set().last()]
+    if 'battery' in sized:
+        model.battery_final_level = Constraint(expr=battery_final == model.bel_fin_level*model.BATTERY_CAPACITY)
+        if value(model.bel_fin_level) <= 0:
+            model.battery_final_level.deactivate()
+    elif value(model.bel_fin_level) > 0:
+        battery_final.fix(value(model.bel_fin_level*model.battery_capacity))
 
     
     # Fix tes soc in the last period
-    if value(model.tes_fin_level) > 0:
-        model.TES[model.T.last()].fix(model.tes_fin_level*model.tes_capacity)
+    tes_final = tes_levels[tes_levels.index_set().last()]
+    if 'tes' in sized:
+        model.tes_final_level = Constraint(expr=tes_final == model.tes_fin_level*model.TES_CAPACITY)
+        if value(model.tes_fin_level) <= 0:
+            model.tes_final_level.deactivate()
+    elif value(model.tes_fin_level) > 0:
+        tes_final.fix(value(model.tes_fin_level*model.tes_capacity))
     
 
     return model
 
 
-def model_input(data):
+def _array(data, name, n, dtype=np.float64):
+    # Validate a time series and return it as a contiguous array, without copying float64 input
+    values = np.asarray(data[name])
+    if values.ndim != 1 or len(values) != n:
+        raise ValueError('%s must be a series of %d values, got shape %s' % (name, n, values.shape))
+    if values.dtype.kind not in 'biuf':
+        raise ValueError('%s must be numeric, got dtype %s' % (name, values.dtype))
+    if values.dtype.kind == 'f' and not np.isfinite(values).all():
+        raise ValueError('%s contains NaN or infinite values' % name)
+    if np.dtype(dtype).kind == 'i' and values.dtype.kind == 'f' and np.any(values != np.round(values)):
+        raise ValueError('%s must contain integers' % name)
+    return np.ascontiguousarray(values, dtype=dtype)
+
+
+def _series(model_data, name, dtype=np.float64):
+    # Model data series as arrays over the periods, dicts keyed by period are still accepted. Shared by the
+    # matrix model and the closed form.
+    series = model_data[None][name]
+    if isinstance(series, dict):
+        return np.array([series[t] for t in model_data[None]['T']], dtype=dtype)
+    return np.asarray(series, dtype=dtype)
+
+
+@timed('model_input')
+def model_input(data, parameters=None):
 
+    # Time series can be lists, NumPy arrays, pandas Series or the columns of a DataFrame
+    if hasattr(data, 'columns'):
+        data = {name: data[name].to_numpy() for name in data.columns}
+    if parameters is not None:
+        data = dict(data, **parameters)
 
-    periods = np.arange(1, len(data['generation'])+1)
-    generation = dict(zip(periods,  data['generation']))
+    n = len(data['generation'])
+    periods = np.arange(1, n+1)
+    generation = _array(data, 'generation', n)
 
 
     if "demand" in data:
-        demand = dict(zip(periods,  data['demand']))
+        demand = _array(data, 'demand', n)
     else:
-        demand = [0] * len(data['generation'])
-        demand = dict(zip(periods,  demand))
+        demand = np.zeros(n)
         
     if "heat_demand" in data:
-        heat_demand = dict(zip(periods,  data['heat_demand']))
+        heat_demand = _array(data, 'heat_demand', n)
     else:
-        heat_demand = [0] * len(data['generation'])
-        heat_demand = dict(zip(periods,  heat_demand))        
+        heat_demand = np.zeros(n)
+
+    # Number of periods each period represents in the objective, e.g. for representative days
+    if "weight" in data:
+        weight = _array(data, 'weight', n)
+    else:
+        weight = np.ones(n)
+
+    # Period preceding each period in the storage balances, 0 for the initial storage level
+    if "previous_period" in data:
+        previous_period = _array(data, 'previous_period', n, dtype=np.int64)
+    else:
+        previous_period = periods-1
+
+    # Representative day, numbered from 1, of every calendar day when the periods are representative days of equal
+    # length linked through the storage levels of the calendar days, see enerthon.aggregation
+    if "day_sequence" in data:
+        day_sequence = np.asarray(data['day_sequence'], dtype=np.int64)
+        n_representatives = int(day_sequence.max(initial=0))
+        if day_sequence.ndim != 1 or len(day_sequence) == 0 or day_sequence.min() < 1 or n % n_representatives != 0:
+            raise ValueError('day_sequence must number the representative days of equal length, from 1 to %d'
+                             % n_representatives)
+    else:
+        day_sequence = None
 
 
 
@@ -341,10 +1136,11 @@ def model_input(data):
     else:
         tes_discharge_max = 1
 
+    # Share of the stored heat lost per period, one value for all periods or one per period
     if "tes_losses" in data:
-        tes_losses = data['tes_losses']
+        tes_losses = data['tes_losses'] if np.ndim(data['tes_losses']) == 0 else _array(data, 'tes_losses', n)
     else:
-        tes_losses = 0.02
+        tes_losses = TES_LOSSES
 
     if "tes_ini_level" in data:
         tes_ini_level = data['tes_ini_level']
@@ -357,14 +1153,24 @@ def model_input(data):
         tes_fin_level = 0
 
 
-    energy_price_buy = dict(zip(periods,  data['energy_price_buy']))
-    energy_price_sell = dict(zip(periods,  data['energy_price_sell']))
+    energy_price_buy = _array(data, 'energy_price_buy', n)
+    energy_price_sell = _array(data, 'energy_price_sell', n)
     
     grid_fixed_fee = data['grid_fixed_fee']
-    grid_energy_import_fee = dict(zip(periods,  data['grid_energy_import_fee']))
-    grid_energy_export_fee = dict(zip(periods,  data['grid_energy_export_fee']))
-    grid_power_import_fee = dict(zip(periods,  data['grid_power_import_fee']))
-    grid_power_export_fee = dict(zip(periods,  data['grid_power_export_fee']))
+    grid_energy_import_fee = _array(data, 'grid_energy_import_fee', n)
+    grid_energy_export_fee = _array(data, 'grid_energy_export_fee', n)
+    grid_power_import_fee = _array(data, 'grid_power_import_fee', n)
+    grid_power_export_fee = _array(data, 'grid_power_export_fee', n)
+
+    if "grid_power_import_max_ini" in data:
+        grid_power_import_max_ini = data['grid_power_import_max_ini']
+    else:
+        grid_power_import_max_ini = {}
+
+    if "grid_power_export_max_ini" in data:
+        grid_power_export_max_ini = data['grid_power_export_max_ini']
+    else:
+        grid_power_export_max_ini = {}
 
 
     if "fuel_price" in data:
@@ -393,12 +1199,23 @@ def model_input(data):
         boiler_efficiency = 0.95        
     
 
+    # Annualised investment costs and upper limits of the capacities sized by model(sizing=...)
+    investment_cost = dict()
+    capacity_max = dict()
+    for name in SIZING:
+        investment_cost[name] = data.get('%s_investment_cost' % name, 0)
+        capacity_max[name] = data.get('%s_capacity_max' % name, None)
+
+
+    # Duration of the periods in hours, one value for all periods or one per period for a variable time grid
     if "dt" in data:
-        dt = data['dt']
+        dt = data['dt'] if np.ndim(data['dt']) == 0 else _array(data, 'dt', n)
     else:
         dt = 1
+    if np.any(np.asarray(dt) <= 0):
+        raise ValueError('dt must be positive')
 
-    month_order = dict(zip(periods,  data['month_order']))
+    month_order = _array(data, 'month_order', n, dtype=np.int64)
 
     # Create model data input dictionary
     model_data = {None: {
@@ -407,6 +1224,9 @@ def model_input(data):
         'generation': generation,
         'demand': demand,
         'heat_demand': heat_demand,
+        'weight': weight,
+        'previous_period': previous_period,
+        'day_sequence': day_sequence,
 
         'battery_min_level': battery_min_level,
         'battery_capacity': battery_capacity,
@@ -434,6 +1254,8 @@ def model_input(data):
         'grid_energy_export_fee': grid_energy_export_fee,
         'grid_power_import_fee': grid_power_import_fee,
         'grid_power_export_fee': grid_power_export_fee,
+        'grid_power_import_max_ini': grid_power_import_max_ini,
+        'grid_power_export_max_ini': grid_power_export_max_ini,
         
         'fuel_price': fuel_price,
         
@@ -442,6 +1264,13 @@ def model_input(data):
         'boiler_capacity': boiler_capacity,
         'boiler_efficiency': boiler_efficiency,
 
+        'battery_investment_cost': investment_cost['battery'],
+        'tes_investment_cost': investment_cost['tes'],
+        'heat_pump_investment_cost': investment_cost['heat_pump'],
+        'battery_capacity_max': capacity_max['battery'],
+        'tes_capacity_max': capacity_max['tes'],
+        'heat_pump_capacity_max': capacity_max['heat_pump'],
+
         'month_order': month_order,
         'dt': dt,
     }}
@@ -449,35 +1278,32 @@ def model_input(data):
     return model_data
 
 
+@timed('model_results')
 def model_results(solution):
-    
-    s = dict()
-    
-    s['cost_total'] = solution.total_cost()
-    s['cost_energy'] = value(solution.COST_ENERGY[:])
-    s['cost_grid_energy_import'] = value(solution.COST_GRID_ENERGY_IMPORT[:])
-    s['cost_grid_energy_export'] = value(solution.COST_GRID_ENERGY_EXPORT[:])
-    s['cost_grid_power_import'] = value(solution.COST_GRID_POWER_IMPORT_MAX[:])
-    s['cost_grid_power_export'] = value(solution.COST_GRID_POWER_EXPORT_MAX[:])
-    s['cost_grid_power_fixed'] = value(solution.COST_GRID_FIXED)
-    
-    s['cost_fuel'] = value(solution.COST_FUEL[:])
-        
-    s['power_buy'] = value(solution.P_BUY[:])
-    s['power_sell'] = value(solution.P_SELL[:])
-    
-    s['battery_soc'] = value(solution.BEL[:])
-    s['battery_charge'] = value(solution.B_IN[:])
-    s['battery_discharge'] = value(solution.B_OUT[:])
 
-    s['tes_soc'] = value(solution.TES[:])
-    s['tes_charge'] = value(solution.TES_IN[:])
-    s['tes_discharge'] = value(solution.TES_OUT[:])
-    
-    s['heat_pump_heat_generation'] = value(solution.Q_HP[:])
-    s['heat_pump_power_consumption'] = value(solution.P_HP[:])
-    
-    s['boiler_heat_generation'] = value(solution.Q_BO[:])
-    s['boiler_fuel_consumption'] = value(solution.F_BO[:])
+    # Raises for a model without solution, like reading the variables with value() did. A primal vector is only
+    # kept for a solve with solution.
+    if getattr(solution, '_primal', None) is None:
+        solution.total_cost()
+
+    results = Results.from_model(solution).to_dict()
+
+    # Sized capacities and their investment cost over the horizon, included in cost_total
+    sized = getattr(solution, '_sized', [])
+    for name in sized:
+        results['%s_capacity' % name] = value(solution.component(CAPACITY_VARIABLES[name]))
+    if sized:
+        results['cost_investment'] = value(solution.COST_INVESTMENT)
+
+    # Storage levels at the start of the calendar days of linked representative days, and at the end
+    if getattr(solution, '_linked', False):
+        results['battery_soc_day'] = [v.value for v in solution.BEL_DAY.values()]
+        results['tes_soc_day'] = [v.value for v in solution.TES_DAY.values()]
+
+    # Shadow prices of a solve with solver['duals']
+    from enerthon.sensitivity import has_duals, shadow_prices
+    if has_duals(solution):
+        for name, v in shadow_prices(solution).items():
+            results[name] = v.tolist() if isinstance(v, np.ndarray) else v
 
-    return s
\ No newline at end of file
+    return results
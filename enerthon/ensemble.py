@@ -0,0 +1,165 @@
+from scipy.optimize import OptimizeResult
+from scipy import sparse
+import numpy as np
+
+from enerthon.enerthon_model import model_input
+from enerthon.matrix_model import matrix_model, solve_matrix_model
+from enerthon.profiling import timed
+from enerthon.results import PERIOD_COLUMNS, Results
+
+
+# Series that differ between the members of a forecast ensemble, they only enter the right hand sides of the LP
+MEMBER_SERIES = ['generation', 'demand', 'heat_demand']
+
+# Decisions the stochastic LP takes once for all members over its first hours, the grid exchange follows from them
+FIRST_STAGE = ['B_IN', 'B_OUT', 'TES_IN', 'TES_OUT', 'Q_HP', 'Q_BO']
+
+# Per-period results summarised over the members
+TRAJECTORIES = ['battery_soc', 'tes_soc', 'power_buy', 'power_sell']
+
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def _members(data, ensemble):
+    # Member series as arrays of shape (members, periods), series without members are the same for all
+    n = len(data['generation'])
+    series = {name: np.atleast_2d(np.asarray(v, dtype=float)) for name, v in ensemble.items()}
+    unknown = set(series) - set(MEMBER_SERIES)
+    if unknown:
+        raise ValueError('Only %s can differ between members, got %s' % (', '.join(MEMBER_SERIES),
+                                                                          ', '.join(sorted(unknown))))
+    sizes = {v.shape[0] for v in series.values()}
+    if len(sizes) != 1 or any(v.shape[1] != n for v in series.values()):
+        raise ValueError('Every ensemble series must have the same number of members of %d periods' % n)
+    n_members = sizes.pop()
+
+    members = dict()
+    for name in MEMBER_SERIES:
+        if name in series:
+            members[name] = series[name]
+        else:
+            members[name] = np.broadcast_to(np.asarray(data.get(name, np.zeros(n)), dtype=float), (n_members, n))
+    return n_members, members
+
+
+def _set_member(matrix, members, s):
+    # Right hand sides of the rows that depend on the member series
+    matrix['b_eq'][matrix['rows_eq']['power_balance']] = members['generation'][s] - members['demand'][s]
+    matrix['b_eq'][matrix['rows_eq']['heat_balance']] = members['heat_demand'][s]
+    if 'no_grid_charging' in matrix['rows_ub']:
+        matrix['b_ub'][matrix['rows_ub']['no_grid_charging']] = members['demand'][s]
+
+
+def _quantiles(values, probabilities, quantiles):
+    # Quantiles over the members, the first axis, of a weighted ensemble
+    order = np.argsort(values, axis=0, kind='stable')
+    cumulative = np.cumsum(probabilities[order], axis=0)
+    result = dict()
+    for q in quantiles:
+        position = np.minimum(np.sum(cumulative < q - 1e-12, axis=0), len(probabilities)-1)
+        result[q] = np.take_along_axis(values, np.take_along_axis(order, np.expand_dims(position, 0), axis=0),
+                                       axis=0)[0]
+    return result
+
+
+def _statistics(costs, trajectories, probabilities, quantiles):
+    s = {'members': len(costs), 'costs': costs.tolist()}
+    mean = float(np.dot(probabilities, costs))
+    s['cost_total'] = {'mean': mean,
+                       'std': float(np.sqrt(np.dot(probabilities, (costs - mean)**2))),
+                       'min': float(costs.min()), 'max': float(costs.max()),
+                       'quantiles': {q: float(v) for q, v in _quantiles(costs, probabilities, quantiles).items()}}
+    for name, values in trajectories.items():
+        s[name] = {'mean': (probabilities @ values).tolist(),
+                   'quantiles': {q: v.tolist() for q, v in _quantiles(values, probabilities, quantiles).items()}}
+    return s
+
+
+def _stochastic_matrix(matrix, members, probabilities, shared_periods):
+    # One LP over all members with the FIRST_STAGE columns of the first periods shared. Column j of member s is
+    # index[s, j] of the stacked LP.
+    n_members = len(probabilities)
+    n_columns = len(matrix['c'])
+    shared = np.zeros(n_columns, dtype=bool)
+    for name in FIRST_STAGE:
+        shared[np.arange(matrix['columns'][name].start, matrix['columns'][name].start + shared_periods)] = True
+
+    index = np.arange(n_members)[:, None]*n_columns + np.arange(n_columns)[None, :]
+    index[:, shared] = np.flatnonzero(shared)
+    used, index = np.unique(index, return_inverse=True)
+    index = index.reshape(n_members, n_columns)
+
+    def stack(A):
+        A = A.tocoo()
+        rows = np.concatenate([A.row + s*A.shape[0] for s in range(n_members)])
+        cols = np.concatenate([index[s][A.col] for s in range(n_members)])
+        return sparse.csr_matrix((np.tile(A.data, n_members), (rows, cols)),
+                                 shape=(A.shape[0]*n_members, len(used)))
+
+    b_eq = []
+    b_ub = []
+    for s in range(n_members):
+        _set_member(matrix, members, s)
+        b_eq.append(matrix['b_eq'].copy())
+        if matrix['A_ub'] is not None:
+            b_ub.append(matrix['b_ub'].copy())
+
+    c = np.zeros(len(used))
+    lb = np.empty(len(used))
+    ub = np.empty(len(used))
+    for s in range(n_members):
+        np.add.at(c, index[s], probabilities[s]*matrix['c'])
+        lb[index[s]] = matrix['lb']
+        ub[index[s]] = matrix['ub']
+
+    stacked = {'c': c, 'A_eq': stack(matrix['A_eq']), 'b_eq': np.concatenate(b_eq), 'lb': lb, 'ub': ub,
+               'A_ub': stack(matrix['A_ub']) if matrix['A_ub'] is not None else None,
+               'b_ub': np.concatenate(b_ub) if b_ub else None}
+    return stacked, index
+
+
+@timed('solve_ensemble')
+def solve_ensemble(data, ensemble, solver, stochastic_hours=None, probabilities=None, quantiles=QUANTILES):
+    # Solves data for every member of a forecast ensemble, a dict of MEMBER_SERIES with one row per member, and
+    # returns statistics over the members. The LP is built once, members only change its right hand sides.
+    # Without stochastic_hours every member is solved on its own, as if its forecast was certain. With
+    # stochastic_hours one LP minimises the expected cost with the storage and heat dispatch of the first hours
+    # taken once for all members, returned as first_stage.
+    n_members, members = _members(data, ensemble)
+    if probabilities is None:
+        probabilities = np.full(n_members, 1/n_members)
+    probabilities = np.asarray(probabilities, dtype=float)
+    if len(probabilities) != n_members or np.any(probabilities < 0) or not np.isclose(probabilities.sum(), 1):
+        raise ValueError('probabilities must be %d non-negative values adding up to one' % n_members)
+
+    model_data = model_input(data)
+    matrix = matrix_model(model_data)
+    columns = matrix['columns']
+    names = {var: name for name, var in PERIOD_COLUMNS}
+
+    member_results = []
+    if stochastic_hours is None:
+        for s in range(n_members):
+            _set_member(matrix, members, s)
+            solve_matrix_model(matrix, solver)
+            member_results.append(Results.from_matrix(matrix))
+    else:
+        dt = np.broadcast_to(np.asarray(model_data[None]['dt'], dtype=float), (len(model_data[None]['T']),))
+        shared_periods = int(np.sum(np.cumsum(dt) - dt < stochastic_hours - 1e-9))
+        stacked, index = _stochastic_matrix(matrix, members, probabilities, shared_periods)
+        x = solve_matrix_model(stacked, solver)['solution'].x
+        for s in range(n_members):
+            x_member = x[index[s]]
+            member_matrix = dict(matrix, solution=OptimizeResult(x=x_member, fun=float(matrix['c'] @ x_member)))
+            member_results.append(Results.from_matrix(member_matrix))
+
+    costs = np.array([results.cost_total for results in member_results])
+    trajectories = {name: np.array([results[name] for results in member_results]) for name in TRAJECTORIES}
+    statistics = _statistics(costs, trajectories, probabilities, quantiles)
+    statistics['stochastic_hours'] = stochastic_hours
+
+    if stochastic_hours is not None:
+        statistics['first_stage'] = {names[var]: x[index[0][np.arange(columns[var].start,
+                                                                      columns[var].start + shared_periods)]].tolist()
+                                     for var in FIRST_STAGE}
+    return statistics
@@ -0,0 +1,187 @@
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, ProcessPoolExecutor, wait
+import numpy as np
+import json
+import os
+
+from enerthon.sweep import attach_arrays, cpu_count, share_arrays, solve_scenario
+
+
+# Per-building key figures, energies in kWh and powers in kW
+KPIS = ['cost_total', 'energy_buy', 'energy_sell', 'peak_buy', 'peak_sell', 'heat_pump_energy', 'boiler_fuel']
+
+# Worker state, set once per process by _init_worker
+_worker = dict()
+
+
+def kpis(results, dt=1, weight=1):
+    # Energies over the horizon, dt and weight are one value or one per period like in the data
+    def energy(power):
+        return float(np.sum(np.asarray(power, dtype=float)*dt*weight))
+
+    return {
+        'cost_total': results['cost_total'],
+        'energy_buy': energy(results['power_buy']),
+        'energy_sell': energy(results['power_sell']),
+        'peak_buy': float(np.max(results['power_buy'], initial=0.0)),
+        'peak_sell': float(np.max(results['power_sell'], initial=0.0)),
+        'heat_pump_energy': energy(results['heat_pump_power_consumption']),
+        'boiler_fuel': energy(results['boiler_fuel_consumption']),
+    }
+
+
+class FleetSummary:
+    # Aggregate KPIs of the buildings streamed so far
+
+    def __init__(self):
+        self.buildings = 0
+        self.failed = 0
+        self.totals = dict.fromkeys(KPIS, 0.0)
+        self.maxima = dict.fromkeys(KPIS, -np.inf)
+
+    def add(self, record):
+        if record['error'] is not None:
+            self.failed += 1
+            return
+        self.buildings += 1
+        for name in KPIS:
+            self.totals[name] += record['kpis'][name]
+            self.maxima[name] = max(self.maxima[name], record['kpis'][name])
+
+    def to_dict(self):
+        s = {'buildings': self.buildings, 'failed': self.failed}
+        for name in KPIS:
+            s['total_' + name] = self.totals[name]
+            s['mean_' + name] = self.totals[name]/self.buildings if self.buildings else None
+            s['max_' + name] = self.maxima[name] if self.buildings else None
+        return s
+
+
+def buildings_from_table(table):
+    # (building id, data) pairs from a DataFrame with one row per building, or a dict of data dicts
+    if hasattr(table, 'iterrows'):
+        return ((building, row.to_dict()) for building, row in table.iterrows())
+    return iter(table.items())
+
+
+def _checkpoint_key(building):
+    return json.dumps(building)
+
+
+def read_checkpoint(path):
+    # Records of the buildings finished in earlier runs, by building id
+    done = dict()
+    if path is None or not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash, the building is solved again
+                continue
+            done[_checkpoint_key(record['building'])] = record
+    return done
+
+
+def _write_checkpoint(f, record):
+    f.write(json.dumps({'building': record['building'], 'kpis': record['kpis'], 'error': record['error']}) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _init_worker(shm_name, layout, scalars, solver, cache):
+    _worker['shm'], arrays = attach_arrays(shm_name, layout)
+    _worker['common'] = dict(scalars, **arrays)
+    _worker['solver'] = solver
+    _worker['cache'] = cache
+
+
+def _run_building(building, overrides):
+    # Shared arrays are read-only views into the shared memory block, model_input() uses them without copies
+    data = dict(_worker['common'])
+    data.update(overrides)
+
+    try:
+        results = solve_scenario(data, _worker['solver'], _worker['cache'])
+        key_figures = kpis(results, data.get('dt', 1), data.get('weight', 1))
+        return {'building': building, 'results': results, 'kpis': key_figures, 'error': None}
+    except Exception as e:
+        return {'building': building, 'results': None, 'kpis': None, 'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def fleet(common, buildings, solver, processes=None, max_pending=None, checkpoint=None, cache=None):
+    # Solve every building on the common data, e.g. prices, tariff arrays and month_order shared by the fleet, with
+    # the building's generation, demand, heat_demand and equipment scalars on top. buildings yields (building id,
+    # data) pairs and is consumed lazily: at most max_pending buildings are queued or solving at any time.
+    #
+    # Records are yielded as buildings finish. With a checkpoint file, finished buildings are appended to it and
+    # skipped by a later run, which yields their records again with 'resumed' set and without results. Buildings
+    # lost with a worker process that died are yielded with the error but not checkpointed, a later run solves them
+    # again; the remaining buildings go to a new pool.
+    processes = processes or cpu_count()
+    max_pending = max_pending or 2*processes
+
+    shared = {name: v for name, v in common.items() if np.ndim(v) > 0}
+    scalars = {name: v for name, v in common.items() if np.ndim(v) == 0}
+
+    done = read_checkpoint(checkpoint)
+    for record in done.values():
+        yield dict(record, results=None, resumed=True)
+
+    log = open(checkpoint, 'a') if checkpoint is not None else None
+    shm, layout = share_arrays(shared)
+
+    def start_pool():
+        return ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                   initargs=(shm.name, layout, scalars, solver, cache))
+
+    pool = start_pool()
+    try:
+        pending = dict()
+        buildings = iter(buildings)
+        exhausted = False
+        while pending or not exhausted:
+            # Queue buildings up to the limit, then wait for one to finish
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    building, data = next(buildings)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if _checkpoint_key(building) in done:
+                    continue
+                pending[pool.submit(_run_building, building, data)] = building
+
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            broken = False
+            while finished:
+                for future in finished:
+                    building = pending.pop(future)
+                    try:
+                        record = future.result()
+                    except BrokenExecutor as e:
+                        # The worker process died, e.g. killed by the OS, and took the pool with it
+                        broken = True
+                        yield {'building': building, 'results': None, 'kpis': None,
+                               'error': '%s: %s' % (type(e).__name__, e), 'resumed': False}
+                        continue
+                    except Exception as e:
+                        record = {'building': building, 'results': None, 'kpis': None,
+                                  'error': '%s: %s' % (type(e).__name__, e)}
+                    if log is not None:
+                        _write_checkpoint(log, record)
+                    yield dict(record, resumed=False)
+
+                # Every building still on a broken pool finishes or is lost with it, then a new pool takes over
+                finished = wait(pending)[0] if broken else set()
+            if broken:
+                pool.shutdown(wait=True, cancel_futures=True)
+                pool = start_pool()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        shm.close()
+        shm.unlink()
+        if log is not None:
+            log.close()
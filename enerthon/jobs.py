@@ -0,0 +1,320 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from urllib.parse import urlsplit
+import multiprocessing
+import argparse
+import asyncio
+import signal
+import json
+import time
+import uuid
+import os
+import sys
+
+from enerthon.sweep import cpu_count, solve_scenario
+
+
+# Lanes by priority, lower first. Short operational solves go before long planning runs.
+LANES = {'operational': 0, 'planning': 1}
+
+STATES = ['queued', 'running', 'done', 'failed', 'timeout', 'cancelled']
+
+HTTP_STATUS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+def _run_job(conn, data, solver):
+    # Own process group, so that killing the job also kills a solver subprocess started by the file based solvers
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    try:
+        conn.send(('done', solve_scenario(data, solver)))
+    except Exception as e:
+        conn.send(('failed', '%s: %s' % (type(e).__name__, e)))
+    conn.close()
+
+
+def _receive(conn):
+    try:
+        return conn.recv()
+    except (EOFError, OSError):
+        # The process was killed
+        return 'killed', None
+
+
+def kill_process(process):
+    # Kills the process and the solver subprocesses in its process group
+    if process.pid is None or process.exitcode is not None:
+        return
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            # Killed before it became a process group leader
+            pass
+    process.kill()
+
+
+class Job:
+
+    def __init__(self, job_id, data, lane, timeout, future):
+        self.id = job_id
+        self.data = data
+        self.lane = lane
+        self.timeout = timeout
+        self.future = future
+        self.state = 'queued'
+        self.results = None
+        self.error = None
+        self.process = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def status(self):
+        return {'id': self.id, 'lane': self.lane, 'state': self.state, 'error': self.error,
+                'submitted': self.submitted, 'started': self.started, 'finished': self.finished,
+                'wait_time': (self.started or self.finished or time.time()) - self.submitted,
+                'run_time': (self.finished or time.time()) - self.started if self.started else None}
+
+
+class JobQueue:
+    # Solves submitted from asyncio code in at most processes solver processes. Every job runs in its own process,
+    # which is killed on cancel() and when the job's timeout is exceeded. Queued jobs start by lane priority and
+    # then in submission order. limits caps the running jobs per lane, by default the lower priority lanes leave
+    # one process free for the first lane.
+
+    def __init__(self, solver, processes=None, lanes=None, limits=None, timeout=None, keep=1000):
+        self.solver = solver
+        self.processes = processes or cpu_count()
+        self.lanes = dict(LANES if lanes is None else lanes)
+        self.order = sorted(self.lanes, key=self.lanes.get)
+        if limits is None:
+            limits = {lane: max(1, self.processes - 1) for lane in self.order[1:]}
+        self.limits = {lane: limits.get(lane, self.processes) for lane in self.order}
+        self.timeout = timeout
+        self.keep = keep
+
+        self.jobs = dict()
+        self._queued = {lane: deque() for lane in self.order}
+        self._running = {lane: 0 for lane in self.order}
+        self._finished = deque()
+        self._tasks = set()
+        # A thread waits for every running job, the others join killed processes
+        self._threads = ThreadPoolExecutor(max_workers=2*self.processes)
+
+        # Job processes are forked from a clean server process where possible, not from the threaded event loop
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        if 'forkserver' in methods:
+            self._context.set_forkserver_preload(['enerthon.sweep'])
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def submit(self, data, lane=None, timeout=None):
+        # Returns the job id at once, the job is solved in the background
+        lane = self.order[0] if lane is None else lane
+        if lane not in self.lanes:
+            raise ValueError('Unknown lane %r, expected one of %s' % (lane, ', '.join(self.order)))
+
+        job = Job(uuid.uuid4().hex, data, lane, self.timeout if timeout is None else timeout,
+                  asyncio.get_running_loop().create_future())
+        self.jobs[job.id] = job
+        self._queued[lane].append(job)
+        self._schedule()
+        return job.id
+
+    def status(self, job_id):
+        return self.jobs[job_id].status()
+
+    def stats(self):
+        s = {'processes': self.processes, 'running': sum(self._running.values()),
+             'lanes': {lane: {'queued': len(self._queued[lane]), 'running': self._running[lane],
+                              'limit': self.limits[lane]} for lane in self.order}}
+        s.update({state: 0 for state in STATES})
+        for job in self.jobs.values():
+            s[job.state] += 1
+        return s
+
+    async def result(self, job_id):
+        # Waits for the job, returns model_results() or raises RuntimeError for failed and timed out jobs and
+        # CancelledError for cancelled ones
+        job = self.jobs[job_id]
+        await asyncio.shield(job.future)
+        return job.results
+
+    def cancel(self, job_id):
+        # False when the job already finished
+        job = self.jobs[job_id]
+        if job.state == 'queued':
+            self._queued[job.lane].remove(job)
+            self._finish(job, 'cancelled')
+            return True
+        if job.state == 'running':
+            job.state = 'cancelled'
+            kill_process(job.process)
+            return True
+        return False
+
+    async def close(self):
+        for job in list(self.jobs.values()):
+            self.cancel(job.id)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._threads.shutdown(wait=True)
+
+    def _schedule(self):
+        while sum(self._running.values()) < self.processes:
+            lane = next((lane for lane in self.order
+                         if self._queued[lane] and self._running[lane] < self.limits[lane]), None)
+            if lane is None:
+                return
+            self._start(self._queued[lane].popleft())
+
+    def _start(self, job):
+        receiver, sender = self._context.Pipe(duplex=False)
+        job.process = self._context.Process(target=_run_job, args=(sender, job.data, self.solver), daemon=True)
+        job.process.start()
+        sender.close()
+
+        job.state = 'running'
+        job.started = time.time()
+        self._running[job.lane] += 1
+        task = asyncio.ensure_future(self._wait(job, receiver))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _wait(self, job, receiver):
+        loop = asyncio.get_running_loop()
+        try:
+            state, payload = await asyncio.wait_for(asyncio.shield(loop.run_in_executor(self._threads, _receive,
+                                                                                        receiver)), job.timeout)
+        except asyncio.TimeoutError:
+            state, payload = 'timeout', 'Timed out after %g s' % job.timeout
+        finally:
+            kill_process(job.process)
+            await loop.run_in_executor(self._threads, job.process.join)
+            receiver.close()
+            self._running[job.lane] -= 1
+
+        if job.state == 'cancelled':
+            state = 'cancelled'
+        elif state == 'killed':
+            state, payload = 'failed', 'The solver process died with exit code %s' % job.process.exitcode
+        self._finish(job, state, payload)
+        self._schedule()
+
+    def _finish(self, job, state, payload=None):
+        job.state = state
+        job.finished = time.time()
+        job.data = None
+        job.process = None
+        if state == 'done':
+            job.results = payload
+            job.future.set_result(None)
+        elif state == 'cancelled':
+            job.future.cancel()
+        else:
+            job.error = payload
+            job.future.set_exception(RuntimeError(payload))
+            # Retrieved by result(), not reported as never retrieved
+            job.future.exception()
+
+        # Finished jobs are kept for status() and result() up to a limit
+        self._finished.append(job.id)
+        while len(self._finished) > self.keep:
+            self.jobs.pop(self._finished.popleft(), None)
+
+
+async def _respond(writer, code, body):
+    content = json.dumps(body).encode()
+    writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n'
+                  % (code, HTTP_STATUS[code], len(content))).encode() + content)
+    await writer.drain()
+    writer.close()
+
+
+async def _handle(queue, reader, writer):
+    # POST /jobs                  {"data": {...}, "lane": "planning", "timeout": 60} -> {"id": ...}
+    # GET /jobs/<id>              status, with the results once done
+    # GET /jobs/<id>/result       waits for the job, then as GET /jobs/<id>
+    # DELETE /jobs/<id>           cancels the job
+    # GET /status                 queue statistics
+    try:
+        method, target, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+        headers = dict()
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, v = line.partition(':')
+            headers[name.strip().lower()] = v.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+    except (ValueError, asyncio.IncompleteReadError):
+        return await _respond(writer, 400, {'error': 'Malformed request'})
+
+    parts = [part for part in urlsplit(target).path.split('/') if part]
+    if parts == ['status'] and method == 'GET':
+        return await _respond(writer, 200, queue.stats())
+    if parts == ['jobs'] and method == 'POST':
+        try:
+            request = json.loads(body)
+            job_id = queue.submit(request['data'], request.get('lane'), request.get('timeout'))
+        except (ValueError, KeyError, TypeError) as e:
+            return await _respond(writer, 400, {'error': '%s: %s' % (type(e).__name__, e)})
+        return await _respond(writer, 202, {'id': job_id})
+    if len(parts) not in (2, 3) or parts[0] != 'jobs' or (len(parts) == 3 and parts[2] != 'result'):
+        return await _respond(writer, 404, {'error': 'Not found'})
+    if parts[1] not in queue.jobs:
+        return await _respond(writer, 404, {'error': 'Unknown job %s' % parts[1]})
+
+    job_id = parts[1]
+    if method == 'DELETE' and len(parts) == 2:
+        return await _respond(writer, 200, {'cancelled': queue.cancel(job_id)})
+    if method != 'GET':
+        return await _respond(writer, 405, {'error': 'Method not allowed'})
+    if len(parts) == 3:
+        try:
+            await queue.result(job_id)
+        except (RuntimeError, asyncio.CancelledError):
+            pass
+    status = queue.status(job_id)
+    if status['state'] == 'done':
+        status['results'] = queue.jobs[job_id].results
+    return await _respond(writer, 200, status)
+
+
+async def serve(queue, host='127.0.0.1', port=8080):
+    # Local HTTP front-end of the queue, e.g. to load test it on one machine
+    return await asyncio.start_server(lambda reader, writer: _handle(queue, reader, writer), host, port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local HTTP job server for enerthon optimisations')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--solver', default='highs')
+    parser.add_argument('--processes', type=int, help='solver processes, default the number of CPUs')
+    parser.add_argument('--timeout', type=float, help='default job timeout in seconds')
+    args = parser.parse_args(argv)
+
+    async def run():
+        async with JobQueue({'name': args.solver}, args.processes, timeout=args.timeout) as queue:
+            server = await serve(queue, args.host, args.port)
+            print('Serving on http://%s:%d with %d solver processes' % (args.host, args.port, queue.processes),
+                  flush=True)
+            async with server:
+                await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
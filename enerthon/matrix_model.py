@@ -0,0 +1,343 @@
+from scipy.optimize import linprog
+from scipy import sparse
+import numpy as np
+
+from enerthon.enerthon_model import _series
+from enerthon.profiling import record, timed
+from enerthon.results import Results
+
+
+# Variables of the LP in column order, indexed by periods (T), months (M) or scalar. Linked representative days add
+# the storage levels of the day starts (D) and the range of the relative levels of each representative day (R).
+COLUMNS = [
+    ('COST_ENERGY', 'T'),
+    ('COST_GRID_ENERGY_IMPORT', 'T'),
+    ('COST_GRID_ENERGY_EXPORT', 'T'),
+    ('COST_GRID_POWER_IMPORT', 'T'),
+    ('COST_GRID_POWER_EXPORT', 'T'),
+    ('COST_GRID_POWER_IMPORT_MAX', 'M'),
+    ('COST_GRID_POWER_EXPORT_MAX', 'M'),
+    ('COST_GRID_FIXED', None),
+    ('COST_FUEL', 'T'),
+    ('P_BUY', 'T'),
+    ('P_SELL', 'T'),
+    ('BEL', 'T'),
+    ('B_IN', 'T'),
+    ('B_OUT', 'T'),
+    ('TES', 'T'),
+    ('TES_IN', 'T'),
+    ('TES_OUT', 'T'),
+    ('Q_HP', 'T'),
+    ('P_HP', 'T'),
+    ('Q_BO', 'T'),
+    ('F_BO', 'T'),
+    ('BEL_DAY', 'D'),
+    ('BEL_MAX', 'R'),
+    ('BEL_MIN', 'R'),
+    ('TES_DAY', 'D'),
+    ('TES_MAX', 'R'),
+    ('TES_MIN', 'R'),
+]
+
+
+class _Rows:
+
+    def __init__(self, n_columns):
+        self.n_columns = n_columns
+        self.n_rows = 0
+        self.rows = []
+        self.cols = []
+        self.vals = []
+        self.rhs = []
+        self.blocks = dict()
+
+    def add(self, name, n, terms, rhs):
+        # terms: list of (column indices, coefficients), one entry per row of the block
+        start = self.n_rows
+        rows = np.arange(start, start+n)
+        for cols, vals in terms:
+            vals = np.broadcast_to(np.asarray(vals, dtype=float), (n,))
+            keep = vals != 0
+            self.rows.append(rows[keep])
+            self.cols.append(np.asarray(cols)[keep])
+            self.vals.append(vals[keep])
+        self.rhs.append(np.broadcast_to(np.asarray(rhs, dtype=float), (n,)))
+        self.n_rows += n
+        self.blocks[name] = slice(start, self.n_rows)
+
+    def matrix(self):
+        if self.n_rows == 0:
+            return None, None
+        A = sparse.csr_matrix((np.concatenate(self.vals), (np.concatenate(self.rows), np.concatenate(self.cols))),
+                              shape=(self.n_rows, self.n_columns))
+        return A, np.concatenate(self.rhs)
+
+
+@timed('matrix_model')
+def matrix_model(model_data):
+
+    d = model_data[None]
+
+    ## SETS
+    T = np.asarray(d['T'])
+    n = len(T)
+    month_order = _series(model_data, 'month_order')
+    months, month_index = np.unique(month_order, return_inverse=True)
+    n_months = len(months)
+
+
+    ## PARAMETERS
+    demand = _series(model_data, 'demand')
+    generation = _series(model_data, 'generation')
+    heat_demand = _series(model_data, 'heat_demand')
+    weight = _series(model_data, 'weight')
+    energy_price_buy = _series(model_data, 'energy_price_buy')
+    energy_price_sell = _series(model_data, 'energy_price_sell')
+    grid_energy_import_fee = _series(model_data, 'grid_energy_import_fee')
+    grid_energy_export_fee = _series(model_data, 'grid_energy_export_fee')
+    grid_power_import_fee = _series(model_data, 'grid_power_import_fee')
+    grid_power_export_fee = _series(model_data, 'grid_power_export_fee')
+    dt = d['dt']
+
+    # Representative days linked through the storage levels of the calendar days, see model()
+    day_sequence = d.get('day_sequence')
+    linked = day_sequence is not None
+    n_representatives = int(np.max(day_sequence)) if linked else 0
+    n_days = len(day_sequence) if linked else 0
+    sizes = {'T': n, 'M': n_months, 'R': n_representatives, 'D': n_days+1 if linked else 0, None: 1}
+
+
+    ## VARIABLES
+    columns = dict()
+    n_columns = 0
+    for name, index in COLUMNS:
+        size = sizes[index]
+        columns[name] = slice(n_columns, n_columns+size)
+        n_columns += size
+
+    def col(name):
+        return np.arange(columns[name].start, columns[name].stop)
+
+    previous_period = _series(model_data, 'previous_period', np.int64)
+    first = previous_period == 0
+    prev = np.maximum(previous_period-1, 0)
+
+
+    ## VARIABLE LIMITS
+    lb = np.full(n_columns, -np.inf)
+    ub = np.full(n_columns, np.inf)
+    for name in ['COST_GRID_POWER_IMPORT', 'COST_GRID_POWER_EXPORT', 'P_BUY', 'P_SELL', 'BEL', 'B_IN', 'B_OUT',
+                 'TES', 'TES_IN', 'TES_OUT', 'Q_HP', 'P_HP', 'Q_BO', 'F_BO']:
+        lb[columns[name]] = 0.0
+
+    lb[columns['BEL']] = max(0.0, d['battery_min_level']*d['battery_capacity'])
+    ub[columns['BEL']] = d['battery_capacity']
+    ub[columns['B_IN']] = d['battery_charge_max']*d['battery_capacity']
+    ub[columns['B_OUT']] = d['battery_discharge_max']*d['battery_capacity']
+
+    lb[columns['TES']] = max(0.0, d['tes_min_level']*d['tes_capacity'])
+    ub[columns['TES']] = d['tes_capacity']
+    ub[columns['TES_IN']] = d['tes_charge_max']*d['tes_capacity']
+    ub[columns['TES_OUT']] = d['tes_discharge_max']*d['tes_capacity']
+
+    if linked:
+        for storage, level in [('battery', 'BEL'), ('tes', 'TES')]:
+            capacity = d['%s_capacity' % storage]
+            lb[columns[level]] = -np.inf
+            ub[columns[level]] = np.inf
+            lb[columns[level + '_DAY']] = max(0.0, d['%s_min_level' % storage]*capacity)
+            ub[columns[level + '_DAY']] = capacity
+            lb[columns[level + '_MAX']] = 0.0
+            ub[columns[level + '_MIN']] = 0.0
+
+    ub[columns['Q_HP']] = d['heat_pump_capacity']
+    ub[columns['Q_BO']] = d['boiler_capacity']
+
+    lb[columns['COST_GRID_POWER_IMPORT_MAX']] = [d['grid_power_import_max_ini'].get(m, 0.0) for m in months]
+    lb[columns['COST_GRID_POWER_EXPORT_MAX']] = [d['grid_power_export_max_ini'].get(m, 0.0) for m in months]
+
+    # Fix battery and tes soc in the last period, or at the end of the last calendar day
+    battery_final = col('BEL_DAY' if linked else 'BEL')[-1]
+    tes_final = col('TES_DAY' if linked else 'TES')[-1]
+    if d['bel_fin_level'] > 0:
+        lb[battery_final] = ub[battery_final] = d['bel_fin_level']*d['battery_capacity']
+    if d['tes_fin_level'] > 0:
+        lb[tes_final] = ub[tes_final] = d['tes_fin_level']*d['tes_capacity']
+
+
+    ## OBJECTIVE
+    # Minimize cost
+    c = np.zeros(n_columns)
+    for name in ['COST_ENERGY', 'COST_GRID_ENERGY_IMPORT', 'COST_GRID_ENERGY_EXPORT', 'COST_FUEL']:
+        c[columns[name]] = weight
+    for name in ['COST_GRID_POWER_IMPORT_MAX', 'COST_GRID_POWER_EXPORT_MAX', 'COST_GRID_FIXED']:
+        c[columns[name]] = 1.0
+
+
+    ## EQUALITY CONSTRAINTS
+    eq = _Rows(n_columns)
+
+    # Energy cost
+    eq.add('energy_cost', n, [(col('COST_ENERGY'), 1.0),
+                              (col('P_BUY'), -energy_price_buy*dt),
+                              (col('P_SELL'), energy_price_sell*dt)], 0.0)
+
+    # Grid fixed cost
+    eq.add('grid_fixed_cost', 1, [(col('COST_GRID_FIXED'), 1.0)], d['grid_fixed_fee']*n_months)
+
+    # Grid energy import/export cost
+    eq.add('grid_energy_import_cost', n, [(col('COST_GRID_ENERGY_IMPORT'), 1.0),
+                                          (col('P_BUY'), -grid_energy_import_fee*dt)], 0.0)
+    eq.add('grid_energy_export_cost', n, [(col('COST_GRID_ENERGY_EXPORT'), 1.0),
+                                          (col('P_SELL'), -grid_energy_export_fee*dt)], 0.0)
+
+    # Fuel cost
+    eq.add('fuel_cost', n, [(col('COST_FUEL'), 1.0),
+                            (col('F_BO'), -d['fuel_price']*dt)], 0.0)
+
+    # Power balance
+    eq.add('power_balance', n, [(col('P_SELL'), 1.0),
+                                (col('P_BUY'), -1.0),
+                                (col('B_OUT'), -1.0),
+                                (col('B_IN'), 1.0),
+                                (col('P_HP'), 1.0)], generation - demand)
+
+    # Heat balance
+    eq.add('heat_balance', n, [(col('Q_BO'), 1.0),
+                               (col('Q_HP'), 1.0),
+                               (col('TES_OUT'), 1.0),
+                               (col('TES_IN'), -1.0)], heat_demand)
+
+    # Battery energy balance
+    eq.add('battery_soc', n, [(col('BEL'), 1.0),
+                              (col('BEL')[prev], np.where(first, 0.0, -1.0)),
+                              (col('B_IN'), -d['battery_efficiency_charge']*dt),
+                              (col('B_OUT'), (1/d['battery_efficiency_discharge'])*dt)],
+           np.where(first & ~linked, d['bel_ini_level']*d['battery_capacity'], 0.0))
+
+    # Heat storage energy balance
+    eq.add('heat_storage_soc', n, [(col('TES'), 1.0),
+                                   (col('TES')[prev], np.where(first, 0.0, -(1-d['tes_losses']))),
+                                   (col('TES_IN'), -dt),
+                                   (col('TES_OUT'), dt)],
+           np.where(first & ~linked, (1-d['tes_losses'])*d['tes_ini_level']*d['tes_capacity'], 0.0))
+
+    # Storage levels of the calendar days, the level at the start of a day plus the relative level of its
+    # representative day, the thermal storage level decays over the day
+    if linked:
+        periods_per_day = n//n_representatives
+        representative = np.arange(n)//periods_per_day
+        sequence = np.asarray(day_sequence) - 1
+        last = (sequence + 1)*periods_per_day - 1
+        retention = np.prod((1 - np.broadcast_to(np.asarray(d['tes_losses'], dtype=float), (n,)))
+                            .reshape(n_representatives, periods_per_day), axis=1)
+
+        eq.add('battery_initial_level', 1, [(col('BEL_DAY')[:1], 1.0)], d['bel_ini_level']*d['battery_capacity'])
+        eq.add('tes_initial_level', 1, [(col('TES_DAY')[:1], 1.0)], d['tes_ini_level']*d['tes_capacity'])
+        eq.add('battery_day', n_days, [(col('BEL_DAY')[1:], 1.0),
+                                       (col('BEL_DAY')[:-1], -1.0),
+                                       (col('BEL')[last], -1.0)], 0.0)
+        eq.add('tes_day', n_days, [(col('TES_DAY')[1:], 1.0),
+                                   (col('TES_DAY')[:-1], -retention[sequence]),
+                                   (col('TES')[last], -1.0)], 0.0)
+
+    # Fuel boiler
+    eq.add('fuel_boiler_gen', n, [(col('F_BO'), 1.0),
+                                  (col('Q_BO'), -(1/d['boiler_efficiency']))], 0.0)
+
+    # Heat pump
+    eq.add('heat_pump_gen', n, [(col('Q_HP'), 1.0),
+                                (col('P_HP'), -d['heat_pump_cop'])], 0.0)
+
+
+    ## INEQUALITY CONSTRAINTS
+    ub_rows = _Rows(n_columns)
+
+    # Grid power import/export cost
+    ub_rows.add('grid_power_import_cost', n, [(col('P_BUY'), grid_power_import_fee),
+                                              (col('P_SELL'), -grid_power_import_fee),
+                                              (col('COST_GRID_POWER_IMPORT'), -1.0)], 0.0)
+    ub_rows.add('grid_power_export_cost', n, [(col('P_SELL'), grid_power_export_fee),
+                                              (col('P_BUY'), -grid_power_export_fee),
+                                              (col('COST_GRID_POWER_EXPORT'), -1.0)], 0.0)
+
+    # Max grid import/export cost
+    ub_rows.add('max_grid_power_import_cost', n, [(col('COST_GRID_POWER_IMPORT'), 1.0),
+                                                  (col('COST_GRID_POWER_IMPORT_MAX')[month_index], -1.0)], 0.0)
+    ub_rows.add('max_grid_power_export_cost', n, [(col('COST_GRID_POWER_EXPORT'), 1.0),
+                                                  (col('COST_GRID_POWER_EXPORT_MAX')[month_index], -1.0)], 0.0)
+
+    # Battery charging from grid
+    if d['battery_grid_charging'] == False:
+        ub_rows.add('no_grid_charging', n, [(col('P_BUY'), 1.0),
+                                            (col('P_HP'), -1.0)], demand)
+
+
+    # Relative levels within the range of their representative day, which keeps the levels within the limits
+    if linked:
+        for storage, level in [('battery', 'BEL'), ('tes', 'TES')]:
+            capacity = d['%s_capacity' % storage]
+            decay = retention[sequence] if storage == 'tes' else 1.0
+            ub_rows.add('%s_relative_max' % storage, n, [(col(level), 1.0),
+                                                         (col(level + '_MAX')[representative], -1.0)], 0.0)
+            ub_rows.add('%s_relative_min' % storage, n, [(col(level + '_MIN')[representative], 1.0),
+                                                         (col(level), -1.0)], 0.0)
+            ub_rows.add('%s_day_max' % storage, n_days, [(col(level + '_DAY')[:-1], 1.0),
+                                                         (col(level + '_MAX')[sequence], 1.0)], capacity)
+            ub_rows.add('%s_day_min' % storage, n_days, [(col(level + '_DAY')[:-1], -decay),
+                                                         (col(level + '_MIN')[sequence], -1.0)],
+                        -d['%s_min_level' % storage]*capacity)
+
+
+    A_eq, b_eq = eq.matrix()
+    A_ub, b_ub = ub_rows.matrix()
+
+    matrix = {
+        'c': c,
+        'A_eq': A_eq,
+        'b_eq': b_eq,
+        'A_ub': A_ub,
+        'b_ub': b_ub,
+        'lb': lb,
+        'ub': ub,
+        'columns': columns,
+        'rows_eq': eq.blocks,
+        'rows_ub': ub_rows.blocks,
+        'months': months,
+        'linked': linked,
+    }
+
+    return matrix
+
+
+@timed('solve_matrix_model')
+def solve_matrix_model(matrix, solver):
+    if 'name' in solver and solver['name'].startswith('highs'):
+        method = solver['name']
+    else:
+        method = 'highs'
+
+    record(rows=matrix['A_eq'].shape[0] + matrix['A_ub'].shape[0], columns=len(matrix['c']),
+           nonzeros=matrix['A_eq'].nnz + matrix['A_ub'].nnz)
+    solution = linprog(matrix['c'], A_ub=matrix['A_ub'], b_ub=matrix['b_ub'], A_eq=matrix['A_eq'], b_eq=matrix['b_eq'],
+                       bounds=np.column_stack((matrix['lb'], matrix['ub'])), method=method,
+                       options=solver.get('options', None))
+
+    if solution.status != 0:
+        raise RuntimeError('LP solve failed: %s' % solution.message)
+
+    matrix['solution'] = solution
+
+    return matrix
+
+
+@timed('model_results')
+def matrix_model_results(matrix):
+    results = Results.from_matrix(matrix).to_dict()
+
+    # Storage levels at the start of the calendar days of linked representative days, and at the end
+    if matrix.get('linked', False):
+        x = matrix['solution'].x
+        results['battery_soc_day'] = x[matrix['columns']['BEL_DAY']].tolist()
+        results['tes_soc_day'] = x[matrix['columns']['TES_DAY']].tolist()
+    return results
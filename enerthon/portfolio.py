@@ -0,0 +1,229 @@
+from multiprocessing.connection import wait
+from pyomo.environ import Constraint, SolverFactory, Var
+from pyomo.core.expr.visitor import identify_variables
+from pyomo.common.log import LoggingIntercept
+from time import perf_counter as timer
+import multiprocessing
+import numpy as np
+import logging
+import json
+import os
+
+from enerthon.enerthon_model import OPTIMAL, _appsi_highs, _highs_available, clear_values, has_storage, solve_model
+from enerthon.jobs import kill_process
+from enerthon.profiling import record
+
+
+# Width of the kernel that weights observations by their distance in size, in factors of e of the nonzeros
+BANDWIDTH = 1.0
+
+
+def available(solver):
+    # True when the solver can run here, without solving anything
+    name = solver['name']
+    if name == 'highs':
+        return _highs_available()
+    if name == 'appsi_highs':
+        return _appsi_highs() is not None
+    # Pyomo logs a warning with a traceback for solvers it does not find
+    with LoggingIntercept(level=logging.ERROR):
+        optimizer = SolverFactory(name, executable=solver['path']) if 'path' in solver else SolverFactory(name)
+    return bool(optimizer.available(exception_flag=False))
+
+
+def instance_size(model_instance):
+    # Rows, columns and nonzeros of the instance, the nonzeros of every constraint block estimated from its last
+    # row. Close to model_size(), only the first periods of the storage balances have fewer terms, and far cheaper.
+    rows = 0
+    nonzeros = 0
+    for component in model_instance.component_objects(Constraint, active=True):
+        constraints = [c for c in component.values() if c.active]
+        if constraints:
+            rows += len(constraints)
+            nonzeros += len(constraints)*sum(1 for _ in identify_variables(constraints[-1].body, include_fixed=False))
+    columns = sum(len(component) for component in model_instance.component_objects(Var))
+
+    return {'rows': rows, 'columns': columns, 'nonzeros': nonzeros}
+
+
+class SolverHistory:
+    # Solve times by solver, instance size and storage, appended as JSON lines to path when given. Lines of
+    # profile() reports are read as well, from the solve_model phases. Times of solvers killed in a race are lower
+    # bounds of their solve time.
+
+    def __init__(self, path=None):
+        self.path = path
+        self.observations = []
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        observation = self._observation(json.loads(line))
+                    except ValueError:
+                        continue
+                    if observation is not None:
+                        self.observations.append(observation)
+
+    @staticmethod
+    def _observation(line):
+        if 'phase' in line:
+            info = line.get('info', {})
+            if line['phase'] != 'solve_model' or 'nonzeros' not in info or info.get('status') != OPTIMAL \
+                    or info.get('time_solve') is None or info.get('solver') == 'portfolio':
+                return None
+            return {'solver': info['solver'], 'rows': info['rows'], 'nonzeros': info['nonzeros'],
+                    'storage': info.get('storage'), 'time': info['time_solve'], 'censored': False}
+        if 'solver' in line and 'time' in line:
+            return line
+        return None
+
+    def add(self, solver, size, storage, time, censored=False):
+        observation = {'solver': solver, 'rows': size['rows'], 'nonzeros': size['nonzeros'], 'storage': storage,
+                       'time': time, 'censored': censored}
+        self.observations.append(observation)
+        if self.path is not None:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(observation) + '\n')
+
+    def _matching(self, solver, storage, censored):
+        # Observations of the solver on instances with the same storage, or with unknown storage
+        return [o for o in self.observations
+                if o['solver'] == solver and o.get('censored', False) == censored
+                and (o['storage'] is None or storage is None or o['storage'] == storage)]
+
+    def predict(self, solver, size, storage, censored=False):
+        # Solve time scaled from the observations, weighted towards those nearest in nonzeros. None without
+        # observations. With censored, from the times of killed solves, a lower bound of the solve time.
+        observations = self._matching(solver, storage, censored)
+        if not observations:
+            return None
+
+        nonzeros = max(size['nonzeros'], 1)
+        observed = np.array([max(o['nonzeros'], 1) for o in observations], dtype=float)
+        times = np.array([o['time'] for o in observations], dtype=float)
+        distance = np.log(observed/nonzeros)
+        weights = np.exp(-0.5*(distance/BANDWIDTH)**2)
+        # Solve times grow about linearly with the nonzeros of these LPs
+        scaled = np.log(np.maximum(times*nonzeros/observed, 1e-9))
+        if weights.sum() < 1e-12:
+            # Far from every observation, the nearest one counts
+            weights = (distance**2 == np.min(distance**2)).astype(float)
+        return float(np.exp(np.dot(weights, scaled)/weights.sum()))
+
+    def choose(self, solvers, size, storage):
+        # The solver with the lowest predicted time. Solvers only observed when killed count when their lower bound
+        # is below that time, then they have to race again, as do solvers never observed: None.
+        predictions = [self.predict(solver['name'], size, storage) for solver in solvers]
+        if all(p is None for p in predictions):
+            return None
+        best = int(np.nanargmin([np.nan if p is None else p for p in predictions]))
+        for solver, p in zip(solvers, predictions):
+            if p is None:
+                bound = self.predict(solver['name'], size, storage, censored=True)
+                if bound is None or bound < predictions[best]:
+                    return None
+        return solvers[best]
+
+
+def _race_solver(conn, model_instance, solver, tee, warm_start):
+    # Own process group, so that killing a loser also kills its solver subprocess
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    try:
+        solve_model(model_instance, solver, tee, warm_start)
+        values = [v.value for v in model_instance.component_data_objects(Var)]
+        conn.send((model_instance.solve_info, values))
+    except Exception as e:
+        conn.send(({'solver': solver['name'], 'status': 'error: %s: %s' % (type(e).__name__, e)}, None))
+    conn.close()
+
+
+def race(model_instance, solvers, tee=False, timeout=None, warm_start=None):
+    # Solves the instance with every solver at once and loads the first optimal solution. The instance is forked
+    # into the solver processes where possible and pickled otherwise. Returns the solve_info of every solver, with
+    # the time it took or ran until it was killed.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+
+    start = timer()
+    racers = dict()
+    for i, solver in enumerate(solvers):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_race_solver, args=(sender, model_instance, solver, tee, warm_start),
+                                  daemon=True)
+        process.start()
+        sender.close()
+        racers[receiver] = (i, process)
+
+    outcomes = [None]*len(solvers)
+    winner = None
+    try:
+        while racers and winner is None:
+            remaining = None if timeout is None else timeout - (timer() - start)
+            if remaining is not None and remaining <= 0:
+                break
+            ready = wait(list(racers), remaining)
+            for receiver in ready:
+                i, process = racers.pop(receiver)
+                try:
+                    solve_info, values = receiver.recv()
+                except EOFError:
+                    solve_info, values = {'solver': solvers[i]['name'],
+                                          'status': 'error: the solver process died'}, None
+                receiver.close()
+                process.join()
+                outcomes[i] = dict(solve_info, time=timer() - start, killed=False)
+                if winner is None and solve_info['status'] == OPTIMAL:
+                    winner = i
+                    for v, x in zip(model_instance.component_data_objects(Var), values):
+                        v.set_value(x, skip_validation=True)
+    finally:
+        elapsed = timer() - start
+        for receiver, (i, process) in racers.items():
+            kill_process(process)
+            process.join()
+            receiver.close()
+            outcomes[i] = {'solver': solvers[i]['name'], 'status': 'killed', 'time': elapsed, 'killed': True}
+
+    return winner, outcomes
+
+
+def solve_portfolio(model_instance, solver, tee=False, warm_start=None):
+    # solver is {'name': 'portfolio', 'solvers': [...], 'history': path, 'timeout': seconds}. With a history that
+    # has observed every available solver, the one predicted fastest for the size of the instance solves it alone.
+    # Otherwise the solvers race and the history learns from the race.
+    start = timer()
+    solvers = [s for s in solver['solvers'] if available(s)]
+    if not solvers:
+        raise RuntimeError('None of the portfolio solvers is available: %s'
+                           % ', '.join(s['name'] for s in solver['solvers']))
+
+    history = SolverHistory(solver.get('history'))
+    size = instance_size(model_instance)
+    storage = has_storage(model_instance)
+
+    chosen = history.choose(solvers, size, storage) if len(solvers) > 1 else solvers[0]
+    if chosen is not None:
+        solve_model(model_instance, chosen, tee, warm_start)
+        if model_instance.solve_info['status'] == OPTIMAL:
+            history.add(chosen['name'], size, storage, model_instance.solve_info['time_solve'])
+        model_instance.solve_info['portfolio'] = 'chosen'
+    else:
+        winner, outcomes = race(model_instance, solvers, tee, solver.get('timeout'), warm_start)
+        for outcome in outcomes:
+            if outcome['status'] == OPTIMAL or outcome['killed']:
+                history.add(outcome['solver'], size, storage, outcome['time'], censored=outcome['killed'])
+
+        if winner is None:
+            clear_values(model_instance)
+            solve_info = {'solver': 'portfolio', 'status': 'no optimal solution: ' + ', '.join(
+                '%s %s' % (outcome['solver'], outcome['status']) for outcome in outcomes), 'iterations': None}
+        else:
+            solve_info = {name: v for name, v in outcomes[winner].items() if name not in ('time', 'killed')}
+        solve_info['portfolio'] = 'race'
+        solve_info['race'] = outcomes
+        model_instance.solve_info = solve_info
+
+    model_instance.solve_info['time_portfolio'] = timer() - start
+    record(storage=storage, **size)
+    return model_instance
@@ -0,0 +1,232 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter, process_time
+import functools
+import json
+import logging
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Report of the profile() block running in this context, None when profiling is disabled
+_active = ContextVar('enerthon_profile', default=None)
+
+# Pyomo logs the construction time of every component to this logger
+_construction_logger = logging.getLogger('pyomo.common.timing.construction')
+
+
+class _ConstructionHandler(logging.Handler):
+
+    def emit(self, record):
+        report = _active.get()
+        if report is None or not report._stack:
+            return
+        timer = record.msg
+        obj = getattr(timer, 'obj', None)
+        if obj is None:
+            return
+        try:
+            size = len(obj)
+        except TypeError:
+            size = None
+        report._stack[-1]['components'].append({'name': timer.name, 'type': getattr(obj.ctype, '__name__', None),
+                                                'size': size, 'time': timer.timer})
+
+
+_handler = _ConstructionHandler()
+
+
+def _status(field):
+    # Linux reports the resident set size and its high water mark in kB
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    return None
+
+
+def _rss():
+    # Current and peak resident set size, the peak is the high water mark of the process
+    peak = _status('VmHWM:')
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024 if resource is not None else 0
+        return peak, peak
+    return _status('VmRSS:'), peak
+
+
+def _memory(memory):
+    if memory == 'tracemalloc':
+        return tracemalloc.get_traced_memory()
+    return _rss()
+
+
+class Report:
+    # Phases in the order they finished, nested phases come before the phase that contains them. peak_memory is
+    # the highest memory use during a phase above the use at its start, as resident set size ('rss') or as
+    # Python allocations ('tracemalloc', precise but slows down model building several times). The resident set
+    # size peak is the high water mark of the process, which is left alone: a phase that does not raise it above
+    # its reading at the start of the phase is only measured at its end.
+
+    def __init__(self, memory='rss'):
+        self.memory = memory
+        self.phases = []
+        self._stack = []
+        self._origin = perf_counter()
+        self.timestamp = time.time()
+
+    @staticmethod
+    def _phase_peak(record, current, peak):
+        # A peak that is no higher than the baseline was reached before the phase
+        return peak if peak > record['_baseline_peak'] else current
+
+    def _start(self, name):
+        current = peak = 0
+        if self.memory:
+            # The peak of the enclosing phase so far is kept before the baseline of this phase
+            current, peak = _memory(self.memory)
+            if self._stack:
+                self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], self._phase_peak(self._stack[-1], current,
+                                                                                          peak))
+            if self.memory == 'tracemalloc':
+                tracemalloc.reset_peak()
+                peak = current
+        start = perf_counter()
+        record = {'phase': name, 'depth': len(self._stack), 'start': start - self._origin, 'wall': None, 'cpu': None,
+                  'peak_memory': None, 'components': [], 'info': dict(),
+                  '_wall': start, '_cpu': process_time(), '_start_memory': current, '_baseline_peak': peak, '_peak': 0}
+        self._stack.append(record)
+        return record
+
+    def _stop(self, record):
+        record['wall'] = perf_counter() - record.pop('_wall')
+        record['cpu'] = process_time() - record.pop('_cpu')
+        peak = record.pop('_peak')
+        if self.memory:
+            peak = max(peak, self._phase_peak(record, *_memory(self.memory)))
+            record['peak_memory'] = max(peak - record['_start_memory'], 0)
+        record.pop('_start_memory')
+        record.pop('_baseline_peak')
+        self._stack.pop()
+        if self._stack and self.memory:
+            self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+        self.phases.append(record)
+
+    def __getitem__(self, name):
+        # The last finished phase with this name
+        for record in reversed(self.phases):
+            if record['phase'] == name:
+                return record
+        raise KeyError(name)
+
+    def total(self, name):
+        return sum(record['wall'] for record in self.phases if record['phase'] == name)
+
+    def to_dict(self):
+        return {'phases': self.phases}
+
+    def to_json_lines(self, f):
+        for record in self.phases:
+            f.write(json.dumps(dict(record, timestamp=self.timestamp)) + '\n')
+
+    def __str__(self):
+        lines = ['%-40s %10s %10s %12s' % ('phase', 'wall [s]', 'cpu [s]', 'peak [MB]')]
+        for record in sorted(self.phases, key=lambda r: r['start']):
+            peak = '%12.1f' % (record['peak_memory']/1e6) if record['peak_memory'] is not None else '%12s' % '-'
+            lines.append('%-40s %10.4f %10.4f %s' % ('  '*record['depth'] + record['phase'], record['wall'],
+                                                    record['cpu'], peak))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def profile(path=None, memory='rss', components=True):
+    # Record the phases run inside the block, appended as JSON lines to path when given. memory is 'rss',
+    # 'tracemalloc' or False.
+    report = Report(memory=memory)
+    token = _active.set(report)
+
+    started_tracing = memory == 'tracemalloc' and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    if components:
+        # Records are kept away from the handlers of the application
+        level, propagate = _construction_logger.level, _construction_logger.propagate
+        _construction_logger.addHandler(_handler)
+        _construction_logger.setLevel(logging.INFO)
+        _construction_logger.propagate = False
+
+    try:
+        with phase('total'):
+            yield report
+    finally:
+        _active.reset(token)
+        if components:
+            _construction_logger.removeHandler(_handler)
+            _construction_logger.setLevel(level)
+            _construction_logger.propagate = propagate
+        if started_tracing:
+            tracemalloc.stop()
+
+    if path is not None:
+        with open(path, 'a') as f:
+            report.to_json_lines(f)
+
+
+@contextmanager
+def phase(name):
+    report = _active.get()
+    if report is None:
+        yield None
+        return
+
+    record = report._start(name)
+    try:
+        yield record
+    finally:
+        report._stop(record)
+
+
+def record(**info):
+    # Attach information to the innermost running phase
+    report = _active.get()
+    if report is not None and report._stack:
+        report._stack[-1]['info'].update(info)
+
+
+def enabled():
+    return _active.get() is not None
+
+
+def model_size(model_instance):
+    # Rows, columns and nonzeros of a Pyomo model, walks every constraint expression
+    from pyomo.environ import Constraint, Var
+    from pyomo.core.expr.visitor import identify_variables
+
+    rows = 0
+    nonzeros = 0
+    for constraint in model_instance.component_data_objects(Constraint, active=True):
+        rows += 1
+        nonzeros += sum(1 for _ in identify_variables(constraint.body, include_fixed=False))
+    columns = sum(1 for v in model_instance.component_data_objects(Var) if not v.fixed)
+
+    return {'rows': rows, 'columns': columns, 'nonzeros': nonzeros}
+
+
+def timed(name):
+    # Decorator running the function as a phase, a single context variable lookup when profiling is disabled
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if _active.get() is None:
+                return f(*args, **kwargs)
+            with phase(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,200 @@
+from pyomo.environ import value
+import numpy as np
+import json
+
+
+# Result columns indexed by period and by month, with the model variables they are read from
+PERIOD_COLUMNS = [
+    ('cost_energy', 'COST_ENERGY'),
+    ('cost_grid_energy_import', 'COST_GRID_ENERGY_IMPORT'),
+    ('cost_grid_energy_export', 'COST_GRID_ENERGY_EXPORT'),
+    ('cost_fuel', 'COST_FUEL'),
+    ('power_buy', 'P_BUY'),
+    ('power_sell', 'P_SELL'),
+    ('battery_soc', 'BEL'),
+    ('battery_charge', 'B_IN'),
+    ('battery_discharge', 'B_OUT'),
+    ('tes_soc', 'TES'),
+    ('tes_charge', 'TES_IN'),
+    ('tes_discharge', 'TES_OUT'),
+    ('heat_pump_heat_generation', 'Q_HP'),
+    ('heat_pump_power_consumption', 'P_HP'),
+    ('boiler_heat_generation', 'Q_BO'),
+    ('boiler_fuel_consumption', 'F_BO'),
+]
+MONTH_COLUMNS = [
+    ('cost_grid_power_import', 'COST_GRID_POWER_IMPORT_MAX'),
+    ('cost_grid_power_export', 'COST_GRID_POWER_EXPORT_MAX'),
+]
+
+# Key order of the model_results() dict
+RESULTS = ['cost_total', 'cost_energy', 'cost_grid_energy_import', 'cost_grid_energy_export', 'cost_grid_power_import',
+           'cost_grid_power_export', 'cost_grid_power_fixed', 'cost_fuel', 'power_buy', 'power_sell', 'battery_soc',
+           'battery_charge', 'battery_discharge', 'tes_soc', 'tes_charge', 'tes_discharge', 'heat_pump_heat_generation',
+           'heat_pump_power_consumption', 'boiler_heat_generation', 'boiler_fuel_consumption']
+
+
+def _column_positions(solution, primal, var):
+    # Column of every variable of a Var component in the primal vector, -1 for variables without a column, fixed or
+    # eliminated. Kept on the instance while later solves compile the same columns, e.g. after update_model().
+    if 'ids' not in primal:
+        primal['ids'] = np.fromiter(map(id, primal['columns']), dtype=np.int64, count=len(primal['columns']))
+        cached = getattr(solution, '_column_positions', None)
+        if cached is None or not np.array_equal(cached['ids'], primal['ids']):
+            solution._column_positions = {'ids': primal['ids']}
+    positions = solution._column_positions
+    if var.name not in positions:
+        if 'order' not in positions:
+            positions['order'] = np.argsort(positions['ids'])
+            positions['sorted'] = positions['ids'][positions['order']]
+        ids = np.fromiter(map(id, var.values()), dtype=np.int64, count=len(var))
+        i = np.minimum(np.searchsorted(positions['sorted'], ids), len(positions['sorted']) - 1)
+        positions[var.name] = np.where(positions['sorted'][i] == ids, positions['order'][i], -1)
+    return positions[var.name]
+
+
+def _var_values(var, solution=None):
+    # Unset values, e.g. after a failed solve, become NaN. After a HiGHS solve the values are indexed from its
+    # primal vector by column, only variables without a column are read one by one.
+    primal = getattr(solution, '_primal', None)
+    if primal is None or len(primal['columns']) == 0:
+        return np.array([v.value for v in var.values()], dtype=float)
+
+    index = _column_positions(solution, primal, var)
+    values = primal['x'][index]
+    missing = index < 0
+    if missing.any():
+        values[missing] = np.array([v.value for v, m in zip(var.values(), missing) if m], dtype=float)
+    return values
+
+
+def _param_values(param):
+    return np.array([value(p) for p in param.values()], dtype=float)
+
+
+def _compact_values(solution, values):
+    # Columns that the compact formulation has no variables for, from the solved power and heat columns
+    column = dict(zip([var for _, var in PERIOD_COLUMNS], values.T))
+    dt = _param_values(solution.dt) if solution.dt.is_indexed() else value(solution.dt)
+    p_buy, p_sell = column['P_BUY'], column['P_SELL']
+
+    column['COST_ENERGY'][:] = (_param_values(solution.energy_price_buy)*p_buy
+                                - _param_values(solution.energy_price_sell)*p_sell)*dt
+    column['COST_GRID_ENERGY_IMPORT'][:] = _param_values(solution.grid_energy_import_fee)*p_buy*dt
+    column['COST_GRID_ENERGY_EXPORT'][:] = _param_values(solution.grid_energy_export_fee)*p_sell*dt
+    column['P_HP'][:] = column['Q_HP']/value(solution.heat_pump_cop)
+    column['F_BO'][:] = column['Q_BO']/value(solution.boiler_efficiency)
+    column['COST_FUEL'][:] = value(solution.fuel_price)*column['F_BO']*dt
+
+
+class Results:
+
+    def __init__(self, periods, values, months, monthly, cost_total, cost_grid_power_fixed):
+        # values and monthly are column-major, so every column is a contiguous array
+        self.periods = periods
+        self.values = np.asfortranarray(values)
+        self.months = months
+        self.monthly = np.asfortranarray(monthly)
+        self.cost_total = cost_total
+        self.cost_grid_power_fixed = cost_grid_power_fixed
+        self.columns = [name for name, _ in PERIOD_COLUMNS]
+        self.month_columns = [name for name, _ in MONTH_COLUMNS]
+
+    @classmethod
+    def from_model(cls, solution):
+        periods = np.array(list(solution.T), dtype=np.int64)
+        months = np.array(list(solution.M), dtype=np.int64)
+
+        values = np.empty((len(periods), len(PERIOD_COLUMNS)), order='F')
+        for i, (_, var) in enumerate(PERIOD_COLUMNS):
+            if solution.component(var) is not None:
+                values[:, i] = _var_values(solution.component(var), solution)
+        if getattr(solution, '_compact', False):
+            _compact_values(solution, values)
+
+        monthly = np.empty((len(months), len(MONTH_COLUMNS)), order='F')
+        for i, (_, var) in enumerate(MONTH_COLUMNS):
+            monthly[:, i] = _var_values(solution.component(var), solution)
+
+        primal = getattr(solution, '_primal', None)
+        cost_total = primal['objective'] if primal is not None else value(solution.total_cost, exception=False)
+        return cls(periods, values, months, monthly, cost_total, value(solution.COST_GRID_FIXED, exception=False))
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        x = matrix['solution'].x
+        columns = matrix['columns']
+        n = columns['P_BUY'].stop - columns['P_BUY'].start
+
+        values = np.empty((n, len(PERIOD_COLUMNS)), order='F')
+        for i, (_, var) in enumerate(PERIOD_COLUMNS):
+            values[:, i] = x[columns[var]]
+
+        monthly = np.empty((len(matrix['months']), len(MONTH_COLUMNS)), order='F')
+        for i, (_, var) in enumerate(MONTH_COLUMNS):
+            monthly[:, i] = x[columns[var]]
+
+        return cls(np.arange(1, n+1), values, np.asarray(matrix['months'], dtype=np.int64), monthly,
+                   matrix['solution'].fun, float(x[columns['COST_GRID_FIXED']][0]))
+
+    def __len__(self):
+        return len(self.periods)
+
+    def __getitem__(self, name):
+        if name in self.columns:
+            return self.values[:, self.columns.index(name)]
+        if name in self.month_columns:
+            return self.monthly[:, self.month_columns.index(name)]
+        if name in ['cost_total', 'cost_grid_power_fixed']:
+            return getattr(self, name)
+        raise KeyError(name)
+
+    def to_dict(self):
+        # Same layout as model_results(), with lists of values
+        s = dict()
+        for name in RESULTS:
+            v = self[name]
+            s[name] = v.tolist() if isinstance(v, np.ndarray) else v
+        return s
+
+    def to_pandas(self):
+        import pandas as pd
+        return pd.DataFrame(self.values, index=pd.Index(self.periods, name='period'), columns=self.columns, copy=False)
+
+    def monthly_to_pandas(self):
+        import pandas as pd
+        return pd.DataFrame(self.monthly, index=pd.Index(self.months, name='month'), columns=self.month_columns,
+                            copy=False)
+
+    def metadata(self):
+        return {'months': self.months.tolist(),
+                'monthly': {name: self[name].tolist() for name in self.month_columns},
+                'cost_total': self.cost_total,
+                'cost_grid_power_fixed': self.cost_grid_power_fixed}
+
+    def to_arrow(self):
+        import pyarrow as pa
+        # Contiguous float64 columns without nulls are wrapped without copying
+        arrays = [pa.array(self.periods)] + [pa.array(self.values[:, i]) for i in range(len(self.columns))]
+        return pa.Table.from_arrays(arrays, names=['period'] + self.columns,
+                                    metadata={'enerthon': json.dumps(self.metadata())})
+
+    def to_parquet(self, path, **kwargs):
+        import pyarrow.parquet as pq
+        pq.write_table(self.to_arrow(), path, **kwargs)
+
+    @classmethod
+    def from_arrow(cls, table):
+        metadata = json.loads(table.schema.metadata[b'enerthon'])
+        values = np.empty((table.num_rows, len(PERIOD_COLUMNS)), order='F')
+        for i, (name, _) in enumerate(PERIOD_COLUMNS):
+            values[:, i] = table.column(name).to_numpy()
+        monthly = np.column_stack([metadata['monthly'][name] for name, _ in MONTH_COLUMNS]) \
+            if metadata['months'] else np.empty((0, len(MONTH_COLUMNS)))
+        return cls(table.column('period').to_numpy(), values, np.array(metadata['months'], dtype=np.int64), monthly,
+                   metadata['cost_total'], metadata['cost_grid_power_fixed'])
+
+    @classmethod
+    def from_parquet(cls, path):
+        import pyarrow.parquet as pq
+        return cls.from_arrow(pq.read_table(path))
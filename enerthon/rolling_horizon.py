@@ -0,0 +1,112 @@
+import numpy as np
+
+from enerthon.enerthon_model import model, model_input, model_results, solve_model, update_model
+
+
+# Per-period results that are committed window by window
+PERIOD_RESULTS = ['cost_energy', 'cost_grid_energy_import', 'cost_grid_energy_export', 'cost_fuel',
+                  'power_buy', 'power_sell', 'battery_soc', 'battery_charge', 'battery_discharge',
+                  'tes_soc', 'tes_charge', 'tes_discharge', 'heat_pump_heat_generation',
+                  'heat_pump_power_consumption', 'boiler_heat_generation', 'boiler_fuel_consumption']
+
+
+def _window_data(data, start, stop, n):
+    window_data = dict()
+    for name, v in data.items():
+        if np.ndim(v) > 0 and len(v) == n:
+            window_data[name] = np.asarray(v)[start:stop]
+        else:
+            window_data[name] = v
+    return window_data
+
+
+def rolling_horizon(data, solver, window, commit, warm_start=False):
+
+    n = len(data['generation'])
+    if commit < 1 or commit > window:
+        raise ValueError('commit must be between 1 and the window length')
+
+    month_order = np.asarray(data['month_order'])
+    months = np.unique(month_order)
+    grid_power_import_fee = np.asarray(data['grid_power_import_fee'], dtype=float)
+    grid_power_export_fee = np.asarray(data['grid_power_export_fee'], dtype=float)
+    battery_capacity = data.get('battery_capacity', 0)
+    tes_capacity = data.get('tes_capacity', 0)
+
+    # Realised state carried over between windows
+    bel_ini_level = data.get('bel_ini_level', 0)
+    tes_ini_level = data.get('tes_ini_level', 0)
+    peak_import = dict.fromkeys(months.tolist(), 0.0)
+    peak_export = dict.fromkeys(months.tolist(), 0.0)
+
+    committed = {name: [] for name in PERIOD_RESULTS}
+    skeletons = dict()
+    windows = 0
+
+    start = 0
+    while start < n:
+        stop = min(start+window, n)
+
+        # Months are numbered within the window, the skeleton only depends on where month boundaries fall
+        window_months = month_order[start:stop]
+        boundaries = np.flatnonzero(np.diff(window_months))
+        local_months = np.searchsorted(np.unique(window_months), window_months) + 1
+
+        window_data = _window_data(data, start, stop, n)
+        window_data['month_order'] = local_months
+        window_data['bel_ini_level'] = bel_ini_level
+        window_data['tes_ini_level'] = tes_ini_level
+        window_data['grid_power_import_max_ini'] = {int(k): peak_import[m] for k, m in zip(local_months, window_months)}
+        window_data['grid_power_export_max_ini'] = {int(k): peak_export[m] for k, m in zip(local_months, window_months)}
+
+        # Terminal levels only apply to the end of the full horizon
+        if stop < n:
+            window_data['bel_fin_level'] = 0
+            window_data['tes_fin_level'] = 0
+
+        # A reused skeleton can start from the solution of the previous window it solved
+        key = (stop-start, tuple(boundaries))
+        reused = key in skeletons
+        if reused:
+            model_instance = skeletons[key]
+            update_model(model_instance, {name: v for name, v in window_data.items()
+                                          if name != 'month_order' and model_instance.component(name) is not None})
+        else:
+            model_instance = model(model_input(window_data), mutable=True)
+            skeletons[key] = model_instance
+
+        results = model_results(solve_model(model_instance, solver, warm_start=warm_start and reused or None))
+        windows += 1
+
+        # Commit the first periods, or the rest of the horizon in the last window
+        n_commit = stop-start if stop == n else commit
+        for name in PERIOD_RESULTS:
+            committed[name].extend(results[name][:n_commit])
+
+        power_net = np.array(results['power_buy'][:n_commit]) - np.array(results['power_sell'][:n_commit])
+        for t, p in zip(range(start, start+n_commit), power_net):
+            peak_import[month_order[t]] = max(peak_import[month_order[t]], grid_power_import_fee[t]*p)
+            peak_export[month_order[t]] = max(peak_export[month_order[t]], -grid_power_export_fee[t]*p)
+
+        if battery_capacity > 0:
+            bel_ini_level = results['battery_soc'][n_commit-1]/battery_capacity
+        if tes_capacity > 0:
+            tes_ini_level = results['tes_soc'][n_commit-1]/tes_capacity
+
+        start += n_commit
+
+
+    s = dict()
+
+    s['cost_grid_power_import'] = [peak_import[m] for m in months.tolist()]
+    s['cost_grid_power_export'] = [peak_export[m] for m in months.tolist()]
+    s['cost_grid_power_fixed'] = data['grid_fixed_fee']*len(months)
+    s['cost_total'] = sum(sum(committed[name]) for name in ['cost_energy', 'cost_grid_energy_import',
+                                                            'cost_grid_energy_export', 'cost_fuel']) \
+        + sum(s['cost_grid_power_import']) + sum(s['cost_grid_power_export']) + s['cost_grid_power_fixed']
+    s.update(committed)
+
+    s['windows'] = windows
+    s['skeletons'] = len(skeletons)
+
+    return s
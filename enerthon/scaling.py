@@ -0,0 +1,174 @@
+from pyomo.environ import Suffix, TransformationFactory
+import numpy as np
+
+from enerthon.profiling import timed
+
+
+# Passes of alternating row and column scaling, the factors hardly change after a few
+PASSES = 4
+
+
+def compile_model(model_instance):
+    from pyomo.repn.plugins.standard_form import LinearStandardFormCompiler
+    # Rows in mixed form keep their sense, as in the HiGHS solve
+    return LinearStandardFormCompiler().write(model_instance, mixed_form=True)
+
+
+def _blocks(components):
+    # Names of the constraint or variable blocks and the block of every row or column
+    names = dict()
+    index = np.fromiter((names.setdefault(c.parent_component().local_name, len(names)) for c in components),
+                        dtype=np.int64, count=len(components))
+    return list(names), index
+
+
+def _block_extremes(magnitude, block, n):
+    # Smallest and largest nonzero magnitude per block, nan for blocks without nonzeros
+    smallest = np.full(n, np.inf)
+    largest = np.zeros(n)
+    nonzero = magnitude > 0
+    np.minimum.at(smallest, block[nonzero], magnitude[nonzero])
+    np.maximum.at(largest, block[nonzero], magnitude[nonzero])
+    empty = largest == 0
+    smallest[empty] = np.nan
+    largest[empty] = np.nan
+    return smallest, largest
+
+
+def _power_of_two(factor):
+    # Scaling by powers of two is exact in floating point, the unscaled solution has no rounding errors
+    return np.exp2(np.round(np.log2(np.nan_to_num(factor, nan=1.0))))
+
+
+def block_scaling(A, row_block, column_block, passes=PASSES):
+    # Row and column factors, equal within every constraint and variable block, that bring the coefficients of
+    # every block towards one: scaled A = diag(rows) A diag(columns). Geometric mean scaling of the block extremes.
+    A = A.tocoo()
+    row, column, magnitude = A.row, A.col, np.abs(A.data)
+    row_factors = np.ones(row_block.max(initial=-1) + 1)
+    column_factors = np.ones(column_block.max(initial=-1) + 1)
+
+    for _ in range(passes):
+        scaled = magnitude*column_factors[column_block[column]]
+        smallest, largest = _block_extremes(scaled, row_block[row], len(row_factors))
+        row_factors = _power_of_two(1/np.sqrt(smallest*largest))
+
+        scaled = magnitude*row_factors[row_block[row]]
+        smallest, largest = _block_extremes(scaled, column_block[column], len(column_factors))
+        column_factors = _power_of_two(1/np.sqrt(smallest*largest))
+
+    return row_factors, column_factors
+
+
+def matrix_scaling(repn):
+    # block_scaling() factors of every row and column of a compiled instance
+    row_names, row_block = _blocks([row.constraint for row in repn.rows])
+    column_names, column_block = _blocks(repn.columns)
+    row_factors, column_factors = block_scaling(repn.A, row_block, column_block)
+    return row_factors[row_block], column_factors[column_block]
+
+
+def _stats(names, A, block, axis, factors=None, other=None):
+    # Coefficient range of every block, along rows (axis 0) or columns (axis 1) of A
+    A = A.tocoo()
+    magnitude = np.abs(A.data)
+    if factors is not None:
+        magnitude = magnitude*factors[0][A.row]*factors[1][A.col]
+    index = A.row if axis == 0 else A.col
+    smallest, largest = _block_extremes(magnitude, block[index], len(names))
+    sizes = np.bincount(block, minlength=len(names))
+
+    stats = []
+    for i, name in enumerate(names):
+        s = {'block': name, 'size': int(sizes[i]),
+             'min': float(smallest[i]), 'max': float(largest[i]), 'ratio': float(largest[i]/smallest[i])}
+        if other is not None:
+            s.update(other(i))
+        stats.append(s)
+    return stats
+
+
+@timed('conditioning_report')
+def conditioning_report(model_instance, worst=10):
+    # Coefficient ranges of the constraint and variable blocks before and after block_scaling(), the blocks with
+    # the widest ranges first, and of the whole matrix
+    repn = compile_model(model_instance)
+    A = repn.A.tocsr()
+    row_names, row_block = _blocks([row.constraint for row in repn.rows])
+    column_names, column_block = _blocks(repn.columns)
+    row_factors, column_factors = block_scaling(A, row_block, column_block)
+    factors = (row_factors[row_block], column_factors[column_block])
+
+    rhs = np.abs(np.asarray(repn.rhs, dtype=float))
+    cost = np.abs(repn.c.toarray()[0])
+
+    def rhs_range(i):
+        nonzero = rhs[(row_block == i) & (rhs > 0)]
+        return {'rhs_min': float(nonzero.min()) if len(nonzero) else 0.0,
+                'rhs_max': float(nonzero.max()) if len(nonzero) else 0.0,
+                'factor': float(row_factors[i])}
+
+    def cost_range(i):
+        nonzero = cost[(column_block == i) & (cost > 0)]
+        return {'cost_min': float(nonzero.min()) if len(nonzero) else 0.0,
+                'cost_max': float(nonzero.max()) if len(nonzero) else 0.0,
+                'factor': float(column_factors[i])}
+
+    rows = _stats(row_names, A, row_block, 0, other=rhs_range)
+    columns = _stats(column_names, A, column_block, 1, other=cost_range)
+    scaled_rows = _stats(row_names, A, row_block, 0, factors)
+    scaled_columns = _stats(column_names, A, column_block, 1, factors)
+    for s, scaled in zip(rows + columns, scaled_rows + scaled_columns):
+        s['scaled_ratio'] = scaled['ratio']
+
+    coo = A.tocoo()
+    nonzero = coo.data != 0
+    magnitude = np.abs(coo.data[nonzero])
+    scaled = magnitude*factors[0][coo.row[nonzero]]*factors[1][coo.col[nonzero]]
+
+    def worst_first(stats):
+        return sorted(stats, key=lambda s: -np.nan_to_num(s['ratio'], nan=0.0))[:worst]
+
+    return {'matrix': {'rows': A.shape[0], 'columns': A.shape[1], 'nonzeros': len(magnitude),
+                       'min': float(magnitude.min()), 'max': float(magnitude.max()),
+                       'ratio': float(magnitude.max()/magnitude.min()),
+                       'scaled_ratio': float(scaled.max()/scaled.min())},
+            'rows': worst_first(rows),
+            'columns': worst_first(columns)}
+
+
+def format_report(report):
+    m = report['matrix']
+    lines = ['%d rows, %d columns, %d nonzeros, coefficients %.3g to %.3g, ratio %.3g, scaled %.3g'
+             % (m['rows'], m['columns'], m['nonzeros'], m['min'], m['max'], m['ratio'], m['scaled_ratio'])]
+    for title, kind in [('constraint block', 'rows'), ('variable block', 'columns')]:
+        lines.append('')
+        lines.append('%-36s %8s %10s %10s %10s %10s %8s' % (title, 'size', 'min', 'max', 'ratio', 'scaled', 'factor'))
+        for s in report[kind]:
+            lines.append('%-36s %8d %10.3g %10.3g %10.3g %10.3g %8.3g' % (s['block'], s['size'], s['min'], s['max'],
+                                                                        s['ratio'], s['scaled_ratio'], s['factor']))
+    return '\n'.join(lines)
+
+
+def scale_model(model_instance):
+    # Scaled copy of the instance for solvers without access to the compiled matrix. Variables of a block are
+    # divided by the column factor, rows are multiplied by the row factor. unscale() loads its solution back.
+    repn = compile_model(model_instance)
+    row_names, row_block = _blocks([row.constraint for row in repn.rows])
+    column_names, column_block = _blocks(repn.columns)
+    row_factors, column_factors = block_scaling(repn.A, row_block, column_block)
+
+    model_instance.scaling_factor = Suffix(direction=Suffix.EXPORT)
+    try:
+        for name, factor in zip(row_names, row_factors):
+            model_instance.scaling_factor[model_instance.component(name)] = float(factor)
+        for name, factor in zip(column_names, column_factors):
+            model_instance.scaling_factor[model_instance.component(name)] = float(1/factor)
+        scaled = TransformationFactory('core.scale_model').create_using(model_instance, rename=False)
+    finally:
+        model_instance.del_component('scaling_factor')
+    return scaled
+
+
+def unscale(scaled, model_instance):
+    TransformationFactory('core.scale_model').propagate_solution(scaled, model_instance)
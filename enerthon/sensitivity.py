@@ -0,0 +1,120 @@
+from pyomo.environ import value
+import numpy as np
+
+
+# Storage components: level, charge and discharge variables, the balance, and the Params whose values scale with
+# the capacity in the bounds, the initial level and the fixed final level
+STORAGE = {
+    'battery': {'level': 'BEL', 'charge': 'B_IN', 'discharge': 'B_OUT', 'balance': 'battery_soc',
+                'min_level': 'battery_min_level', 'charge_max': 'battery_charge_max',
+                'discharge_max': 'battery_discharge_max', 'ini_level': 'bel_ini_level', 'fin_level': 'bel_fin_level'},
+    'tes': {'level': 'TES', 'charge': 'TES_IN', 'discharge': 'TES_OUT', 'balance': 'heat_storage_soc',
+            'min_level': 'tes_min_level', 'charge_max': 'tes_charge_max',
+            'discharge_max': 'tes_discharge_max', 'ini_level': 'tes_ini_level', 'fin_level': 'tes_fin_level'},
+}
+
+
+def _period_values(model_instance, name):
+    # A Param with one value per period or one for all periods, as an array over the periods
+    param = model_instance.component(name)
+    if param.is_indexed():
+        return np.array([value(p) for p in param.values()], dtype=float)
+    return np.full(len(model_instance.T), value(param), dtype=float)
+
+
+def _duals(model_instance, name):
+    # Duals of a constraint indexed by period, zero for periods without a row
+    constraint = model_instance.component(name)
+    if constraint is None:
+        return np.zeros(len(model_instance.T))
+    dual = model_instance.dual
+    return np.array([dual.get(constraint[t], 0.0) if t in constraint else 0.0 for t in model_instance.T],
+                    dtype=float)
+
+
+def _reduced_costs(model_instance, name):
+    # Fixed variables are no columns of the LP and have no reduced cost
+    rc = model_instance.rc
+    return np.array([rc.get(v, 0.0) for v in model_instance.component(name).values()], dtype=float)
+
+
+def _capacity_value(model_instance, storage, retention):
+    # Cost saved by one more unit of storage capacity, -d cost/d capacity, by period. The capacity scales the
+    # bounds of the level, charge and discharge, the initial level in the balances of periods without a previous
+    # period and the fixed final level. A reduced cost is the derivative of the cost by the bound that is active:
+    # the lower bound when positive, the upper bound when negative.
+    names = STORAGE[storage]
+    rc = _reduced_costs(model_instance, names['level'])
+    capacity_value = -np.where(rc > 0, value(model_instance.component(names['min_level']))*rc, rc)
+    capacity_value -= np.minimum(_reduced_costs(model_instance, names['charge']), 0) \
+        * value(model_instance.component(names['charge_max']))
+    capacity_value -= np.minimum(_reduced_costs(model_instance, names['discharge']), 0) \
+        * value(model_instance.component(names['discharge_max']))
+
+    # The right hand side of a first balance is retention*ini_level*capacity
+    y = _duals(model_instance, names['balance'])
+    previous = np.asarray(model_instance._previous_period)
+    first = previous == 0
+    capacity_value[first] -= y[first]*retention[first]*value(model_instance.component(names['ini_level']))
+
+    # A fixed final level moves to the right hand side of its own balance and of the balances that follow it
+    last = model_instance.T.last()
+    if model_instance.component(names['level'])[last].fixed:
+        following = previous == last
+        d_level = -y[-1] + np.sum(y[following]*retention[following])
+        capacity_value[-1] -= value(model_instance.component(names['fin_level']))*d_level
+
+    return capacity_value
+
+
+def _fee_shadow_price(model_instance, direction):
+    # d cost/d fee of the monthly power fee, -dual*d body/d fee summed over the rows of the power costs. Pyomo keeps
+    # cost >= fee*net as fee*net - cost <= 0, whose body grows with the fee by net.
+    rows = ('max_grid_power_%s_cost' if getattr(model_instance, '_compact', False) else 'grid_power_%s_cost') \
+        % direction
+    power_buy = np.array([v.value for v in model_instance.P_BUY.values()], dtype=float)
+    power_sell = np.array([v.value for v in model_instance.P_SELL.values()], dtype=float)
+    net = power_buy - power_sell if direction == 'import' else power_sell - power_buy
+
+    months = np.array(list(model_instance.M))
+    month = np.searchsorted(months, np.asarray(model_instance._month_order))
+    return np.bincount(month, weights=-_duals(model_instance, rows)*net, minlength=len(months))
+
+
+def has_duals(model_instance):
+    return model_instance.component('dual') is not None and len(model_instance.dual) > 0
+
+
+def shadow_prices(model_instance):
+    # Sensitivities of the cost of a solve with solver['duals'], from the duals and reduced costs of its LP:
+    # - marginal_electricity_value, marginal_heat_value: cost of one more kWh of electricity or heat demand in a
+    #   period, per kWh of the horizon, so comparable to the energy prices
+    # - battery_capacity_value, tes_capacity_value: cost saved by one more kWh of capacity, by the period whose
+    #   limits or balance it relaxes, and marginal_battery_capacity_value, marginal_tes_capacity_value their sums.
+    #   Not for sized capacities, the reduced costs of their variables are in the rc suffix, nor for linked
+    #   representative days, whose levels are bounded by the day levels.
+    # - grid_power_import_fee_shadow_price, grid_power_export_fee_shadow_price: cost of a one unit higher power fee
+    #   in every period of a month, by month. In the compact formulation periods without fee have no row and count
+    #   nothing.
+    # At degenerate solutions the duals are one of several valid values, the derivatives from the left and right
+    # differ and these lie between them.
+    if not has_duals(model_instance):
+        raise RuntimeError("The instance has no duals, solve it with solver['duals'] set")
+
+    energy = _period_values(model_instance, 'weight')*_period_values(model_instance, 'dt')
+    prices = {'marginal_electricity_value': -_duals(model_instance, 'power_balance')/energy,
+              'marginal_heat_value': _duals(model_instance, 'heat_balance')/energy}
+
+    sized = list(STORAGE) if getattr(model_instance, '_linked', False) else getattr(model_instance, '_sized', [])
+    retention = {'battery': np.ones(len(model_instance.T)),
+                 'tes': 1 - _period_values(model_instance, 'tes_losses')}
+    for storage in STORAGE:
+        if storage not in sized:
+            capacity_value = _capacity_value(model_instance, storage, retention[storage])
+            prices['%s_capacity_value' % storage] = capacity_value
+            prices['marginal_%s_capacity_value' % storage] = float(np.sum(capacity_value))
+
+    for direction in ['import', 'export']:
+        prices['grid_power_%s_fee_shadow_price' % direction] = _fee_shadow_price(model_instance, direction)
+
+    return prices
@@ -0,0 +1,43 @@
+from enerthon.enerthon_model import SIZING, horizon_years, model, model_input, model_results, solve_model
+from enerthon.sweep import sweep
+
+
+def annuity(investment, lifetime, rate):
+    # Yearly cost of an investment paid back over lifetime years at the interest rate, e.g. in €/kWh/year
+    if rate == 0:
+        return investment/lifetime
+    return investment*rate/(1 - (1 + rate)**-lifetime)
+
+
+def size_capacities(data, solver, sizing=True):
+    # Optimal capacities and dispatch of one LP, the capacities in SIZING are decision variables with their
+    # <name>_investment_cost in €/unit/year and optional <name>_capacity_max
+    return model_results(solve_model(model(model_input(data), sizing=sizing), solver))
+
+
+def sizing_check(data, solver, grid, results, processes=None):
+    # Compares the sized results to a sweep over fixed capacities, grid maps '<name>_capacity' to the values to
+    # try. Every sweep point is a feasible sizing, so none may be cheaper than the sized optimum.
+    sized = [name for name in SIZING if '%s_capacity' % name in grid]
+    years = horizon_years(model_input(data))
+
+    best = None
+    for record in sweep(data, grid, solver, processes=processes):
+        if record['results'] is None:
+            continue
+        investment = years*sum(data.get('%s_investment_cost' % name, 0)*record['scenario']['%s_capacity' % name]
+                               for name in sized)
+        cost = record['results']['cost_total'] + investment
+        if best is None or cost < best['cost_total']:
+            best = {'cost_total': cost, 'capacities': record['scenario']}
+
+    if best is None:
+        raise RuntimeError('No feasible scenario in the sweep')
+
+    return {
+        'cost_total': results['cost_total'],
+        'capacities': {'%s_capacity' % name: results['%s_capacity' % name] for name in sized},
+        'sweep_cost_total': best['cost_total'],
+        'sweep_capacities': best['capacities'],
+        'gap': (best['cost_total'] - results['cost_total'])/max(1.0, abs(results['cost_total'])),
+    }
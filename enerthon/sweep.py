@@ -0,0 +1,207 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from collections import namedtuple
+import numpy as np
+import itertools
+import os
+
+from enerthon.closed_form import closed_form_results
+from enerthon.enerthon_model import OPTIMAL, model, model_input, model_results, solve_model
+
+
+# Reference to an array placed in the shared memory block
+_Shared = namedtuple('_Shared', ['name'])
+
+# Worker state, set once per process by _init_worker
+_worker = dict()
+
+
+def cpu_count():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def scenarios(grid):
+    # A grid is either a list of scenario dicts or a dict of value lists that is expanded to all combinations.
+    # Dict values are merged into the data and identified by their position in the list.
+    if isinstance(grid, dict):
+        names = list(grid)
+        for combination in itertools.product(*[range(len(grid[name])) for name in names]):
+            key = dict()
+            overrides = dict()
+            for name, i in zip(names, combination):
+                option = grid[name][i]
+                if isinstance(option, dict):
+                    key[name] = i
+                    overrides.update(option)
+                else:
+                    key[name] = option
+                    overrides[name] = option
+            yield key, overrides
+    else:
+        for scenario in grid:
+            yield dict(scenario), dict(scenario)
+
+
+def share_arrays(arrays):
+    # Copy the arrays into one shared memory block, integers as int64 and everything else as float64
+    arrays = {name: np.asarray(a, dtype=np.int64 if np.asarray(a).dtype.kind in 'iub' else np.float64)
+              for name, a in arrays.items()}
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, sum(a.nbytes for a in arrays.values())))
+    layout = dict()
+    offset = 0
+    for name, a in arrays.items():
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf, offset=offset)[:] = a
+        layout[name] = (offset, a.dtype.str, a.shape)
+        offset += a.nbytes
+
+    return shm, layout
+
+
+def attach_arrays(shm_name, layout):
+    shm = shared_memory.SharedMemory(name=shm_name)
+
+    arrays = dict()
+    for name, (offset, dtype, shape) in layout.items():
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        arrays[name].flags.writeable = False
+
+    return shm, arrays
+
+
+def _init_worker(shm_name, layout, base, solver, cache):
+    _worker['shm'], _worker['arrays'] = attach_arrays(shm_name, layout)
+    _worker['base'] = base
+    _worker['solver'] = solver
+    _worker['cache'] = cache
+
+
+def _resolve(values):
+    return {name: _worker['arrays'][v.name] if isinstance(v, _Shared) else v for name, v in values.items()}
+
+
+def solve_scenario(data, solver, cache=None):
+    if cache is not None:
+        return cache.solve(data, solver)
+    model_data = model_input(data)
+    results = closed_form_results(model_data)
+    if results is not None:
+        return results
+    solution = solve_model(model(model_data), solver)
+    if solution.solve_info['status'] != OPTIMAL:
+        raise RuntimeError('No solution found, the scenario may be infeasible: %s' % solution.solve_info['status'])
+    return model_results(solution)
+
+
+def _run_scenario(key, overrides):
+    data = _resolve(_worker['base'])
+    data.update(_resolve(overrides))
+
+    try:
+        return {'scenario': key, 'results': solve_scenario(data, _worker['solver'], _worker['cache']), 'error': None}
+    except Exception as e:
+        return {'scenario': key, 'results': None, 'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def solve_chained(data, solver, previous=None, cache=None):
+    # solve_scenario() warm started from the previous solved instance of a chain, returns the results and the
+    # instance to warm start the next scenario from
+    model_data = model_input(data)
+    key = cache.key(model_data, solver) if cache is not None else None
+    results = cache.get(key) if cache is not None else None
+    if results is not None:
+        return results, None, previous
+
+    results = closed_form_results(model_data)
+    solve_info = None
+    if results is None:
+        solution = solve_model(model(model_data), solver, warm_start=previous)
+        if solution.solve_info['status'] != OPTIMAL:
+            raise RuntimeError('No solution found, the scenario may be infeasible: %s' % solution.solve_info['status'])
+        results = model_results(solution)
+        solve_info = solution.solve_info
+        previous = solution
+
+    if cache is not None:
+        cache.put(key, results)
+    return results, solve_info, previous
+
+
+def _run_chain(chain):
+    # Scenarios along the chained axis, solved in order so that each warm starts from its neighbour
+    records = []
+    previous = None
+    for key, overrides in chain:
+        data = _resolve(_worker['base'])
+        data.update(_resolve(overrides))
+        try:
+            results, solve_info, previous = solve_chained(data, _worker['solver'], previous, _worker['cache'])
+            records.append({'scenario': key, 'results': results, 'error': None, 'solve_info': solve_info})
+        except Exception as e:
+            records.append({'scenario': key, 'results': None, 'error': '%s: %s' % (type(e).__name__, e),
+                            'solve_info': None})
+    return records
+
+
+def chains(tasks, axis):
+    # Scenarios that only differ in the axis, in the order of the axis values in the grid
+    groups = dict()
+    for key, overrides in tasks:
+        other = tuple((name, repr(v)) for name, v in key.items() if name != axis)
+        groups.setdefault(other, []).append((key, overrides))
+    return list(groups.values())
+
+
+def sweep(data, grid, solver, processes=None, cache=None, chain=None):
+    # With chain set to a grid axis, the scenarios along that axis are solved in order by one worker, each warm
+    # started from the previous one, and records carry the solve_info of their solve
+
+    # Time series of the base data and array valued overrides are shared with the workers, not pickled per task
+    shared = dict()
+    base = dict()
+    for name, v in data.items():
+        if np.ndim(v) > 0:
+            shared[name] = v
+            base[name] = _Shared(name)
+        else:
+            base[name] = v
+
+    tasks = []
+    shared_ids = dict()
+    for key, overrides in scenarios(grid):
+        for name, v in overrides.items():
+            if np.ndim(v) > 0:
+                if id(v) not in shared_ids:
+                    shared_ids[id(v)] = '%d/%s' % (len(shared_ids), name)
+                    shared[shared_ids[id(v)]] = v
+                overrides[name] = _Shared(shared_ids[id(v)])
+        tasks.append((key, overrides))
+
+    shm, layout = share_arrays(shared)
+    pool = ProcessPoolExecutor(max_workers=processes or cpu_count(), initializer=_init_worker,
+                               initargs=(shm.name, layout, base, solver, cache))
+    try:
+        if chain is not None:
+            futures = {pool.submit(_run_chain, group): group for group in chains(tasks, chain)}
+        else:
+            futures = {pool.submit(_run_scenario, key, overrides): key for key, overrides in tasks}
+        for future in as_completed(futures):
+            try:
+                if chain is not None:
+                    yield from future.result()
+                else:
+                    yield future.result()
+            except Exception as e:
+                # The worker process died, e.g. killed by the OS
+                if chain is not None:
+                    for key, _ in futures[future]:
+                        yield {'scenario': key, 'results': None, 'error': '%s: %s' % (type(e).__name__, e),
+                               'solve_info': None}
+                else:
+                    yield {'scenario': futures[future], 'results': None, 'error': '%s: %s' % (type(e).__name__, e)}
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import json
+
+
+# Per-period series a tariff specification can set, fees default to zero when not given
+FEES = ['grid_energy_import_fee', 'grid_energy_export_fee', 'grid_power_import_fee', 'grid_power_export_fee']
+PRICES = ['energy_price_buy', 'energy_price_sell']
+
+# Calendar cells a rule can select, every period falls into exactly one (holiday, month, weekday, hour) cell
+CELLS = (2, 12, 7, 24)
+
+# Example tariffs of the Enerthon challenge
+EXAMPLES = {
+    # Example 1 - Fixed energy tariff
+    1: {'fixed': 14.5, 'grid_energy_import_fee': 0.045},
+
+    # Example 2 - Power based tariff
+    2: {'fixed': 14.1,
+        'grid_power_import_fee': [{'value': 12.6, 'months': [1,2,3,11,12]},
+                                  {'value': 7.5, 'months': range(4,11), 'weekdays': range(0,5), 'hours': range(9,19)}]},
+
+    # Example 3 - Time based tariff
+    3: {'fixed': 25.5,
+        'grid_energy_import_fee': [{'value': 0.009},
+                                   {'value': 0.058, 'months': [1,2,3,11,12], 'weekdays': range(0,5),
+                                    'hours': range(8,22)}]},
+}
+
+# Compiled calendars and tariffs, most recently used last
+CACHE_SIZE = 128
+_calendars = OrderedDict()
+_tariffs = OrderedDict()
+
+
+def _remember(cache, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+def _timestamps(index):
+    # Local wall clock time, tariffs are defined in the time zone of the index
+    if getattr(index, 'tz', None) is not None:
+        index = index.tz_localize(None)
+    return np.asarray(index, dtype='datetime64[ns]')
+
+
+def calendar(index, holidays=None):
+    # Position of every period in the flattened CELLS table
+    timestamps = _timestamps(index)
+    holidays = np.unique(np.asarray(holidays if holidays is not None else [], dtype='datetime64[D]'))
+
+    key = hashlib.sha256(timestamps.tobytes() + b'|' + holidays.tobytes()).hexdigest()
+    if key in _calendars:
+        _calendars.move_to_end(key)
+        return key, _calendars[key]
+
+    days = timestamps.astype('datetime64[D]')
+    month = timestamps.astype('datetime64[M]').astype(np.int64) % 12
+    # 1970-01-01 was a Thursday, weekday 0 is Monday
+    weekday = (days.astype(np.int64) + 3) % 7
+    hour = (timestamps - days).astype('timedelta64[h]').astype(np.int64)
+    holiday = np.isin(days, holidays).astype(np.int64)
+
+    cells = np.ravel_multi_index((holiday, month, weekday, hour), CELLS)
+    cells.flags.writeable = False
+    return key, _remember(_calendars, key, cells)
+
+
+def _selection(values, size, offset=0):
+    # Boolean selection over size options from None (all), a value, or a list/range of values
+    selected = np.zeros(size, dtype=bool)
+    if values is None:
+        selected[:] = True
+    else:
+        selected[np.atleast_1d(np.asarray(list(values) if isinstance(values, range) else values, dtype=int)) - offset] \
+            = True
+    return selected
+
+
+def _table(component):
+    # A component is a constant or a list of rules painted in order, later rules override earlier ones.
+    # Rules select months (1-12), weekdays (0 is Monday) and hours (0-23). holiday=True selects only holidays,
+    # holiday=False excludes them.
+    table = np.zeros(CELLS)
+    if np.ndim(component) == 0 and not isinstance(component, dict):
+        table[:] = component
+        return table
+
+    for rule in [component] if isinstance(component, dict) else component:
+        unknown = set(rule) - {'value', 'months', 'weekdays', 'hours', 'holiday'}
+        if unknown:
+            raise ValueError('Unknown tariff rule keys: %s' % ', '.join(sorted(unknown)))
+        holiday = rule.get('holiday')
+        mask = _selection(None if holiday is None else int(holiday), 2)[:, None, None, None] \
+            & _selection(rule.get('months'), 12, offset=1)[None, :, None, None] \
+            & _selection(rule.get('weekdays'), 7)[None, None, :, None] \
+            & _selection(rule.get('hours'), 24)[None, None, None, :]
+        table[mask] = rule['value']
+
+    return table
+
+
+def _spec_key(spec):
+    return json.dumps(spec, sort_keys=True, default=lambda v: list(v) if isinstance(v, range) else str(v))
+
+
+def compile_tariff(spec, index, holidays=None):
+    # Per-period fee arrays and the fixed fee for model_input(), read-only as they are shared through the cache
+    unknown = set(spec) - set(FEES) - set(PRICES) - {'fixed'}
+    if unknown:
+        raise ValueError('Unknown tariff components: %s' % ', '.join(sorted(unknown)))
+
+    calendar_key, cells = calendar(index, holidays)
+    key = (calendar_key, _spec_key(spec))
+    if key in _tariffs:
+        _tariffs.move_to_end(key)
+        return dict(_tariffs[key])
+
+    compiled = {'grid_fixed_fee': float(spec.get('fixed', 0))}
+    for name in FEES + PRICES:
+        if name in spec or name in FEES:
+            compiled[name] = _table(spec.get(name, 0)).ravel()[cells]
+            compiled[name].flags.writeable = False
+
+    return dict(_remember(_tariffs, key, compiled))
@@ -0,0 +1,85 @@
+import numpy as np
+
+from enerthon.enerthon_model import TES_LOSSES
+
+
+# Series that stay constant within a block: blocks end where they change, so months and power fees are exact
+BREAKS = ['month_order', 'grid_power_import_fee', 'grid_power_export_fee']
+
+
+def grid_blocks(data, segments):
+    # First period of every block of a variable time grid over the periods of data. segments are (hours,
+    # resolution) pairs from the start of the horizon, e.g. [(48, 0.25), (24*14, 1), (None, 4)] for 15 minutes
+    # over two days, hours over the next two weeks and four hour blocks after that. hours None is the rest of the
+    # horizon. Blocks never span a change of the BREAKS series, and periods longer than the resolution are kept.
+    n = len(data['generation'])
+    dt = np.broadcast_to(np.asarray(data.get('dt', 1), dtype=float), (n,))
+    if 'previous_period' in data or np.any(np.asarray(data.get('weight', 1)) != 1):
+        raise ValueError('A variable time grid needs consecutive periods without weights')
+
+    # Segment ends in hours from the start of the horizon
+    ends = []
+    elapsed = 0.0
+    for hours, resolution in segments:
+        if resolution <= 0:
+            raise ValueError('The resolution must be positive')
+        elapsed = np.inf if hours is None else elapsed + hours
+        ends.append(elapsed)
+    if ends[-1] < np.sum(dt) - 1e-9:
+        raise ValueError('The segments cover %g of the %g hours of the horizon' % (ends[-1], np.sum(dt)))
+
+    changed = np.zeros(n, dtype=bool)
+    for name in BREAKS:
+        if name in data and np.ndim(data[name]) > 0:
+            v = np.asarray(data[name])
+            changed[1:] |= v[1:] != v[:-1]
+
+    starts = []
+    start_time = np.concatenate([[0.0], np.cumsum(dt)[:-1]])
+    segment = 0
+    block_duration = 0.0
+    for k in range(n):
+        while start_time[k] >= ends[segment] - 1e-9:
+            segment += 1
+        resolution = segments[segment][1]
+        # A new block at a break, at a segment boundary or when the period does not fit into the block anymore
+        if k == 0 or changed[k] or start_time[k] >= ends[segment_of_block] - 1e-9 \
+                or block_duration + dt[k] > resolution + 1e-9:
+            starts.append(k)
+            block_duration = 0.0
+            segment_of_block = segment
+        block_duration += dt[k]
+
+    return np.array(starts, dtype=np.int64)
+
+
+def resample(data, segments):
+    # data on the variable time grid of grid_blocks(), with dt per period. Powers, prices and fees are averaged
+    # weighted by the period durations, which keeps energies and energy costs of a constant power in a block. The
+    # thermal storage retention of a block is the product of the retention of its periods. Monthly peaks of coarse
+    # blocks are peaks of their mean power.
+    n = len(data['generation'])
+    starts = grid_blocks(data, segments)
+    dt = np.broadcast_to(np.asarray(data.get('dt', 1), dtype=float), (n,))
+    durations = np.add.reduceat(dt, starts)
+
+    resampled = dict()
+    for name, v in data.items():
+        if np.ndim(v) == 0 or len(v) != n:
+            resampled[name] = v
+        elif name in BREAKS:
+            resampled[name] = np.asarray(v)[starts]
+        else:
+            resampled[name] = np.add.reduceat(np.asarray(v, dtype=float)*dt, starts)/durations
+    resampled['dt'] = durations
+
+    # Losses per original period
+    retention = np.broadcast_to(1 - np.asarray(data.get('tes_losses', TES_LOSSES), dtype=float), (n,))
+    resampled['tes_losses'] = 1 - np.multiply.reduceat(retention, starts)
+
+    return resampled
+
+
+def expand(values, starts, n):
+    # Values of the blocks repeated over the original periods, e.g. to compare results with a fine solve
+    return np.repeat(np.asarray(values), np.diff(np.append(starts, n)))
@@ -4,7 +4,11 @@ setup(
     name='enerthon_model',
     url='https://github.com/rebaseenergy/enerthon-project',
     packages=find_packages(exclude=["*tests*"]),
-    install_requires=['numpy', 'pyomo==5.7.3'],
+    # LinearStandardFormCompiler with mixed_form and eliminated_vars, used by the in-memory HiGHS solve and scaling
+    install_requires=['numpy', 'scipy', 'pyomo>=6.8'],
+    extras_require={'highs': ['highspy>=1.7'],
+                    'parquet': ['pandas', 'pyarrow'],
+                    'all': ['highspy>=1.7', 'pandas', 'pyarrow']},
     include_package_data=True,
     version='0.0.1',
     license='',
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+from enerthon.aggregation import aggregate, expand_results, solution_error
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.matrix_model import matrix_model, matrix_model_results, solve_matrix_model
+from test.cases import case, df
+
+
+solver = {'name': 'glpk'}
+
+
+def solve_matrix(data):
+    return matrix_model_results(solve_matrix_model(matrix_model(model_input(data)), {'name': 'highs'}))
+
+
+@pytest.mark.parametrize('example', [1, 2, 3])
+def test_aggregate(example):
+    data = case(df, example, 1)
+    reduced_data, aggregation = aggregate(data, 4)
+
+    assert np.sum(aggregation['weights']) == 365
+    assert len(reduced_data['generation']) < len(df)/6
+    assert np.sum(reduced_data['weight']*reduced_data['demand']) == pytest.approx(np.sum(data['demand']))
+
+    # Representative days start from the storage level of their calendar day
+    assert np.all(reduced_data['previous_period'].reshape(-1, 24)[:, 0] == 0)
+    assert len(reduced_data['day_sequence']) == 365
+
+    results = solve_matrix(data)
+    reduced_results = solve_matrix(reduced_data)
+    assert reduced_results['cost_total'] == pytest.approx(results['cost_total'], rel=0.01)
+    assert len(reduced_results['cost_grid_power_import']) == 12
+
+    expanded_results = expand_results(reduced_results, aggregation)
+    assert len(expanded_results['battery_soc']) == len(df)
+    assert expanded_results['cost_grid_power_import'] == reduced_results['cost_grid_power_import']
+    assert {'generation', 'demand', 'heat_demand', 'energy_price_buy'} <= set(aggregation['error'])
+
+    # The storage levels carried over the calendar stay within the limits
+    battery_soc = np.array(expanded_results['battery_soc'])
+    tes_soc = np.array(expanded_results['tes_soc'])
+    assert np.all(battery_soc >= -1e-6) and np.all(battery_soc <= data['battery_capacity'] + 1e-6)
+    assert np.all(tes_soc >= -1e-6) and np.all(tes_soc <= data['tes_capacity'] + 1e-6)
+
+
+def test_aggregate_prices():
+    # Hourly prices are clustered with the profiles, the mean keeps their sum over the days of a cluster
+    data = case(df, 1, 1)
+    rng = np.random.default_rng(0)
+    data['energy_price_buy'] = 0.08 + 0.04*np.sin(np.arange(len(df))*2*np.pi/24) + 0.01*rng.standard_normal(len(df))
+    reduced_data, aggregation = aggregate(data, 4)
+
+    assert len(aggregation['representatives']) <= 4*12
+    assert np.sum(reduced_data['weight']*reduced_data['energy_price_buy']) \
+        == pytest.approx(np.sum(data['energy_price_buy']))
+    assert aggregation['error']['energy_price_buy'] < 0.2
+    # The mean day loses the hourly noise of the prices and some of the arbitrage with it
+    assert solve_matrix(reduced_data)['cost_total'] == pytest.approx(solve_matrix(data)['cost_total'], rel=0.05)
+
+
+def test_aggregate_backends():
+    reduced_data, aggregation = aggregate(case(df.loc['2019-01-01':'2019-02-28'], 2, 1), 3)
+    model_data = model_input(reduced_data)
+
+    results = model_results(solve_model(model(model_data), solver))
+    matrix_results = matrix_model_results(solve_matrix_model(matrix_model(model_data), {'name': 'highs'}))
+
+    assert matrix_results['cost_total'] == pytest.approx(results['cost_total'], rel=1e-6)
+
+
+def test_aggregate_initial_level():
+    # A full battery at the start is worth the same on the representative days as on the full year
+    data = case(df, 1, 1)
+    reduced_data, aggregation = aggregate(data, 4)
+
+    gain = solve_matrix(data)['cost_total'] - solve_matrix(dict(data, bel_ini_level=1, bel_fin_level=0))['cost_total']
+    reduced_gain = solve_matrix(reduced_data)['cost_total'] \
+        - solve_matrix(dict(reduced_data, bel_ini_level=1, bel_fin_level=0))['cost_total']
+
+    assert gain > 0
+    assert reduced_gain == pytest.approx(gain, rel=0.2)
+
+
+def test_aggregate_clusters():
+    data = case(df, 3, 1)
+    for k in [4, 7]:
+        reduced_data, aggregation = aggregate(data, k)
+        month = np.asarray(data['month_order'])[::24][aggregation['representatives']]
+        assert np.all(np.bincount(month)[1:] <= k)
+
+    # Every power fee group needs a representative day besides the peak day
+    fee = np.tile(np.repeat([5.0, 7.5, 10.0], 24), 122)[:len(df)]
+    with pytest.raises(ValueError):
+        aggregate(dict(data, grid_power_import_fee=fee), 3)
+    assert len(aggregate(dict(data, grid_power_import_fee=fee), 4)[1]['representatives']) <= 4*12
+
+
+def test_solution_error():
+    data = case(df, 2, 1)
+    reduced_data, aggregation = aggregate(data, 4)
+    reduced_results = solve_matrix(reduced_data)
+    full_results = solve_matrix(data)
+
+    error = expand_results(reduced_results, aggregation, data)['error']
+    assert error['storage_violation'] < 1e-6
+    assert error['cost_total'] >= full_results['cost_total'] - 1e-6
+    assert error['cost_error'] \
+        == pytest.approx((reduced_results['cost_total'] - error['cost_total'])/error['cost_total'])
+
+    # The full solution replays to its own cost
+    error = solution_error(data, full_results)
+    assert error['cost_total'] == pytest.approx(full_results['cost_total'], rel=1e-6)
+    assert error['unmet_heat'] == pytest.approx(0, abs=1e-6)
@@ -0,0 +1,35 @@
+import numpy as np
+from benchmarks.benchmark import cases, compare, run_case, synthetic_profiles
+
+
+def test_synthetic_profiles():
+    profiles = synthetic_profiles(7, 15)
+
+    assert len(profiles['PV']) == 7*24*4
+    assert profiles['dt'] == 0.25
+    assert np.all(profiles['PV'] >= 0) and np.all(profiles['Load'] > 0) and np.all(profiles['Heat'] >= 0)
+    # No generation at night
+    assert np.all(profiles['PV'][:4*4] == 0)
+
+
+def test_cases():
+    names = [name for name, _ in cases('quick')]
+
+    assert len(names) == len(set(names)) == 2*2*3*3
+    assert '1w-60min-tariff2-nostorage-gridcharging' in names
+    assert '1w-60min-tariff2-nostorage-nogridcharging' not in names
+
+
+def test_compare():
+    result = run_case('1w', 60, 2, True, False, solver=None, solve=False, repeat=2)
+    assert result['periods'] == 168
+    assert set(result) == {'periods', 'model_input', 'model'}
+
+    baseline = {'cases': {'a': {'model': {'wall': 1.0, 'cpu': 1.0, 'peak_memory': 100e6}}}}
+    faster = {'cases': {'a': {'model': {'wall': 0.5, 'cpu': 0.5, 'peak_memory': 100e6}}}}
+    slower = {'cases': {'a': {'model': {'wall': 2.0, 'cpu': 2.0, 'peak_memory': 200e6}}}}
+
+    assert compare(faster, baseline, 0.25) == []
+    assert len(compare(slower, baseline, 0.25)) == 2
+    # Unknown cases are not compared
+    assert compare({'cases': {'b': slower['cases']['a']}}, baseline, 0.25) == []
@@ -0,0 +1,75 @@
+import numpy as np
+import os
+import pytest
+import time
+import enerthon.cache
+from enerthon.cache import ModelCache
+from enerthon.enerthon_model import model_input
+from enerthon.sweep import sweep
+from test.cases import case, df
+
+
+solver = {'name': 'glpk'}
+
+week = df.iloc[:24*7]
+
+
+def test_cache_hit(tmp_path, monkeypatch):
+    cache = ModelCache(str(tmp_path))
+    data = case(week, 2, 1)
+    results = cache.solve(data, solver)
+
+    # Identical data, rebuilt from lists, is served from the cache without solving
+    monkeypatch.setattr(enerthon.cache, 'solve_model', None)
+    assert cache.solve(case(week, 2, 1), solver) == results
+
+    key = cache.key(model_input(data), solver)
+    assert cache.key(model_input(dict(data, battery_capacity=4.0)), solver) != key
+    demand = np.array(data['demand'])
+    demand[5] += 1e-9
+    assert cache.key(model_input(dict(data, demand=demand)), solver) != key
+    assert cache.key(model_input(data), dict(solver, options={'tmlim': 10})) != key
+
+
+def test_persisted_lp(tmp_path, monkeypatch):
+    cache = ModelCache(str(tmp_path), persist_lp=True)
+    data = case(week, 3, 1)
+    results = cache.solve(data, {'name': 'highs'})
+
+    # Another solver setting solves the stored LP again without building it
+    monkeypatch.setattr(enerthon.cache, 'matrix_model', None)
+    other = cache.solve(data, {'name': 'highs-ipm'})
+    assert other['cost_total'] == pytest.approx(results['cost_total'], rel=1e-6)
+    assert len(os.listdir(tmp_path / 'lp')) == 1
+    assert len(os.listdir(tmp_path / 'results')) == 2
+
+    # Shadow prices need the duals of the Pyomo model, the stored LP is not used for them
+    dual_results = cache.solve(data, {'name': 'highs', 'duals': True})
+    assert 'marginal_electricity_value' in dual_results
+    assert dual_results['cost_total'] == pytest.approx(results['cost_total'], rel=1e-6)
+
+
+def test_lru_eviction(tmp_path):
+    cache = ModelCache(str(tmp_path), max_size=3000)
+    for i in range(3):
+        cache.put('key%d' % i, {'value': [float(i)]*100})
+        time.sleep(0.01)
+    cache.get('key0')
+    cache.put('key3', {'value': [3.0]*100})
+
+    assert cache.size() <= 3000
+    assert cache.get('key0') is not None
+    assert cache.get('key1') is None
+    assert cache.get('key3') == {'value': [3.0]*100}
+
+
+def test_sweep_with_cache(tmp_path):
+    cache = ModelCache(str(tmp_path))
+    grid = {'battery_capacity': [0.0, 5.0], 'tes_capacity': [0.0, 50.0]}
+    data = case(week, 1, 1)
+
+    records = {tuple(r['scenario'].items()): r['results'] for r in sweep(data, grid, solver, processes=2, cache=cache)}
+    assert len(os.listdir(tmp_path / 'results')) == 4
+
+    again = {tuple(r['scenario'].items()): r['results'] for r in sweep(data, grid, solver, processes=2, cache=cache)}
+    assert again == records
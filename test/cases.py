@@ -0,0 +1,52 @@
+import pandas as pd
+from enerthon.tariff import EXAMPLES, FEES, compile_tariff
+
+
+# Import data
+df = pd.read_csv('./data/data.zip', header = 0, index_col=0, parse_dates = True)
+
+# Assign value to every unique month-year
+df['month_order'] = df.index.month + (df.index.year - df.index.year[0])*12 - df.index.month[0]+1
+
+
+def tariff(df, example):
+    compiled = compile_tariff(EXAMPLES[example], df.index)
+    fees = pd.DataFrame({name: compiled[name] for name in FEES}, index=df.index)
+    return compiled['grid_fixed_fee'], fees
+
+
+def case(df, example, scenario):
+    fixed_charge, fees = tariff(df, example)
+
+    data = {'generation': (scenario*df['PV']).to_list(),
+            'demand': df['Load'].to_list(),
+            'heat_demand': df['Heat'].to_list(),
+
+            'battery_capacity': 5.0*scenario,
+            'battery_charge_max': 0.5,
+            'battery_discharge_max': 0.5,
+            'battery_efficiency_charge': 0.9,
+            'battery_efficiency_discharge': 0.9,
+
+            'tes_capacity': 100.0*scenario,
+            'tes_losses': 0.01,
+
+            'energy_price_buy': [0.08]*len(df),
+            'energy_price_sell': [0.04]*len(df),
+            'grid_fixed_fee': fixed_charge,
+            'grid_energy_import_fee': fees['grid_energy_import_fee'].to_list(),
+            'grid_energy_export_fee': fees['grid_energy_export_fee'].to_list(),
+            'grid_power_import_fee': fees['grid_power_import_fee'].to_list(),
+            'grid_power_export_fee': fees['grid_power_export_fee'].to_list(),
+
+            'fuel_price': 0.7,
+
+            'boiler_capacity': 25*(1-scenario),
+            'heat_pump_capacity': 25*scenario,
+            'heat_pump_cop': 3,
+
+            'month_order': df['month_order'].to_list(),
+            'dt': 1,
+    }
+
+    return data
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from enerthon.closed_form import closed_form_results, separable
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from test.cases import case, df
+
+
+# Falls back to glpk where HiGHS is not available
+solver = {'name': 'highs'}
+
+months = df.iloc[:24*59]
+
+
+def assert_same_results(results, reference):
+    assert list(results) == list(reference)
+    assert results['cost_total'] == pytest.approx(reference['cost_total'], rel=1e-8)
+    for name in ['cost_energy', 'cost_grid_energy_import', 'cost_fuel', 'cost_grid_power_import']:
+        assert np.sum(results[name]) == pytest.approx(np.sum(reference[name]), rel=1e-6, abs=1e-9)
+    assert results['cost_grid_power_fixed'] == pytest.approx(reference['cost_grid_power_fixed'])
+
+
+@pytest.mark.parametrize('example', [1, 2, 3])
+def test_base_case(example):
+    model_data = model_input(case(months, example, 0))
+
+    assert separable(model_data)
+    assert_same_results(closed_form_results(model_data), model_results(solve_model(model(model_data), solver)))
+
+
+@pytest.mark.parametrize('example', [1, 3])
+@pytest.mark.parametrize('grid_charging', [True, False])
+def test_merit_order(example, grid_charging):
+    # The boiler is cheaper than the heat pump on bought electricity, at least in the peak hours, but not on surplus
+    data = dict(case(months, example, 1), battery_capacity=0, tes_capacity=0, boiler_capacity=25,
+                heat_pump_capacity=4, fuel_price=0.035, battery_grid_charging=grid_charging)
+    model_data = model_input(data)
+    results = closed_form_results(model_data)
+
+    assert 0 < np.sum(results['boiler_heat_generation']) < np.sum(data['heat_demand'])
+    assert_same_results(results, model_results(solve_model(model(model_data), solver)))
+
+
+def test_not_separable():
+    # Storage
+    assert closed_form_results(model_input(case(months, 1, 1))) is None
+
+    # The heat pump share sets the monthly power peak
+    data = dict(case(months, 2, 1), battery_capacity=0, tes_capacity=0, boiler_capacity=25)
+    assert not separable(model_input(data))
+
+    # Selling above the buying price
+    data = dict(case(months, 1, 0), energy_price_sell=[0.2]*len(months))
+    assert not separable(model_input(data))
+
+    # Infeasible, left to the LP
+    assert closed_form_results(model_input(dict(case(months, 1, 0), boiler_capacity=0))) is None
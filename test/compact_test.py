@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from enerthon.enerthon_model import model, model_input, model_results, solve_model, update_model
+from enerthon.profiling import model_size
+from test.cases import case, df, tariff
+
+
+# Falls back to glpk where HiGHS is not available
+solver = {'name': 'highs'}
+
+weeks = df.loc['2019-01-25':'2019-02-07']
+
+
+@pytest.mark.parametrize('example', [1, 2, 3])
+@pytest.mark.parametrize('scenario', [0, 1])
+def test_compact_results(example, scenario):
+    data = dict(case(weeks, example, scenario), battery_grid_charging=False, bel_fin_level=0.5)
+    model_data = model_input(data)
+
+    results = model_results(solve_model(model(model_data), solver))
+    compact_results = model_results(solve_model(model(model_data, compact=True), solver))
+
+    assert list(compact_results) == list(results)
+    assert compact_results['cost_total'] == pytest.approx(results['cost_total'], rel=1e-8)
+    for name in ['cost_energy', 'cost_grid_energy_import', 'cost_grid_energy_export', 'cost_fuel',
+                 'cost_grid_power_import', 'heat_pump_power_consumption', 'boiler_fuel_consumption']:
+        assert np.sum(compact_results[name]) == pytest.approx(np.sum(results[name]), rel=1e-6, abs=1e-9)
+
+
+def test_compact_size():
+    model_data = model_input(case(weeks, 2, 1))
+    size = model_size(model(model_data))
+    compact_size = model_size(model(model_data, compact=True))
+
+    # Six columns and six rows fewer per period, power cost rows only where the fee is set
+    n = len(weeks)
+    assert size['columns'] - compact_size['columns'] == 8*n
+    assert size['rows'] - compact_size['rows'] >= 6*n
+
+
+def test_update_compact_model():
+    model_instance = model(model_input(case(weeks, 3, 1)), mutable=True, compact=True)
+    solve_model(model_instance, solver)
+
+    fixed_charge, fees = tariff(weeks, 2)
+    update = {'grid_fixed_fee': fixed_charge,
+              'grid_energy_import_fee': fees['grid_energy_import_fee'].to_list(),
+              'grid_power_import_fee': fees['grid_power_import_fee'].to_list(),
+              'grid_power_import_max_ini': {1: 200.0, 2: -5.0}}
+    results = model_results(solve_model(update_model(model_instance, update), solver))
+
+    data = case(weeks, 2, 1)
+    data.update(update)
+    rebuilt_results = model_results(solve_model(model(model_input(data)), solver))
+
+    assert results['cost_total'] == pytest.approx(rebuilt_results['cost_total'], rel=1e-6)
+    assert results['cost_grid_power_import'][0] == pytest.approx(200.0)
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import shutil
+import zipfile
+from enerthon.data import load_meters, load_profiles, meter
+from test.cases import df
+
+
+def test_load_profiles(tmp_path):
+    profiles = load_profiles('./data/data.zip', cache_dir=tmp_path)
+
+    assert np.array_equal(profiles['index'], df.index.tz_localize(None).to_numpy())
+    for name in ['PV', 'Load', 'Heat']:
+        assert np.array_equal(profiles[name], df[name].to_numpy(), equal_nan=True)
+    assert np.array_equal(profiles['month_order'], df['month_order'].to_numpy())
+
+    # The second load reads the memory-mapped cache
+    cached = load_profiles('./data/data.zip', cache_dir=tmp_path)
+    assert isinstance(cached['PV'], np.memmap)
+    assert np.array_equal(cached['Load'], profiles['Load'], equal_nan=True)
+
+
+def test_rebuild_on_change(tmp_path):
+    path = tmp_path / 'data.csv'
+    df.iloc[:48].to_csv(path)
+    assert len(load_profiles(str(path), cache_dir=tmp_path / 'cache')['PV']) == 48
+
+    df.iloc[:72].to_csv(path)
+    assert len(load_profiles(str(path), cache_dir=tmp_path / 'cache')['PV']) == 72
+    assert len(list((tmp_path / 'cache').iterdir())) == 1
+
+
+def test_same_name_in_other_directory(tmp_path):
+    # Files of the same name in different directories keep their caches side by side
+    for name, n in [('a', 48), ('b', 72)]:
+        (tmp_path / name).mkdir()
+        df.iloc[:n].to_csv(tmp_path / name / 'data.csv')
+        load_profiles(str(tmp_path / name / 'data.csv'), cache_dir=tmp_path / 'cache')
+
+    assert len(list((tmp_path / 'cache').iterdir())) == 2
+    assert len(load_profiles(str(tmp_path / 'a' / 'data.csv'), cache_dir=tmp_path / 'cache')['PV']) == 48
+
+
+def test_load_meters(tmp_path):
+    source = './data/onsta_gryta_daily_dh_csv.zip'
+    path = tmp_path / 'dh.zip'
+    with zipfile.ZipFile(source) as archive, zipfile.ZipFile(path, 'w') as subset:
+        members = sorted(archive.namelist())[:5]
+        for member in members:
+            subset.writestr(member, archive.read(member))
+
+    meters = load_meters(str(path), cache_dir=tmp_path / 'cache')
+    assert len(meters['meters']) == 5
+    assert meters['offsets'][-1] == len(meters['value'])
+
+    with zipfile.ZipFile(source) as archive, archive.open(members[2]) as f:
+        expected = pd.read_csv(f, index_col=0)
+    columns = meter(meters, meters['meters'][2])
+    assert np.array_equal(columns['date'], pd.to_datetime(expected['Date']).to_numpy().astype('datetime64[D]'))
+    assert np.array_equal(columns['value'], expected['Value'].to_numpy(), equal_nan=True)
+    assert np.array_equal(columns['nan_flag'], expected['nan_flag'].to_numpy())
+    assert columns['month_order'][0] == 1
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from enerthon.decomposition import monthly_decomposition
+from test.cases import case, df
+
+
+quarter = df.loc['2019-01-01':'2019-03-31']
+
+
+@pytest.mark.parametrize('example', [2, 3])
+def test_monthly_decomposition(example):
+    data = case(quarter, example, 1)
+    data['bel_fin_level'] = 0.5
+
+    results = monthly_decomposition(data, processes=2, tolerance=1e-5, monolithic=True)
+
+    assert results['gap'] <= 1e-5
+    assert results['lower_bound'] <= results['monolithic_cost_total'] + 1e-6
+    assert results['cost_total'] == pytest.approx(results['monolithic_cost_total'], rel=1e-5)
+    assert results['boundary_slack'] == pytest.approx(0, abs=1e-6)
+    assert len(results['cost_grid_power_import']) == 3
+    assert len(results['power_buy']) == len(quarter)
+    assert results['battery_soc'][-1] == pytest.approx(2.5)
+
+    # Storage levels are continuous across the month boundaries
+    soc = np.array(results['battery_soc'])
+    charge = np.array(results['battery_charge'])*0.9 - np.array(results['battery_discharge'])/0.9
+    assert np.diff(soc) == pytest.approx(charge[1:], abs=1e-6)
+
+
+def test_unreachable_boundary_levels():
+    # A battery that cannot charge misses the boundary levels of the first iteration, the penalty is not a cost
+    data = case(quarter, 2, 1)
+    data.update({'battery_charge_max': 0, 'battery_discharge_max': 0})
+
+    with pytest.warns(UserWarning, match='boundary storage levels'):
+        results = monthly_decomposition(data, processes=2, max_iterations=1, monolithic=True)
+    assert results['boundary_slack'] > 0
+    assert results['monolithic_cost_total'] - 1e-6 <= results['cost_total'] <= 1.01*results['monolithic_cost_total']
+    assert results['monolithic_gap'] == pytest.approx(
+        (results['cost_total'] - results['monolithic_cost_total'])/results['monolithic_cost_total'])
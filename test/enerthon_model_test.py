@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.tariff import compile_tariff
 
 
 # Import data
@@ -23,53 +24,31 @@ df['price_sell'] = 0.04 # Є/kWh
 #%% Tarrif structures
 
 # Example 1 - Fixed energy tariff
-fixed_charge = 14.5 # Є/Month
-
-df['grid_energy_import_fee'] = 0.045 # Є/kWh
-df['grid_energy_export_fee'] = 0 # Є/kWh
-df['grid_power_import_fee'] = 0 # Є/kW-month
-df['grid_power_export_fee'] = 0 # Є/kW-month
+example_1 = {'fixed': 14.5, # Є/Month
+             'grid_energy_import_fee': 0.045} # Є/kWh
 
 
 
 
 # Example 2 - Power based tariff
-fixed_charge = 14.1 # Є/Month
-
-df['grid_energy_import_fee'] = 0 # Є/kWh
-df['grid_energy_export_fee'] = 0 # Є/kWh
-df['grid_power_import_fee'] = 0 # Є/kW-month
-df['grid_power_export_fee'] = 0 # Є/kW-month
-
-# Set grid energy fee for different months, days and hours
-for i in [1,2,3,11,12]:
-    df.loc[(df.index.month == i),'grid_power_import_fee'] = 12.6 # Є/kW-month
-
-for i in [4,5,6,7,8,9,10]:
-    for j in list(range(0,5)):
-        for k in list(range(9,19)):
-            df.loc[(df.index.month == i) & (df.index.weekday == j) & (df.index.hour == k),'grid_power_import_fee'] = 7.5 # Є/kW-month
+example_2 = {'fixed': 14.1, # Є/Month
+             # Set grid power fee for different months, days and hours (Є/kW-month)
+             'grid_power_import_fee': [{'value': 12.6, 'months': [1,2,3,11,12]},
+                                       {'value': 7.5, 'months': range(4,11), 'weekdays': range(0,5), 'hours': range(9,19)}]}
 
 
 
 
 # Example 3 - Time based tariff
-fixed_charge = 25.5 # Є/Month
-
-df['grid_energy_import_fee'] = 0.009 # Є/kWh
-df['grid_energy_export_fee'] = 0 # Є/kWh
-df['grid_power_import_fee'] = 0 # Є/kW-month
-df['grid_power_export_fee'] = 0 # Є/kW-month
-
-# Set grid energy fee for different months, days and hours
-for i in [1,2,3,11,12]:
-    for j in list(range(0,5)):
-        for k in list(range(8,22)):
-            df.loc[(df.index.month == i) & (df.index.weekday == j) & (df.index.hour == k),'grid_energy_import_fee'] = 0.058 # Є/kWh
-
-
-for i in [4,5,6,7,8,9,10]:
-    df.loc[(df.index.month == i),'grid_energy_import_fee'] = 0.009 # Є/kWh
+example_3 = {'fixed': 25.5, # Є/Month
+             # Set grid energy fee for different months, days and hours (Є/kWh)
+             'grid_energy_import_fee': [{'value': 0.009},
+                                        {'value': 0.058, 'months': [1,2,3,11,12], 'weekdays': range(0,5), 'hours': range(8,22)}]}
+
+tariff = compile_tariff(example_3, df.index)
+fixed_charge = tariff.pop('grid_fixed_fee')
+for name, fee in tariff.items():
+    df[name] = fee
 
 
 
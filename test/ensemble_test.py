@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import enerthon.enerthon_model
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.ensemble import solve_ensemble
+from test.cases import case, df
+
+
+pytestmark = pytest.mark.skipif(not enerthon.enerthon_model._highs_available(), reason='highspy is not available')
+
+solver = {'name': 'highs'}
+
+days = df.iloc[24*150:24*153]
+
+
+def forecasts(data, n_members, seed=0):
+    rng = np.random.default_rng(seed)
+    generation = np.asarray(data['generation'])
+    demand = np.asarray(data['demand'])
+    return {'generation': np.maximum(generation*(1 + 0.3*rng.standard_normal((n_members, len(generation)))), 0),
+            'demand': demand*(1 + 0.1*rng.standard_normal((n_members, len(demand))))}
+
+
+def test_independent_members_match_single_solves():
+    data = case(days, 2, 1)
+    ensemble = forecasts(data, 5)
+    statistics = solve_ensemble(data, ensemble, solver)
+
+    costs = []
+    soc = []
+    for s in range(5):
+        member = dict(data, generation=ensemble['generation'][s], demand=ensemble['demand'][s])
+        results = model_results(solve_model(model(model_input(member)), solver))
+        costs.append(results['cost_total'])
+        soc.append(results['battery_soc'])
+
+    assert statistics['members'] == 5
+    assert statistics['costs'] == pytest.approx(costs, rel=1e-6)
+    assert statistics['cost_total']['mean'] == pytest.approx(np.mean(costs), rel=1e-6)
+    assert statistics['cost_total']['min'] == pytest.approx(min(costs), rel=1e-6)
+    assert statistics['cost_total']['quantiles'][0.5] == pytest.approx(np.sort(costs)[2], rel=1e-6)
+    assert len(statistics['battery_soc']['mean']) == len(days)
+    quantiles = statistics['tes_soc']['quantiles']
+    assert np.all(np.array(quantiles[0.05]) <= np.array(quantiles[0.95]) + 1e-9)
+
+
+def test_stochastic_first_stage():
+    data = case(days, 1, 1)
+    ensemble = forecasts(data, 4, seed=1)
+    independent = solve_ensemble(data, ensemble, solver)
+
+    # Without shared hours the members are independent
+    separate = solve_ensemble(data, ensemble, solver, stochastic_hours=0)
+    assert separate['cost_total']['mean'] == pytest.approx(independent['cost_total']['mean'], rel=1e-6)
+
+    # Committing to one dispatch for the first six hours costs at least as much on average
+    stochastic = solve_ensemble(data, ensemble, solver, stochastic_hours=6)
+    assert stochastic['cost_total']['mean'] >= independent['cost_total']['mean'] - 1e-6
+    assert len(stochastic['first_stage']['battery_charge']) == 6
+    assert set(stochastic['first_stage']) == {'battery_charge', 'battery_discharge', 'tes_charge', 'tes_discharge',
+                                              'heat_pump_heat_generation', 'boiler_heat_generation'}
+    # The shared dispatch gives every member the same storage levels over the first hours
+    assert np.array(stochastic['battery_soc']['quantiles'][0.05][:6]) == \
+        pytest.approx(stochastic['battery_soc']['quantiles'][0.95][:6], abs=1e-6)
+
+
+def test_probabilities():
+    data = case(days, 2, 1)
+    ensemble = forecasts(data, 3, seed=2)
+    weighted = solve_ensemble(data, ensemble, solver, probabilities=[1.0, 0.0, 0.0])
+    assert weighted['cost_total']['mean'] == pytest.approx(weighted['costs'][0], rel=1e-9)
+    assert weighted['cost_total']['quantiles'][0.5] == pytest.approx(weighted['costs'][0], rel=1e-9)
+
+    with pytest.raises(ValueError, match='probabilities'):
+        solve_ensemble(data, ensemble, solver, probabilities=[0.5, 0.5])
+    with pytest.raises(ValueError, match='Only'):
+        solve_ensemble(data, dict(ensemble, energy_price_buy=ensemble['demand']), solver)
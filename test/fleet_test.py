@@ -0,0 +1,134 @@
+import numpy as np
+import os
+import pandas as pd
+import pytest
+import enerthon.enerthon_model
+import enerthon.fleet
+from enerthon.fleet import FleetSummary, buildings_from_table, fleet, kpis, read_checkpoint
+from enerthon.sweep import solve_scenario
+from test.cases import case, df
+
+
+solver = {'name': 'highs'}
+
+week = df.iloc[:24*7]
+
+pytestmark = pytest.mark.skipif(not enerthon.enerthon_model._highs_available(), reason='highspy is not available')
+
+BUILDINGS = ['demand', 'generation', 'heat_demand', 'battery_capacity', 'tes_capacity', 'boiler_capacity',
+             'heat_pump_capacity']
+
+
+def split(data, scales):
+    # Common data of the fleet and the buildings with scaled profiles and equipment
+    common = {name: v for name, v in data.items() if name not in BUILDINGS}
+    buildings = dict()
+    for i, scale in enumerate(scales):
+        buildings['building-%d' % i] = {name: np.asarray(data[name])*scale if np.ndim(data[name]) else data[name]*scale
+                                        for name in BUILDINGS}
+    return common, buildings
+
+
+def test_fleet_matches_single_solves():
+    common, buildings = split(case(week, 2, 1), [0.5, 1.0, 1.5, 2.0])
+    summary = FleetSummary()
+    records = dict()
+    for record in fleet(common, buildings_from_table(buildings), solver, processes=2, max_pending=2):
+        summary.add(record)
+        records[record['building']] = record
+
+    assert set(records) == set(buildings)
+    costs = []
+    for building, data in buildings.items():
+        results = solve_scenario(dict(common, **data), solver)
+        assert records[building]['error'] is None
+        assert records[building]['kpis'] == pytest.approx(kpis(results))
+        costs.append(results['cost_total'])
+
+    s = summary.to_dict()
+    assert s['buildings'] == 4
+    assert s['failed'] == 0
+    assert s['total_cost_total'] == pytest.approx(sum(costs))
+    assert s['max_cost_total'] == pytest.approx(max(costs))
+
+
+def test_fleet_from_dataframe():
+    common, buildings = split(case(week, 1, 1), [1.0, 2.0])
+    table = pd.DataFrame.from_dict(buildings, orient='index')
+
+    records = list(fleet(common, buildings_from_table(table), solver, processes=1))
+    assert sorted(record['building'] for record in records) == sorted(buildings)
+    assert all(record['error'] is None for record in records)
+
+
+def test_fleet_resumes_from_checkpoint(tmp_path):
+    common, buildings = split(case(week, 3, 1), [1.0, 2.0, 3.0])
+    checkpoint = str(tmp_path/'fleet.jsonl')
+
+    # A run that stops after the first building
+    first = next(fleet(common, buildings_from_table(buildings), solver, processes=1, max_pending=1,
+                       checkpoint=checkpoint))
+    assert list(read_checkpoint(checkpoint)) == ['"%s"' % first['building']]
+
+    records = list(fleet(common, buildings_from_table(buildings), solver, processes=1, checkpoint=checkpoint))
+    resumed = [record for record in records if record['resumed']]
+    assert [record['building'] for record in resumed] == [first['building']]
+    assert resumed[0]['kpis'] == pytest.approx(first['kpis'])
+    assert sorted(record['building'] for record in records) == sorted(buildings)
+    assert len(read_checkpoint(checkpoint)) == 3
+
+
+def test_fleet_retries_buildings_of_dead_workers(tmp_path, monkeypatch):
+    # The worker solving 'crash' dies once, workers are forked with the patched solve
+    common, buildings = split(case(week, 2, 1), [1.0, 2.0])
+    buildings = {'building-0': buildings['building-0'], 'crash': dict(buildings['building-0'], crash=True),
+                 'building-1': buildings['building-1']}
+    marker = tmp_path/'crashed'
+
+    def solve(data, solver, cache=None):
+        if data.pop('crash', False) and not marker.exists():
+            marker.touch()
+            os._exit(1)
+        return solve_scenario(data, solver, cache)
+
+    monkeypatch.setattr(enerthon.fleet, 'solve_scenario', solve)
+    checkpoint = str(tmp_path/'fleet.jsonl')
+
+    records = {record['building']: record for record in fleet(common, buildings_from_table(buildings), solver,
+                                                               processes=1, max_pending=1, checkpoint=checkpoint)}
+    assert 'BrokenProcessPool' in records['crash']['error']
+    assert records['building-1']['error'] is None
+    assert sorted(read_checkpoint(checkpoint)) == ['"building-0"', '"building-1"']
+
+    # The lost building is solved by the next run
+    records = list(fleet(common, buildings_from_table(buildings), solver, processes=1, checkpoint=checkpoint))
+    assert [record['building'] for record in records if not record['resumed']] == ['crash']
+    assert records[-1]['error'] is None
+    assert len(read_checkpoint(checkpoint)) == 3
+
+
+def test_fleet_reports_failed_buildings():
+    common, buildings = split(case(week, 1, 1), [1.0])
+    # Without heat pump nor boiler the heat demand cannot be covered
+    buildings['no-heating'] = dict(buildings['building-0'], heat_pump_capacity=0.0, boiler_capacity=0.0)
+
+    summary = FleetSummary()
+    for record in fleet(common, buildings_from_table(buildings), solver, processes=1):
+        summary.add(record)
+        if record['building'] == 'no-heating':
+            assert 'infeasible' in record['error']
+
+    assert summary.to_dict()['buildings'] == 1
+    assert summary.to_dict()['failed'] == 1
+
+
+def test_kpis_period_lengths():
+    results = {'cost_total': 1.0, 'power_buy': [1.0, 2.0, 0.0], 'power_sell': [0.0, 0.0, 3.0],
+               'heat_pump_power_consumption': [1.0, 1.0, 1.0], 'boiler_fuel_consumption': [0.0, 1.0, 0.0]}
+    k = kpis(results, dt=np.array([1.0, 0.5, 0.25]), weight=np.array([1.0, 2.0, 4.0]))
+
+    assert k['energy_buy'] == pytest.approx(3.0)
+    assert k['energy_sell'] == pytest.approx(3.0)
+    assert k['heat_pump_energy'] == pytest.approx(3.0)
+    assert k['boiler_fuel'] == pytest.approx(1.0)
+    assert k['peak_buy'] == 2.0
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import pytest
+import enerthon.enerthon_model
+from enerthon.jobs import JobQueue, serve
+from enerthon.sweep import solve_scenario
+from test.cases import case, df
+
+
+solver = {'name': 'highs'}
+
+week = df.iloc[:24*7]
+year = df.iloc[:24*365]
+
+pytestmark = pytest.mark.skipif(not enerthon.enerthon_model._highs_available(), reason='highspy is not available')
+
+
+def test_submit_returns_results():
+    data = case(week, 2, 1)
+
+    async def run():
+        async with JobQueue(solver, processes=2) as queue:
+            job_ids = [queue.submit(data), queue.submit(dict(data, battery_capacity=0.0), 'planning')]
+            assert all(queue.status(job_id)['state'] in ('queued', 'running') for job_id in job_ids)
+            return [await queue.result(job_id) for job_id in job_ids], [queue.status(job_id) for job_id in job_ids]
+
+    results, status = asyncio.run(run())
+    assert results[0]['cost_total'] == pytest.approx(solve_scenario(data, solver)['cost_total'], rel=1e-6)
+    assert results[1]['cost_total'] > results[0]['cost_total']
+    assert [s['state'] for s in status] == ['done', 'done']
+    assert status[1]['lane'] == 'planning'
+
+
+def test_timeout_and_cancel_kill_the_solver():
+    data = case(year, 3, 1)
+
+    async def run():
+        async with JobQueue(solver, processes=2) as queue:
+            timed_out = queue.submit(data, 'planning', timeout=0.5)
+            cancelled = queue.submit(data)
+            await asyncio.sleep(0.5)
+            process = queue.jobs[cancelled].process
+            assert queue.cancel(cancelled)
+
+            with pytest.raises(RuntimeError, match='Timed out'):
+                await queue.result(timed_out)
+            with pytest.raises(asyncio.CancelledError):
+                await queue.result(cancelled)
+            assert not queue.cancel(cancelled)
+            return queue.status(timed_out), queue.status(cancelled), process, queue.stats()
+
+    timed_out, cancelled, process, stats = asyncio.run(run())
+    assert timed_out['state'] == 'timeout'
+    assert timed_out['run_time'] < 5
+    assert cancelled['state'] == 'cancelled'
+    assert not process.is_alive()
+    assert stats['running'] == 0
+
+
+def test_operational_lane_goes_first():
+    data = case(week, 1, 1)
+
+    async def run():
+        async with JobQueue(solver, processes=1) as queue:
+            planning = [queue.submit(data, 'planning') for _ in range(2)]
+            # Queued behind the running planning job, but before the second one
+            operational = queue.submit(data, 'operational')
+            assert queue.stats()['lanes']['planning'] == {'queued': 1, 'running': 1, 'limit': 1}
+            for job_id in planning + [operational]:
+                await queue.result(job_id)
+            return [queue.status(job_id)['started'] for job_id in planning + [operational]]
+
+    first, second, operational = asyncio.run(run())
+    assert first < operational < second
+
+
+def test_unknown_lane():
+    async def run():
+        async with JobQueue(solver, processes=1) as queue:
+            queue.submit({}, 'research')
+
+    with pytest.raises(ValueError, match='Unknown lane'):
+        asyncio.run(run())
+
+
+def test_http_server():
+    data = case(week, 2, 1)
+
+    async def request(port, method, path, body=None):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        content = json.dumps(body).encode() if body is not None else b''
+        writer.write(('%s %s HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n'
+                      % (method, path, len(content))).encode() + content)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, payload = response.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(payload)
+
+    async def run():
+        async with JobQueue(solver, processes=1) as queue:
+            server = await serve(queue, port=0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                code, submitted = await request(port, 'POST', '/jobs', {'data': data, 'lane': 'operational'})
+                assert code == 202
+                code, status = await request(port, 'GET', '/jobs/%s/result' % submitted['id'])
+                assert code == 200
+
+                assert (await request(port, 'POST', '/jobs', {'data': data, 'lane': 'research'}))[0] == 400
+                assert (await request(port, 'GET', '/jobs/unknown'))[0] == 404
+                code, stats = await request(port, 'GET', '/status')
+                assert stats['done'] == 1
+                return status
+
+    status = asyncio.run(run())
+    assert status['state'] == 'done'
+    assert status['results']['cost_total'] == pytest.approx(solve_scenario(data, solver)['cost_total'], rel=1e-6)
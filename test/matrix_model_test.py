@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.matrix_model import matrix_model, matrix_model_results, solve_matrix_model
+from test.cases import case, df
+
+
+solver = {'name': 'glpk'}
+
+
+@pytest.mark.parametrize('example', [1, 2, 3])
+@pytest.mark.parametrize('scenario', [0, 1])
+def test_matrix_model_objective(example, scenario):
+    model_data = model_input(case(df, example, scenario))
+
+    results = model_results(solve_model(model(model_data), solver))
+    matrix_results = matrix_model_results(solve_matrix_model(matrix_model(model_data), {'name': 'highs'}))
+
+    assert matrix_results['cost_total'] == pytest.approx(results['cost_total'], rel=1e-6)
+    assert matrix_results['cost_grid_power_fixed'] == pytest.approx(results['cost_grid_power_fixed'])
+    assert np.sum(matrix_results['cost_grid_power_import']) == pytest.approx(np.sum(results['cost_grid_power_import']), rel=1e-6)
+    assert len(matrix_results['power_buy']) == len(results['power_buy'])
+
+
+def test_matrix_model_no_grid_charging():
+    data = case(df.iloc[:24*14], 2, 1)
+    data['battery_grid_charging'] = False
+    data['bel_fin_level'] = 0.5
+    model_data = model_input(data)
+
+    results = model_results(solve_model(model(model_data), solver))
+    matrix_results = matrix_model_results(solve_matrix_model(matrix_model(model_data), {'name': 'highs'}))
+
+    assert matrix_results['cost_total'] == pytest.approx(results['cost_total'], rel=1e-6)
+    assert matrix_results['battery_soc'][-1] == pytest.approx(2.5)
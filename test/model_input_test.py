@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from test.cases import case, df
+
+
+solver = {'name': 'glpk'}
+
+week = df.iloc[:24*7]
+
+
+def test_model_input_arrays():
+    data = case(week, 2, 1)
+    arrays = {name: np.asarray(v, dtype=float) if isinstance(v, list) else v for name, v in data.items()}
+
+    model_data = model_input(arrays)
+
+    # Float64 series are used as they are, without copies
+    assert model_data[None]['demand'] is arrays['demand']
+    assert model_data[None]['month_order'].dtype == np.int64
+    assert model_results(solve_model(model(model_data), solver))['cost_total'] == \
+        pytest.approx(model_results(solve_model(model(model_input(data)), solver))['cost_total'])
+
+
+def test_model_input_dataframe():
+    data = case(week, 2, 1)
+    series = week[[]].assign(**{name: v for name, v in data.items() if isinstance(v, list)})
+    parameters = {name: v for name, v in data.items() if not isinstance(v, list)}
+
+    model_data = model_input(series, parameters)
+
+    assert np.array_equal(model_data[None]['heat_demand'], week['Heat'].to_numpy())
+    assert model_data[None]['battery_capacity'] == 5.0
+
+
+def test_model_input_validation():
+    data = case(week, 2, 1)
+
+    with pytest.raises(ValueError):
+        model_input(dict(data, demand=data['demand'][:-1]))
+
+    with pytest.raises(ValueError):
+        model_input(dict(data, demand=[np.nan]*len(week)))
+
+    with pytest.raises(ValueError):
+        model_input(dict(data, month_order=[1.5]*len(week)))
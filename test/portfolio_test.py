@@ -0,0 +1,100 @@
+import pytest
+import enerthon.enerthon_model
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.portfolio import SolverHistory, instance_size, race
+from enerthon.profiling import model_size, profile
+from test.cases import case, df
+
+
+week = df.iloc[:24*7]
+
+pytestmark = pytest.mark.skipif(not enerthon.enerthon_model._highs_available(), reason='highspy is not available')
+
+solvers = [{'name': 'highs'}, {'name': 'appsi_highs'}]
+
+
+def test_instance_size():
+    for compact in [False, True]:
+        model_instance = model(model_input(case(week, 3, 1)), compact=compact)
+        size = instance_size(model_instance)
+        exact = model_size(model_instance)
+
+        assert size['rows'] == exact['rows']
+        assert size['columns'] == exact['columns']
+        assert size['nonzeros'] == pytest.approx(exact['nonzeros'], rel=0.01)
+
+
+def test_race_loads_the_first_optimal_solution():
+    data = case(week, 2, 1)
+    reference = solve_model(model(model_input(data)), {'name': 'highs'})
+
+    model_instance = model(model_input(data))
+    winner, outcomes = race(model_instance, solvers + [{'name': 'no_such_solver'}])
+
+    assert outcomes[winner]['status'] == 'optimal'
+    assert outcomes[2]['status'].startswith('error') or outcomes[2]['killed']
+    assert model_instance.total_cost() == pytest.approx(reference.total_cost(), rel=1e-6)
+    assert model_results(model_instance)['power_buy'] == pytest.approx(model_results(reference)['power_buy'], abs=1e-6)
+
+
+def test_portfolio_races_then_chooses(tmp_path):
+    history = str(tmp_path/'solvers.jsonl')
+    solver = {'name': 'portfolio', 'solvers': solvers + [{'name': 'no_such_solver'}], 'history': history}
+    data = case(week, 3, 1)
+
+    first = solve_model(model(model_input(data)), solver)
+    assert first.solve_info['portfolio'] == 'race'
+    assert first.solve_info['status'] == 'optimal'
+    assert first.solve_info['solver'] in ('highs', 'appsi_highs')
+    # Both available solvers finished or were killed, the unavailable one never ran
+    assert sorted(o['solver'] for o in SolverHistory(history).observations) == ['appsi_highs', 'highs']
+
+    second = solve_model(model(model_input(data)), solver)
+    assert second.solve_info['portfolio'] == 'chosen'
+    assert second.total_cost() == pytest.approx(first.total_cost(), rel=1e-6)
+    assert len(SolverHistory(history).observations) == 3
+
+
+def test_history_chooses_by_size_and_storage():
+    history = SolverHistory()
+    for nonzeros, fast, slow in [(1e4, 0.1, 0.5), (1e5, 1.0, 2.0), (1e6, 30.0, 15.0), (1e7, 400.0, 150.0)]:
+        history.add('glpk', {'rows': nonzeros/3, 'nonzeros': nonzeros}, True, fast)
+        history.add('cbc', {'rows': nonzeros/3, 'nonzeros': nonzeros}, True, slow)
+    history.add('glpk', {'rows': 1e6, 'nonzeros': 3e6}, False, 1.0)
+    history.add('cbc', {'rows': 1e6, 'nonzeros': 3e6}, False, 5.0)
+
+    glpk, cbc = {'name': 'glpk'}, {'name': 'cbc'}
+    assert history.choose([glpk, cbc], {'rows': 1e4, 'nonzeros': 3e4}, True) == glpk
+    assert history.choose([glpk, cbc], {'rows': 3e6, 'nonzeros': 1e7}, True) == cbc
+    assert history.choose([glpk, cbc], {'rows': 3e6, 'nonzeros': 1e7}, False) == glpk
+    # A solver without observations is raced first
+    assert history.choose([glpk, cbc, {'name': 'highs'}], {'rows': 1e4, 'nonzeros': 3e4}, True) is None
+
+
+def test_history_does_not_choose_race_loser():
+    history = SolverHistory()
+    size = {'rows': 1e4, 'nonzeros': 3e4}
+    highs, glpk = {'name': 'highs'}, {'name': 'glpk'}
+    # glpk won the race, highs was killed when glpk finished: its time is only a lower bound
+    history.add('glpk', size, True, 1.0)
+    history.add('highs', size, True, 1.0, censored=True)
+    assert history.predict('highs', size, True) is None
+    assert history.choose([highs, glpk], size, True) == glpk
+
+    # Killed after less time than the other solver is predicted to take, highs might be faster and races again
+    history = SolverHistory()
+    history.add('glpk', size, True, 1.0)
+    history.add('highs', size, True, 0.2, censored=True)
+    assert history.choose([highs, glpk], size, True) is None
+
+
+def test_history_from_profile(tmp_path):
+    path = str(tmp_path/'profile.jsonl')
+    with profile(path, components=False):
+        solve_model(model(model_input(case(week, 1, 1))), {'name': 'highs'})
+
+    observations = SolverHistory(path).observations
+    assert len(observations) == 1
+    assert observations[0]['solver'] == 'highs'
+    assert observations[0]['storage'] is True
+    assert observations[0]['nonzeros'] > 0
@@ -0,0 +1,72 @@
+import json
+import pytest
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.matrix_model import matrix_model, matrix_model_results, solve_matrix_model
+from enerthon.profiling import phase, profile, record
+from test.cases import case, df
+
+
+solver = {'name': 'glpk'}
+
+week = df.iloc[:24*7]
+
+
+def test_profile(tmp_path):
+    path = tmp_path / 'profile.jsonl'
+    with profile(path) as report:
+        model_results(solve_model(model(model_input(case(week, 2, 1))), solver))
+
+    assert [r['phase'] for r in report.phases if r['depth'] == 1] == ['model_input', 'model', 'solve_model',
+                                                                      'model_results']
+    assert report['total']['wall'] >= report['model']['wall'] + report['solve_model']['wall']
+    assert all(r['cpu'] >= 0 and r['peak_memory'] >= 0 for r in report.phases)
+
+    # The file based solver writes the LP, runs and is read back in phases of their own
+    stages = ['write', 'solver', 'read']
+    assert [r['phase'] for r in report.phases if r['phase'] in stages] == stages
+    assert sum(report[name]['wall'] for name in stages) <= report['solve_model']['wall']
+
+    # Construction time of every constraint block
+    components = {c['name']: c for c in report['model']['components']}
+    assert components['energy_cost']['type'] == 'Constraint'
+    assert components['energy_cost']['size'] == len(week)
+
+    info = report['solve_model']['info']
+    assert info['status'] == 'optimal'
+    assert info['rows'] > len(week) and info['columns'] > len(week) and info['nonzeros'] > info['rows']
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line['phase'] for line in lines] == [r['phase'] for r in report.phases]
+
+
+def test_profile_matrix_model():
+    with profile(memory='tracemalloc', components=False) as report:
+        matrix = matrix_model(model_input(case(week, 3, 1)))
+        matrix_model_results(solve_matrix_model(matrix, {'name': 'highs'}))
+
+    assert report['matrix_model']['peak_memory'] > 0
+    assert report['solve_matrix_model']['info']['columns'] == len(matrix['c'])
+    assert report.total('model_results') > 0
+
+
+def test_rss_peak():
+    # The process high water mark is read, never reset: a new allocation raises it within its phase
+    import numpy as np
+    from enerthon.profiling import _rss
+
+    with profile(components=False) as report:
+        with phase('small'):
+            pass
+        with phase('large'):
+            current, peak = _rss()
+            np.ones((peak - current + 400_000_000)//8).sum()
+
+    assert report['large']['peak_memory'] > 3e8
+    assert report['small']['peak_memory'] < 3e8
+    assert report['total']['peak_memory'] >= report['large']['peak_memory']
+
+
+def test_disabled():
+    with phase('model') as p:
+        record(rows=1)
+    assert p is None
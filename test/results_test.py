@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from pyomo.environ import value
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.results import Results
+from test.cases import case, df
+
+
+solver = {'name': 'glpk'}
+
+week = df.iloc[:24*7]
+
+
+def test_results():
+    solution = solve_model(model(model_input(case(week, 2, 1))), solver)
+    results = Results.from_model(solution)
+
+    assert len(results) == len(week)
+    assert results['power_buy'].tolist() == value(solution.P_BUY[:])
+    assert results['cost_grid_power_import'].tolist() == value(solution.COST_GRID_POWER_IMPORT_MAX[:])
+    assert results.cost_total == solution.total_cost()
+    assert results.to_dict() == model_results(solution)
+
+    # Columns are shared with pandas without copying
+    frame = results.to_pandas()
+    assert np.shares_memory(frame['battery_soc'].to_numpy(), results['battery_soc'])
+    assert list(frame.columns) == results.columns
+
+
+def test_results_parquet(tmp_path):
+    pytest.importorskip('pyarrow')
+
+    results = Results.from_model(solve_model(model(model_input(case(week, 2, 1))), solver))
+    results.to_parquet(tmp_path / 'results.parquet')
+    loaded = Results.from_parquet(tmp_path / 'results.parquet')
+
+    assert loaded.to_dict() == results.to_dict()
+    assert np.array_equal(loaded.periods, results.periods)
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_results_from_primal_vector(compact):
+    pytest.importorskip('highspy')
+    data = dict(case(week, 2, 1), bel_fin_level=0.5)
+    solution = solve_model(model(model_input(data), compact=compact), {'name': 'highs'})
+
+    # The HiGHS solve keeps its primal vector, with the same values as the variables
+    assert len(solution._primal['x']) == len(solution._primal['columns'])
+    results = Results.from_model(solution).to_dict()
+    solution._primal = None
+    from_variables = Results.from_model(solution).to_dict()
+    assert results['cost_total'] == pytest.approx(from_variables.pop('cost_total'), rel=1e-9)
+    assert {name: v for name, v in results.items() if name != 'cost_total'} == from_variables
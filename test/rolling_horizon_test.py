@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.rolling_horizon import rolling_horizon
+from test.cases import case, df
+
+
+solver = {'name': 'glpk'}
+
+# Two weeks across the January/February boundary
+weeks = df.loc['2019-01-25':'2019-02-07']
+
+
+def test_rolling_horizon_single_window():
+    data = case(weeks, 2, 1)
+
+    results = rolling_horizon(data, solver, window=len(weeks), commit=len(weeks))
+    monolithic_results = model_results(solve_model(model(model_input(data)), solver))
+
+    assert results['windows'] == 1
+    assert results['cost_total'] == pytest.approx(monolithic_results['cost_total'], rel=1e-6)
+
+
+def test_rolling_horizon_carry_over():
+    data = case(weeks, 2, 1)
+    data['bel_fin_level'] = 0.5
+
+    results = rolling_horizon(data, solver, window=48, commit=24)
+    monolithic_results = model_results(solve_model(model(model_input(data)), solver))
+
+    assert results['windows'] == 13
+    assert results['skeletons'] <= 3
+    assert len(results['power_buy']) == len(weeks)
+    assert results['cost_total'] >= monolithic_results['cost_total'] - 1e-6
+    assert results['battery_soc'][-1] == pytest.approx(2.5)
+
+    # Storage levels are continuous across the windows
+    soc = np.array(results['battery_soc'])
+    charge = np.array(results['battery_charge'])*0.9 - np.array(results['battery_discharge'])/0.9
+    assert np.diff(soc) == pytest.approx(charge[1:], abs=1e-6)
+
+    # Monthly power cost is the realised peak over the committed periods
+    fees = np.array(data['grid_power_import_fee'])
+    net = np.array(results['power_buy']) - np.array(results['power_sell'])
+    for month, cost in zip([1, 2], results['cost_grid_power_import']):
+        mask = weeks.index.month == month
+        assert cost == pytest.approx(max(0.0, np.max(fees[mask]*net[mask])), abs=1e-6)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import enerthon.enerthon_model
+from pyomo.environ import SolverFactory
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.scaling import block_scaling, compile_model, conditioning_report, format_report, scale_model, unscale
+from test.cases import case, df
+
+
+week = df.iloc[:24*7]
+
+pytestmark = pytest.mark.skipif(not enerthon.enerthon_model._highs_available(), reason='highspy is not available')
+
+
+def test_block_scaling():
+    from scipy.sparse import csr_array
+    # Two row blocks and two column blocks, the second column block a thousand times larger
+    A = csr_array(np.array([[1.0, 1000.0], [2.0, 4000.0], [0.5, 500.0]]))
+    row_factors, column_factors = block_scaling(A, np.array([0, 0, 1]), np.array([0, 1]))
+
+    scaled = A.toarray()*row_factors[[0, 0, 1]][:, None]*column_factors[[0, 1]][None, :]
+    assert scaled.max()/scaled.min() <= 8
+    # Powers of two
+    assert np.all(np.log2(row_factors) == np.round(np.log2(row_factors)))
+    assert np.all(np.log2(column_factors) == np.round(np.log2(column_factors)))
+
+
+def test_conditioning_report():
+    model_instance = model(model_input(case(week, 1, 1)))
+    report = conditioning_report(model_instance, worst=5)
+
+    assert report['matrix']['scaled_ratio'] < report['matrix']['ratio']
+    assert len(report['rows']) == 5
+    assert [s['ratio'] for s in report['rows']] == sorted([s['ratio'] for s in report['rows']], reverse=True)
+    # Prices and fees multiply the power in the cost rows
+    assert report['rows'][0]['block'] in ('energy_cost', 'grid_energy_import_cost')
+    assert report['matrix']['nonzeros'] == compile_model(model_instance).A.nnz
+    assert 'grid_energy_import_cost' in format_report(report)
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_scaled_solve_matches(compact):
+    data = case(week, 2, 1)
+    reference = model_results(solve_model(model(model_input(data), compact=compact), {'name': 'highs'}))
+
+    solution = solve_model(model(model_input(data), compact=compact), {'name': 'highs', 'scaling': True})
+    assert solution.solve_info['scaling']
+    results = model_results(solution)
+    assert results['cost_total'] == pytest.approx(reference['cost_total'], rel=1e-8)
+    assert results['battery_soc'] == pytest.approx(reference['battery_soc'], abs=1e-6)
+
+
+def test_scale_model_for_other_solvers():
+    data = case(week, 3, 1)
+    reference = solve_model(model(model_input(data)), {'name': 'highs'})
+
+    model_instance = model(model_input(data))
+    scaled = scale_model(model_instance)
+    assert model_instance.component('scaling_factor') is None
+    SolverFactory('appsi_highs').solve(scaled)
+    unscale(scaled, model_instance)
+
+    assert model_instance.total_cost() == pytest.approx(reference.total_cost(), rel=1e-8)
+    assert model_results(model_instance)['cost_total'] == pytest.approx(reference.total_cost(), rel=1e-8)
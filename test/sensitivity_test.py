@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+import enerthon.enerthon_model
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.sensitivity import shadow_prices
+from test.cases import case, df
+
+
+week = df.iloc[24*30:24*37]
+
+pytestmark = pytest.mark.skipif(not enerthon.enerthon_model._highs_available(), reason='highspy is not available')
+
+solver = {'name': 'highs'}
+duals = {'name': 'highs', 'duals': True}
+
+
+def week_case():
+    # Small thermal storage and fixed final levels, so that every term of the capacity values counts
+    return dict(case(week, 2, 1), tes_capacity=10.0, bel_fin_level=0.5, tes_fin_level=0.5)
+
+
+def cost(data):
+    return model_results(solve_model(model(model_input(data)), solver))['cost_total']
+
+
+def assert_between_derivatives(data, name, shadow_price, step=1e-3, select=None):
+    # The cost is convex in these data, so the shadow price lies between the derivatives from the left and right
+    base = np.asarray(data[name], dtype=float)
+    change = step if select is None else step*select
+
+    c = cost(data)
+    left = (c - cost(dict(data, **{name: base - change})))/step
+    right = (cost(dict(data, **{name: base + change})) - c)/step
+    assert left - 1e-4 <= shadow_price <= right + 1e-4
+
+
+def test_shadow_prices_match_finite_differences():
+    data = week_case()
+    results = model_results(solve_model(model(model_input(data)), duals))
+
+    n = len(week)
+    for t in [0, 12, 40, n-1]:
+        assert_between_derivatives(data, 'demand', results['marginal_electricity_value'][t], select=np.eye(n)[t])
+        assert_between_derivatives(data, 'heat_demand', results['marginal_heat_value'][t], select=np.eye(n)[t])
+
+    assert_between_derivatives(data, 'battery_capacity', -results['marginal_battery_capacity_value'])
+    assert_between_derivatives(data, 'tes_capacity', -results['marginal_tes_capacity_value'])
+    assert results['marginal_tes_capacity_value'] > 0
+    assert np.sum(results['tes_capacity_value']) == pytest.approx(results['marginal_tes_capacity_value'])
+
+    months = np.asarray(data['month_order'])
+    for i, m in enumerate(np.unique(months)):
+        assert_between_derivatives(data, 'grid_power_import_fee', results['grid_power_import_fee_shadow_price'][i],
+                                   select=(months == m).astype(float))
+
+
+def test_shadow_prices_of_every_solve_path():
+    data = week_case()
+    reference = shadow_prices(solve_model(model(model_input(data)), duals))
+
+    solves = [(model(model_input(data)), dict(duals, scaling=True)),
+              (model(model_input(data), compact=True), duals)]
+    if enerthon.enerthon_model._appsi_highs() is not None:
+        solves.append((model(model_input(data)), {'name': 'appsi_highs', 'duals': True}))
+
+    for model_instance, s in solves:
+        prices = shadow_prices(solve_model(model_instance, s))
+        for name in ['marginal_battery_capacity_value', 'marginal_tes_capacity_value']:
+            assert prices[name] == pytest.approx(reference[name], rel=1e-5, abs=1e-6)
+        assert prices['grid_power_import_fee_shadow_price'] == \
+            pytest.approx(reference['grid_power_import_fee_shadow_price'], rel=1e-5, abs=1e-6)
+        assert prices['marginal_electricity_value'] == \
+            pytest.approx(reference['marginal_electricity_value'], rel=1e-4, abs=1e-6)
+
+
+def test_without_duals():
+    model_instance = solve_model(model(model_input(week_case())), duals)
+    assert 'marginal_electricity_value' in model_results(model_instance)
+
+    # A solve without duals does not keep those of the previous solve
+    solve_model(model_instance, solver)
+    assert 'marginal_electricity_value' not in model_results(model_instance)
+    with pytest.raises(RuntimeError, match='duals'):
+        shadow_prices(model_instance)
+
+    # Sized capacities are decisions, without capacity values
+    sized = solve_model(model(model_input(week_case()), sizing=['battery']), duals)
+    prices = shadow_prices(sized)
+    assert 'battery_capacity_value' not in prices
+    assert 'tes_capacity_value' in prices
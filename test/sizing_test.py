@@ -0,0 +1,67 @@
+import pytest
+from enerthon.enerthon_model import model, model_input, model_results, solve_model, update_model
+from enerthon.sizing import annuity, size_capacities, sizing_check
+from test.cases import case, df
+
+
+# Falls back to glpk where HiGHS is not available
+solver = {'name': 'highs'}
+
+week = df.iloc[:24*7]
+
+
+def sizing_case():
+    data = case(week, 2, 1)
+    data.update({'battery_investment_cost': annuity(300, 10, 0.05),
+                 'tes_investment_cost': annuity(20, 20, 0.05),
+                 'heat_pump_investment_cost': annuity(500, 15, 0.05),
+                 'battery_capacity_max': 10,
+                 'tes_capacity_max': 200})
+    return data
+
+
+def test_annuity():
+    assert annuity(100, 10, 0) == 10
+    assert annuity(100, 10, 0.05) == pytest.approx(12.95, abs=0.01)
+
+
+def test_size_capacities():
+    data = sizing_case()
+    results = size_capacities(data, solver)
+
+    assert 0 <= results['battery_capacity'] <= 10
+    assert 0 <= results['tes_capacity'] <= 200
+    assert results['heat_pump_capacity'] > 0
+
+    # The dispatch at the sized capacities costs the same without the investment
+    fixed = dict(data, battery_capacity=results['battery_capacity'], tes_capacity=results['tes_capacity'],
+                 heat_pump_capacity=results['heat_pump_capacity'])
+    fixed_results = model_results(solve_model(model(model_input(fixed)), solver))
+    assert fixed_results['cost_total'] + results['cost_investment'] == pytest.approx(results['cost_total'], rel=1e-6)
+
+
+def test_sizing_check():
+    data = sizing_case()
+    results = size_capacities(data, solver, sizing=['battery', 'tes'])
+    check = sizing_check(data, solver, {'battery_capacity': [0.0, 2.5, 5.0, 10.0], 'tes_capacity': [0.0, 50.0, 200.0]},
+                         results, processes=2)
+
+    assert check['capacities'] == {'battery_capacity': results['battery_capacity'],
+                                   'tes_capacity': results['tes_capacity']}
+    assert check['gap'] >= -1e-6
+    assert check['sweep_cost_total'] == pytest.approx(check['cost_total'], rel=0.05)
+
+
+def test_update_sized_model():
+    model_instance = model(model_input(sizing_case()), mutable=True, sizing=['battery'])
+    cheap = model_results(solve_model(model_instance, solver))
+
+    update_model(model_instance, {'battery_investment_cost': 1e3, 'bel_fin_level': 0.5})
+    expensive = model_results(solve_model(model_instance, solver))
+
+    assert expensive['battery_capacity'] < cheap['battery_capacity'] or cheap['battery_capacity'] == 0
+    assert expensive['battery_soc'][-1] == pytest.approx(0.5*expensive['battery_capacity'], abs=1e-6)
+    assert 'tes_capacity' not in expensive
+
+    with pytest.raises(ValueError):
+        model(model_input(sizing_case()), sizing=['boiler'])
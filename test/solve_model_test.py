@@ -0,0 +1,51 @@
+import pytest
+from pyomo.environ import value
+import enerthon.enerthon_model
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from test.cases import case, df
+
+
+solver = {'name': 'glpk'}
+
+week = df.iloc[:24*7]
+
+highs = pytest.mark.skipif(not enerthon.enerthon_model._highs_available(), reason='highspy is not available')
+
+
+@highs
+def test_in_memory_solve(capfd):
+    data = case(week, 2, 1)
+    solution = solve_model(model(model_input(data)), {'name': 'highs'})
+
+    # Quiet by default
+    assert capfd.readouterr().out == ''
+    assert solution.solve_info['solver'] == 'highs'
+    assert solution.solve_info['status'] == 'optimal'
+    assert solution.solve_info['iterations'] > 0
+    assert solution.solve_info['time_solve'] >= solution.solve_info['time_solver'] > 0
+
+    reference = solve_model(model(model_input(data)), solver)
+    assert reference.solve_info['status'] == 'optimal'
+    results = model_results(solution)
+    reference_results = model_results(reference)
+    assert results['cost_total'] == pytest.approx(reference_results['cost_total'], rel=1e-6)
+    assert results['cost_grid_power_import'] == pytest.approx(reference_results['cost_grid_power_import'], rel=1e-5)
+
+
+@highs
+def test_in_memory_infeasible():
+    # No heat pump nor boiler to cover the heat demand
+    solution = solve_model(model(model_input(dict(case(week, 1, 0), boiler_capacity=0))), {'name': 'highs'})
+
+    assert solution.solve_info['status'] == 'infeasible'
+    assert value(solution.total_cost, exception=False) is None
+
+
+def test_fallback(monkeypatch):
+    monkeypatch.setattr(enerthon.enerthon_model, '_highs_available', lambda: False)
+    monkeypatch.setattr(enerthon.enerthon_model, 'FALLBACK_SOLVER', solver)
+
+    with pytest.warns(UserWarning):
+        solution = solve_model(model(model_input(case(week, 1, 0))), {'name': 'highs'})
+    assert solution.solve_info['solver'] == solver['name']
+    assert solution.solve_info['status'] == 'optimal'
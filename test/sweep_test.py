@@ -0,0 +1,46 @@
+import pytest
+from enerthon.sweep import scenarios, solve_scenario, sweep
+from test.cases import case, df, tariff
+
+
+solver = {'name': 'glpk'}
+
+week = df.iloc[:24*7]
+
+
+def test_scenarios():
+    grid = {'battery_capacity': [0, 5], 'tariff': [{'grid_fixed_fee': 14.5}, {'grid_fixed_fee': 25.5}]}
+
+    assert list(scenarios(grid)) == [
+        ({'battery_capacity': 0, 'tariff': 0}, {'battery_capacity': 0, 'grid_fixed_fee': 14.5}),
+        ({'battery_capacity': 0, 'tariff': 1}, {'battery_capacity': 0, 'grid_fixed_fee': 25.5}),
+        ({'battery_capacity': 5, 'tariff': 0}, {'battery_capacity': 5, 'grid_fixed_fee': 14.5}),
+        ({'battery_capacity': 5, 'tariff': 1}, {'battery_capacity': 5, 'grid_fixed_fee': 25.5}),
+    ]
+
+
+def test_sweep_matches_serial_solves():
+    data = case(week, 3, 1)
+
+    tariffs = []
+    for example in [1, 2]:
+        fixed_charge, fees = tariff(week, example)
+        tariffs.append(dict(grid_fixed_fee=fixed_charge, **{name: fees[name].to_numpy() for name in fees}))
+
+    grid = {'battery_capacity': [0.0, 5.0], 'tes_capacity': [0.0, 50.0], 'tariff': tariffs,
+            'heat_pump_capacity': [0.0, 25.0]}
+    records = list(sweep(data, grid, solver, processes=2))
+
+    assert len(records) == 16
+    for record in records:
+        scenario = dict(data)
+        scenario.update(record['scenario'])
+        scenario.update(tariffs[record['scenario']['tariff']])
+
+        # Without heat pump nor boiler the heat demand cannot be covered
+        if record['scenario']['heat_pump_capacity'] == 0:
+            assert record['results'] is None
+            assert 'infeasible' in record['error']
+        else:
+            assert record['error'] is None
+            assert record['results']['cost_total'] == pytest.approx(solve_scenario(scenario, solver)['cost_total'], rel=1e-6)
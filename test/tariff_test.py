@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+from enerthon.tariff import EXAMPLES, compile_tariff
+from test.cases import df
+
+
+def test_compile_matches_masks():
+    # Fees built with the masking loops of the example script
+    fees = pd.DataFrame(0.0, index=df.index, columns=['grid_power_import_fee', 'grid_energy_import_fee'])
+    for i in [1,2,3,11,12]:
+        fees.loc[(df.index.month == i), 'grid_power_import_fee'] = 12.6
+    for i in [4,5,6,7,8,9,10]:
+        for j in list(range(0,5)):
+            for k in list(range(9,19)):
+                fees.loc[(df.index.month == i) & (df.index.weekday == j) & (df.index.hour == k),
+                         'grid_power_import_fee'] = 7.5
+
+    fees['grid_energy_import_fee'] = 0.009
+    for i in [1,2,3,11,12]:
+        for j in list(range(0,5)):
+            for k in list(range(8,22)):
+                fees.loc[(df.index.month == i) & (df.index.weekday == j) & (df.index.hour == k),
+                         'grid_energy_import_fee'] = 0.058
+
+    power_based = compile_tariff(EXAMPLES[2], df.index)
+    time_based = compile_tariff(EXAMPLES[3], df.index)
+
+    assert power_based['grid_fixed_fee'] == 14.1
+    assert np.array_equal(power_based['grid_power_import_fee'], fees['grid_power_import_fee'].to_numpy())
+    assert np.array_equal(power_based['grid_energy_import_fee'], np.zeros(len(df)))
+    assert np.array_equal(time_based['grid_energy_import_fee'], fees['grid_energy_import_fee'].to_numpy())
+    assert 'energy_price_buy' not in time_based
+
+
+def test_holidays_and_cache():
+    index = pd.date_range('2019-12-23', periods=4*24*4, freq='15min', tz='Europe/Stockholm')
+    spec = {'grid_energy_import_fee': [{'value': 0.01}, {'value': 0.05, 'weekdays': range(0,5), 'hours': range(6,22)},
+                                       {'value': 0.01, 'holiday': True}],
+            'energy_price_buy': 0.08}
+
+    compiled = compile_tariff(spec, index, holidays=['2019-12-24', '2019-12-25'])
+    fee = pd.Series(compiled['grid_energy_import_fee'], index=index)
+    assert fee['2019-12-23 06:00':'2019-12-23 21:45'].eq(0.05).all()
+    assert fee['2019-12-23 22:00':'2019-12-23 23:45'].eq(0.01).all()
+    assert fee['2019-12-24':'2019-12-25'].eq(0.01).all()
+    assert fee['2019-12-26 12:00'] == 0.05
+    assert np.array_equal(compiled['energy_price_buy'], np.full(len(index), 0.08))
+
+    # Compiled arrays are shared read-only through the cache
+    again = compile_tariff(spec, index, holidays=['2019-12-24', '2019-12-25'])
+    assert again['grid_energy_import_fee'] is compiled['grid_energy_import_fee']
+    with pytest.raises(ValueError):
+        compiled['grid_energy_import_fee'][0] = 1
+
+    with pytest.raises(ValueError):
+        compile_tariff({'grid_energy_import_fee': [{'value': 1, 'month': [1]}]}, index)
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+import enerthon.enerthon_model
+from enerthon.closed_form import closed_form_results
+from enerthon.enerthon_model import model, model_input, model_results, solve_model
+from enerthon.matrix_model import matrix_model, matrix_model_results, solve_matrix_model
+from enerthon.time_grid import expand, grid_blocks, resample
+from test.cases import case, df
+
+
+solver = {'name': 'highs'}
+
+month = df.iloc[24*20:24*45]
+
+pytestmark = pytest.mark.skipif(not enerthon.enerthon_model._highs_available(), reason='highspy is not available')
+
+
+def test_grid_blocks():
+    data = case(month, 1, 1)
+    starts = grid_blocks(data, [(24, 1), (48, 2), (None, 6)])
+    n = len(month)
+
+    assert list(starts[:24]) == list(range(24))
+    durations = np.diff(np.append(starts, n))
+    assert np.all(durations[24:] <= 6)
+    # No block spans a month boundary or a change of the power fees
+    for name in ['month_order', 'grid_power_import_fee', 'grid_power_export_fee']:
+        v = np.asarray(data[name])
+        assert np.all(v == expand(v[starts], starts, n))
+    assert len(starts) < n/3
+
+
+def test_resample_keeps_energy():
+    data = case(month, 2, 1)
+    resampled = resample(data, [(48, 1), (None, 4)])
+
+    assert np.sum(resampled['dt']) == len(month)
+    for name in ['generation', 'demand', 'heat_demand']:
+        assert np.dot(resampled[name], resampled['dt']) == pytest.approx(np.sum(data[name]))
+    assert np.sum(np.asarray(resampled['energy_price_buy'])*resampled['dt']) == pytest.approx(np.sum(data['energy_price_buy']))
+    # Four hours of losses of 1 % in a four hour block
+    four = np.flatnonzero(resampled['dt'] == 4)[0]
+    assert resampled['tes_losses'][four] == pytest.approx(1 - 0.99**4)
+
+
+def test_coarse_grid_matches_fine_solve():
+    # With every series constant over pairs of hours, two hour blocks lose nothing
+    data = case(month, 1, 1)
+    data['tes_losses'] = 0.0
+    for name, v in data.items():
+        if np.ndim(v) > 0:
+            v = np.array(v)
+            v[1::2] = v[0::2]
+            data[name] = v
+    fine = model_results(solve_model(model(model_input(data)), solver))
+
+    resampled = resample(data, [(None, 2)])
+    assert len(resampled['dt']) < 0.6*len(month)
+    for compact in [False, True]:
+        coarse = model_results(solve_model(model(model_input(resampled), compact=compact), solver))
+        assert coarse['cost_total'] == pytest.approx(fine['cost_total'], rel=1e-6)
+        assert np.sum(coarse['cost_energy']) == pytest.approx(np.sum(fine['cost_energy']), rel=1e-6)
+        assert coarse['cost_grid_power_import'] == pytest.approx(fine['cost_grid_power_import'], rel=1e-6)
+
+
+def test_per_period_dt_in_every_formulation():
+    data = resample(case(month, 3, 1), [(72, 1), (None, 3)])
+    cost = solve_model(model(model_input(data)), solver).total_cost()
+
+    matrix = matrix_model(model_input(data))
+    assert matrix_model_results(solve_matrix_model(matrix, solver))['cost_total'] == pytest.approx(cost, rel=1e-6)
+
+    # Without storage the closed form applies
+    no_storage = dict(data, battery_capacity=0, tes_capacity=0)
+    closed_form = closed_form_results(model_input(no_storage))
+    assert closed_form is not None
+    lp = model_results(solve_model(model(model_input(no_storage)), solver))
+    assert closed_form['cost_total'] == pytest.approx(lp['cost_total'], rel=1e-6)
+
+
+def test_per_period_storage_balance():
+    data = dict(case(month.iloc[:4], 1, 1), dt=[0.25, 0.25, 0.5, 3.0], tes_losses=[0.0, 0.0, 0.1, 0.2],
+                battery_efficiency_charge=1.0, battery_efficiency_discharge=1.0)
+    results = model_results(solve_model(model(model_input(data)), solver))
+
+    level = 0.0
+    tes = 0.0
+    for t in range(4):
+        level += (results['battery_charge'][t] - results['battery_discharge'][t])*data['dt'][t]
+        tes = (1 - data['tes_losses'][t])*tes + (results['tes_charge'][t] - results['tes_discharge'][t])*data['dt'][t]
+        assert results['battery_soc'][t] == pytest.approx(level, abs=1e-6)
+        assert results['tes_soc'][t] == pytest.approx(tes, abs=1e-6)
+
+
+def test_invalid_dt():
+    data = case(month.iloc[:4], 1, 1)
+    with pytest.raises(ValueError, match='dt must be a series of 4 values'):
+        model_input(dict(data, dt=[1.0, 1.0]))
+    with pytest.raises(ValueError, match='dt must be positive'):
+        model_input(dict(data, dt=[1.0, 0.0, 1.0, 1.0]))
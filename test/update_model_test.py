@@ -0,0 +1,61 @@
+import pytest
+from pyomo.environ import SolverFactory
+from enerthon.enerthon_model import model, model_input, model_results, solve_model, update_model
+from test.cases import case, df, tariff
+
+
+solver = {'name': 'glpk'}
+
+week = df.iloc[:24*7*3]
+
+
+def test_update_model_matches_rebuild():
+    model_instance = model(model_input(case(week, 3, 1)), mutable=True)
+    solve_model(model_instance, solver)
+
+    # Switch to the power based tariff with a larger battery and no grid charging
+    fixed_charge, fees = tariff(week, 2)
+    update = {'grid_fixed_fee': fixed_charge,
+              'grid_energy_import_fee': fees['grid_energy_import_fee'].to_list(),
+              'grid_power_import_fee': fees['grid_power_import_fee'].to_list(),
+              'battery_capacity': 8.0,
+              'battery_grid_charging': False,
+              'bel_fin_level': 0.5}
+    results = model_results(solve_model(update_model(model_instance, update), solver))
+
+    data = case(week, 2, 1)
+    data.update(update)
+    rebuilt_results = model_results(solve_model(model(model_input(data)), solver))
+
+    assert results['cost_total'] == pytest.approx(rebuilt_results['cost_total'], rel=1e-6)
+    assert results['battery_soc'][-1] == pytest.approx(4.0)
+
+
+def test_update_model_requires_mutable():
+    model_instance = model(model_input(case(week, 1, 0)))
+
+    with pytest.raises(ValueError):
+        update_model(model_instance, {'fuel_price': 0.8})
+
+    with pytest.raises(ValueError):
+        update_model(model(model_input(case(week, 1, 0)), mutable=True), {'month_order': week['month_order'].to_list()})
+
+
+def test_update_model_persistent_solver():
+    if not SolverFactory('appsi_highs').available(exception_flag=False):
+        pytest.skip('appsi_highs is not available')
+
+    model_instance = model(model_input(case(week, 1, 1)), mutable=True)
+    persistent_solver = {'name': 'appsi_highs'}
+
+    costs = []
+    for price in [0.06, 0.08, 0.10]:
+        update_model(model_instance, {'energy_price_buy': [price]*len(week)})
+        costs.append(model_results(solve_model(model_instance, persistent_solver))['cost_total'])
+
+        data = case(week, 1, 1)
+        data['energy_price_buy'] = [price]*len(week)
+        rebuilt_results = model_results(solve_model(model(model_input(data)), solver))
+        assert costs[-1] == pytest.approx(rebuilt_results['cost_total'], rel=1e-6)
+
+    assert costs[0] < costs[1] < costs[2]
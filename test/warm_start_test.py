@@ -0,0 +1,109 @@
+from pyomo.environ import value
+import pytest
+import enerthon.enerthon_model
+from enerthon.enerthon_model import model, model_input, model_results, solve_model, update_model
+from enerthon.rolling_horizon import rolling_horizon
+from enerthon.sweep import sweep
+from test.cases import case, df
+
+
+solver = {'name': 'highs'}
+
+month = df.iloc[:24*31]
+
+pytestmark = pytest.mark.skipif(not enerthon.enerthon_model._highs_available(), reason='highspy is not available')
+
+
+def test_warm_start_from_instance():
+    data = case(month, 2, 1)
+    previous = solve_model(model(model_input(data)), solver)
+    assert previous.solve_info['warm_start'] is None
+    assert previous.solve_info['iterations_saved'] == 0
+
+    # A slightly larger battery
+    neighbour = dict(data, battery_capacity=5.5)
+    warm = solve_model(model(model_input(neighbour)), solver, warm_start=previous)
+    cold = solve_model(model(model_input(neighbour)), solver)
+
+    assert warm.solve_info['warm_start'] == 'basis'
+    assert warm.solve_info['iterations'] < cold.solve_info['iterations']
+    assert warm.solve_info['iterations_saved'] == previous.solve_info['iterations'] - warm.solve_info['iterations']
+    assert warm.total_cost() == pytest.approx(cold.total_cost(), rel=1e-8)
+
+
+def test_warm_start_from_results():
+    data = case(month, 3, 1)
+    results = model_results(solve_model(model(model_input(data)), solver))
+
+    neighbour = dict(data, energy_price_buy=[0.085]*len(month))
+    warm = solve_model(model(model_input(neighbour), compact=True), solver, warm_start=results)
+    cold = solve_model(model(model_input(neighbour), compact=True), solver)
+
+    assert warm.solve_info['warm_start'] == 'solution'
+    assert warm.solve_info['iterations_saved'] is None
+    assert model_results(warm)['cost_total'] == pytest.approx(model_results(cold)['cost_total'], rel=1e-8)
+
+
+def test_warm_start_resolve():
+    model_instance = model(model_input(case(month, 1, 1)), mutable=True)
+    solve_model(model_instance, solver, warm_start=True)
+    assert model_instance.solve_info['warm_start'] is None
+
+    update_model(model_instance, {'battery_capacity': 6.0})
+    solve_model(model_instance, solver, warm_start=True)
+    assert model_instance.solve_info['warm_start'] == 'basis'
+
+    rebuilt = solve_model(model(model_input(dict(case(month, 1, 1), battery_capacity=6.0))), solver)
+    assert model_instance.total_cost() == pytest.approx(rebuilt.total_cost(), rel=1e-8)
+
+
+def test_rolling_horizon_warm_start():
+    data = case(month, 2, 1)
+    results = rolling_horizon(data, solver, window=72, commit=24)
+    warm_results = rolling_horizon(data, solver, window=72, commit=24, warm_start=True)
+
+    assert warm_results['cost_total'] == pytest.approx(results['cost_total'], rel=1e-6)
+
+
+def test_chained_sweep():
+    data = case(df.iloc[:24*7], 2, 1)
+    grid = {'tes_capacity': [0.0, 50.0], 'battery_capacity': [4.0, 4.5, 5.0, 5.5]}
+
+    records = {tuple(r['scenario'].items()): r for r in sweep(data, grid, solver, processes=2)}
+    chained = {tuple(r['scenario'].items()): r for r in sweep(data, grid, solver, processes=2,
+                                                              chain='battery_capacity')}
+
+    assert set(chained) == set(records)
+    for key, record in chained.items():
+        assert record['error'] is None
+        assert record['results']['cost_total'] == pytest.approx(records[key]['results']['cost_total'], rel=1e-8)
+
+        # The first scenario of every chain is solved cold
+        first = dict(key)['battery_capacity'] == 4.0
+        assert record['solve_info']['warm_start'] == (None if first else 'basis')
+    assert sum(r['solve_info']['iterations_saved'] for r in chained.values()) > 0
+
+
+def test_infeasible_scenario_in_chain():
+    data = dict(case(df.iloc[:24*7], 2, 1), tes_capacity=0.0)
+    previous = solve_model(model(model_input(data)), solver)
+
+    # Too small a heat pump without boiler nor thermal storage, the warm start values are no solution
+    infeasible = dict(data, heat_pump_capacity=0.01)
+    solution = solve_model(model(model_input(infeasible)), solver, warm_start=previous)
+    assert solution.solve_info['status'] == 'infeasible'
+    assert solution.solve_info['iterations_saved'] is None
+    assert value(solution.total_cost, exception=False) is None
+    with pytest.raises(ValueError):
+        model_results(solution)
+
+    grid = {'heat_pump_capacity': [25, 0.01, 20]}
+    records = list(sweep(data, grid, solver, processes=1, chain='heat_pump_capacity'))
+    records.sort(key=lambda r: grid['heat_pump_capacity'].index(r['scenario']['heat_pump_capacity']))
+    assert [r['error'] is None for r in records] == [True, False, True]
+    assert 'infeasible' in records[1]['error']
+    # The scenario after the infeasible one warm starts from the last solved one
+    assert records[2]['solve_info']['warm_start'] == 'basis'
+    assert records[2]['results']['cost_total'] == pytest.approx(
+        model_results(solve_model(model(model_input(dict(data, heat_pump_capacity=20))), solver))['cost_total'],
+        rel=1e-8)